@@ -1,7 +1,14 @@
+import base64
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import gzip
+import hashlib
 import logging
 import json
 import os
+import time
 import boto3
+from botocore.exceptions import ClientError
 from json_logger import setup_logging
 
 setup_logging(logging.INFO)
@@ -10,59 +17,713 @@ logger = logging.getLogger()
 s3 = boto3.client('s3')
 BUCKET_NAME = os.environ["BUCKET_NAME"]
 KEY_NAME = os.environ["KEY_NAME"]
+METRICS_KEY_NAME = os.environ.get("METRICS_KEY_NAME", "production/acg-covid-metrics.csv")
+PARQUET_KEY_NAME = os.environ.get("PARQUET_KEY_NAME", "production/acg-covid-data.parquet")
+DATA_FORMAT = os.environ.get("DATA_FORMAT", "csv")
+PAYLOAD_KEY_NAME = os.environ.get("PAYLOAD_KEY_NAME", "production/acg-covid-data.json")
+METRICS_PAYLOAD_KEY_NAME = os.environ.get("METRICS_PAYLOAD_KEY_NAME", "production/acg-covid-metrics.json")
+USE_PAYLOAD = os.environ.get("USE_PAYLOAD", "true").lower() == "true"
+RESPONSE_CACHE_SECONDS = float(os.environ.get("RESPONSE_CACHE_SECONDS", "300"))
 
+# Daily ETL run, "HH:MM" UTC, matching the CWSchedule of the PythonEtlFunction.  Responses may be cached by clients until the
+# next run has had ETL_RUN_SECONDS to finish
+ETL_SCHEDULE_UTC = os.environ.get("ETL_SCHEDULE_UTC", "21:00")
+ETL_RUN_SECONDS = int(os.environ.get("ETL_RUN_SECONDS", "600"))
 
-def get_covid_data():
+# Fields of the daily data set, the Parquet copy also holds the fingerprint field used by the ETL process
+DATA_COLUMNS = ["date", "cases", "deaths", "recoveries", "date-diff", "month", "day_of_week",
+                "cases-diff", "cases-log", "deaths-diff", "deaths-log", "recoveries-diff", "recoveries-log"]
+
+# Fields of the metrics data set, see python_etl.metrics.metric_columns
+METRICS_COLUMNS = ["date"] + [
+    f"{col}-{metric}" for col in ["cases", "deaths", "recoveries"]
+    for metric in ["diff-avg7", "diff-avg14", "growth-wow", "doubling-days"]
+]
+
+DATASET_COLUMNS = {
+    "daily": DATA_COLUMNS,
+    "metrics": METRICS_COLUMNS,
+}
+
+QUERY_PARAMETERS = {"start", "end", "fields", "last_n"}
+MAX_LAST_N = 3660
+
+DATASET_KEYS = {
+    "daily": KEY_NAME,
+    "metrics": METRICS_KEY_NAME,
+}
+
+# Finished, gzip compressed responses written by the ETL load step next to each data set
+PAYLOAD_KEYS = {
+    "daily": PAYLOAD_KEY_NAME,
+    "metrics": METRICS_PAYLOAD_KEY_NAME,
+}
+
+# Responses of this container by data set, kept between invocations while the container is warm, see get_response
+RESPONSE_CACHE = {}
+CACHE_STATS = {"requests": 0, "hits": 0, "revalidations": 0, "revalidation_ms": 0.0}
+
+
+def get_covid_data(key=KEY_NAME, data_format="csv", compression="NONE", fields=None, conditions=()):
     """
     Parameters
     ----------
-    None
-        We can include parameters in a future enhancement and include them in the WHERE clause of the SQL query
+    key: str, Key of the file to query, the daily data set by default
+
+    data_format: str in {'csv', 'parquet'}, format of the file.  Parquet files are read column by column, so only the
+        data set fields are read
+
+    compression: str in {'NONE', 'GZIP'}, whole object compression of a csv file, see get_compression_type
+
+    fields: List or None, fields to return, all fields of the data set if None
+
+    conditions: tuple, (field, operator, value) predicates of the WHERE clause, see select_expression
     Returns
     ------
-    records: list, list of record (row) objects
+    records: list, list of record (row) objects.  Every field is text as it appears in the csv file, whatever the format,
+        see csv_text_record
     """
 
+    if fields is None and data_format == "parquet":
+        fields = DATA_COLUMNS
+
+    expression = select_expression(fields, conditions)
+
+    if data_format == "parquet":
+        input_serialization = {"Parquet": {}}
+    else:
+        input_serialization = {"CSV": {"FileHeaderInfo": "Use"}, "CompressionType": compression}
+
     res = s3.select_object_content(
         Bucket=BUCKET_NAME,
-        Key=KEY_NAME,
+        Key=key,
         ExpressionType="SQL",
-        Expression=f"""
-            select * from s3object s
-        """,
-        InputSerialization={"CSV": {"FileHeaderInfo": "Use"}},
+        Expression=expression,
+        InputSerialization=input_serialization,
         OutputSerialization={"JSON": {}},
     )
 
-    records = ''
-    for event in res["Payload"]:
+    records = iter_select_records(res["Payload"])
+
+    if data_format == "parquet":
+        return [csv_text_record(record, fields) for record in records]
+
+    return list(records)
+
+
+def csv_text_record(record, fields):
+    """
+    Parameters
+    ----------
+    record: dict, record of a Parquet file with its stored types, fields without a value may be left out
+
+    fields: List, fields of the projection in order
+
+    Returns
+    ------
+    record: dict, the record with every field as the text the ETL process writes to the csv file, e.g. 5 -> "5",
+        0.693... -> "0.693...", missing -> "".  The csv file, the precomputed payload and the Parquet copy then all return
+        the same types
+    """
+
+    return {field: csv_text(record.get(field)) for field in fields}
+
+
+def csv_text(value):
+    """
+    Parameters
+    ----------
+    value: str, int, float or None, field value of a Parquet record
+
+    Returns
+    ------
+    text: str, value formatted like pandas' to_csv, shortest round trip text for floats and empty for missing values
+    """
+
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+
+    return str(value)
+
+
+def iter_select_records(payload):
+    """
+    Parameters
+    ----------
+    payload: iterable, event stream of a select_object_content response with JSON output
+
+    Returns
+    ------
+    records: generator, record (row) objects in stream order, each parsed as soon as the chunk completing it arrives
+
+    A record can be split across Records events, only the incomplete tail of the last chunk is kept until the next one.
+    Splitting the raw bytes on newlines is safe for UTF-8, a newline byte never occurs inside a multi-byte character.
+    Raises IOError if the stream ends without an End event, or if the bytes received differ from the BytesReturned of
+    the Stats event, i.e. the response was truncated
+    """
+
+    tail = b""
+    received_bytes = 0
+    stats = None
+    ended = False
+
+    for event in payload:
         if "Records" in event:
-            records += event["Records"]["Payload"].decode("utf-8")
+            chunk = event["Records"]["Payload"]
+            received_bytes += len(chunk)
+
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                if len(line) > 0:
+                    yield json.loads(line)
+        elif "Stats" in event:
+            stats = event["Stats"]["Details"]
+        elif "End" in event:
+            ended = True
+
+    if not ended:
+        raise IOError("S3 Select response ended before its End event")
+
+    if stats is not None and stats.get("BytesReturned", received_bytes) != received_bytes:
+        raise IOError(f"S3 Select response truncated: received {received_bytes} of {stats['BytesReturned']} bytes")
+
+    if len(tail) > 0:
+        yield json.loads(tail)
 
-    records = [json.loads(record) for record in records.split("\n") if len(record) > 0]
-    
-    return records
+    if stats is not None:
+        logger.info("S3 Select scan", extra=dict(data={
+            "Bytes Scanned": stats.get("BytesScanned"),
+            "Bytes Processed": stats.get("BytesProcessed"),
+            "Bytes Returned": received_bytes,
+        }))
 
 
-def get_last_modified_date():
+def select_expression(fields=None, conditions=()):
     """
     Parameters
     ----------
-    None
+    fields: List or None, fields of the projection, all fields if None
+
+    conditions: tuple, (field, operator, value) predicates joined with AND, operator in {'>=', '<='} and value text
+
     Returns
     ------
-    last modified date: str, last modified date of covid data csv converted to string and formatted
+    expression: str, S3 Select SQL expression.  S3 Select has no bind parameters, so field names are quoted as identifiers
+        and values as string literals, with embedded quotes doubled
     """
 
-    res = s3.head_object(Bucket=BUCKET_NAME, Key=KEY_NAME)
+    projection = "*" if fields is None else ", ".join("s." + quote_identifier(field) for field in fields)
+    expression = f"select {projection} from s3object s"
+
+    predicates = []
+    for field, operator, value in conditions:
+        if operator not in (">=", "<="):
+            raise ValueError(f"Invalid operator: {operator}")
+        predicates.append(f"s.{quote_identifier(field)} {operator} {quote_literal(value)}")
+
+    if len(predicates) > 0:
+        expression += " where " + " and ".join(predicates)
 
-    return res['LastModified'].strftime("%m/%d/%Y, %H:%M:%S")
+    return expression
+
+
+def quote_identifier(name):
+    """
+    Parameters
+    ----------
+    name: str, field name
+
+    Returns
+    ------
+    identifier: str, double quoted identifier, e.g. "cases-diff"
+    """
+
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value):
+    """
+    Parameters
+    ----------
+    value: str, text value
+
+    Returns
+    ------
+    literal: str, single quoted string literal, e.g. '2020-09-01'
+    """
+
+    return "'" + value.replace("'", "''") + "'"
+
+
+def parse_query(params, dataset):
+    """
+    Parameters
+    ----------
+    params: dict, queryStringParameters of the request
+
+    dataset: str in {'daily', 'metrics'}
+
+    Returns
+    ------
+    query: dict or None, validated parameters.  None if the request has none of them
+        start, end: str or None, YYYY-MM-DD bounds of the date field, inclusive
+        fields: List or None, fields of the data set to return in data set order, "date" is always included
+        last_n: int or None, number of days up to the date the data set was last modified
+
+    Raises ValueError for an invalid value, before any of it reaches a query
+    """
+
+    if not QUERY_PARAMETERS & set(params):
+        return None
+
+    if dataset not in DATASET_COLUMNS:
+        raise ValueError(f"Invalid dataset: {dataset}")
+
+    query = {"start": None, "end": None, "fields": None, "last_n": None}
+
+    for name in ("start", "end"):
+        if params.get(name):
+            try:
+                query[name] = datetime.strptime(params[name], "%Y-%m-%d").strftime("%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Invalid {name}: expected YYYY-MM-DD")
+
+    if query["start"] is not None and query["end"] is not None and query["start"] > query["end"]:
+        raise ValueError("Invalid date range: start is after end")
+
+    if params.get("fields"):
+        fields = set(field.strip() for field in params["fields"].split(","))
+        unknown = sorted(fields - set(DATASET_COLUMNS[dataset]))
+        if len(unknown) > 0:
+            raise ValueError(f"Invalid fields: {', '.join(unknown)}")
+        query["fields"] = [col for col in DATASET_COLUMNS[dataset] if col in fields or col == "date"]
+
+    if params.get("last_n"):
+        if not params["last_n"].isdigit() or not 1 <= int(params["last_n"]) <= MAX_LAST_N:
+            raise ValueError(f"Invalid last_n: expected a number of days from 1 to {MAX_LAST_N}")
+        query["last_n"] = int(params["last_n"])
+
+    return query
+
+
+def query_conditions(query, last_modified):
+    """
+    Parameters
+    ----------
+    query: dict, validated parameters, see parse_query
+
+    last_modified: datetime, LastModified of the data set, last_n counts back from its date
+
+    Returns
+    ------
+    conditions: tuple, (field, operator, value) predicates on the date field, see select_expression.
+        Dates are YYYY-MM-DD text in the csv and Parquet files, so text comparison orders them by date
+    """
+
+    start = query["start"]
+    if query["last_n"] is not None:
+        last_n_start = (last_modified.date() - timedelta(days=query["last_n"])).strftime("%Y-%m-%d")
+        start = last_n_start if start is None else max(start, last_n_start)
+
+    conditions = ()
+    if start is not None:
+        conditions += (("date", ">=", start),)
+    if query["end"] is not None:
+        conditions += (("date", "<=", query["end"]),)
+
+    return conditions
+
+
+def query_response(event, dataset, query):
+    """
+    Parameters
+    ----------
+    event: dict, API Gateway Lambda Proxy Input Format
+
+    dataset: str in {'daily', 'metrics'}
+
+    query: dict, validated parameters, see parse_query
+
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict
+        The projection and predicate are run by S3 Select, so only the matching records and fields are scanned out of the
+        data set and returned.  These responses are not cached by the container, their ETag includes the query
+    """
+
+    key, data_format = get_dataset_source(dataset)
+    metadata = get_object_metadata(key)
+
+    canonical_query = json.dumps(query, sort_keys=True)
+    entry = {"etag": metadata["ETag"] + canonical_query, "last_modified": metadata["LastModified"], "compressed": False}
+    headers = cache_headers(entry, False)
+
+    if is_not_modified(event, headers["ETag"], entry["last_modified"]):
+        return not_modified_response(headers)
+
+    data = get_covid_data(key, data_format, get_compression_type(metadata), query["fields"],
+                          query_conditions(query, metadata["LastModified"]))
+
+    return {
+        "statusCode": 200,
+        "headers": {"Access-Control-Allow-Origin":"*", **headers},
+        "body": json.dumps({
+            "data": data,
+            "last_modified_date": get_last_modified_date(metadata)
+        }),
+    }
+
+
+def not_modified_response(headers):
+    """
+    Parameters
+    ----------
+    headers: dict, validator and caching headers of the response, see cache_headers
+
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict, 304 without body
+    """
+
+    return {
+        "statusCode": 304,
+        "headers": {"Access-Control-Allow-Origin":"*", **headers},
+        "body": "",
+    }
+
+
+def get_dataset_source(dataset):
+    """
+    Parameters
+    ----------
+    dataset: str in {'daily', 'metrics'}
+
+    Returns
+    ------
+    key: str, Key of the file holding the data set
+
+    data_format: str in {'csv', 'parquet'}, the daily data set is read from its Parquet copy if DATA_FORMAT is 'parquet'
+    """
+
+    if dataset not in DATASET_KEYS:
+        raise ValueError(f"Invalid dataset: {dataset}")
+
+    if dataset == "daily" and DATA_FORMAT == "parquet":
+        return PARQUET_KEY_NAME, "parquet"
+
+    return DATASET_KEYS[dataset], "csv"
+
+
+def get_payload(dataset):
+    """
+    Parameters
+    ----------
+    dataset: str in {'daily', 'metrics'}
+
+    Returns
+    ------
+    res: dict or None, get_object response of the gzip compressed JSON response body precomputed by the ETL process.
+        None if it has not been written yet
+    """
+
+    try:
+        res = s3.get_object(Bucket=BUCKET_NAME, Key=PAYLOAD_KEYS[dataset])
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            logger.info("No API payload, querying data set", extra=dict(data={"Key": PAYLOAD_KEYS[dataset]}))
+            return None
+        raise
+
+    return res
+
+
+def accepts_gzip(event):
+    """
+    Parameters
+    ----------
+    event: dict, API Gateway Lambda Proxy Input Format
+
+    Returns
+    ------
+    accepts_gzip: bool, True if the Accept-Encoding request header allows gzip
+    """
+
+    return "gzip" in request_headers(event).get("accept-encoding", "")
+
+
+def request_headers(event):
+    """
+    Parameters
+    ----------
+    event: dict, API Gateway Lambda Proxy Input Format
+
+    Returns
+    ------
+    headers: dict, request headers with lower case names
+    """
+
+    return {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+
+
+def seconds_until_next_run(now=None):
+    """
+    Parameters
+    ----------
+    now: datetime or None, current UTC time, now by default
+
+    Returns
+    ------
+    seconds: int, seconds until the next daily ETL run, see ETL_SCHEDULE_UTC, is expected to have finished
+    """
+
+    now = now or datetime.now(timezone.utc)
+    hour, minute = (int(part) for part in ETL_SCHEDULE_UTC.split(":"))
+
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0) + timedelta(seconds=ETL_RUN_SECONDS)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+
+    return int((next_run - now).total_seconds())
+
+
+def cache_headers(entry, gzip_encoded, now=None):
+    """
+    Parameters
+    ----------
+    entry: dict, cached response, see load_response
+
+    gzip_encoded: bool, True if the response body is gzip encoded
+
+    now: datetime or None, current UTC time, now by default
+
+    Returns
+    ------
+    headers: dict, validator and caching headers of the response
+        ETag: strong ETag derived from the S3 object's ETag and LastModified, with a suffix per content encoding
+        Last-Modified: LastModified of the S3 object
+        Cache-Control: public, cacheable until the next daily ETL run has finished
+    """
+
+    last_modified = entry["last_modified"].astimezone(timezone.utc)
+    digest = hashlib.sha256((entry["etag"] + last_modified.isoformat()).encode("utf-8")).hexdigest()[:32]
+
+    headers = {
+        "ETag": f'"{digest}-gzip"' if gzip_encoded else f'"{digest}"',
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": f"public, max-age={seconds_until_next_run(now)}",
+    }
+    if entry["compressed"]:
+        headers["Vary"] = "Accept-Encoding"
+
+    return headers
+
+
+def is_not_modified(event, etag, last_modified):
+    """
+    Parameters
+    ----------
+    event: dict, API Gateway Lambda Proxy Input Format
+
+    etag: str, ETag of the response, see cache_headers
+
+    last_modified: datetime, LastModified of the S3 object
+
+    Returns
+    ------
+    not_modified: bool, True if the client's copy is current, i.e. If-None-Match lists the ETag, or, without If-None-Match,
+        If-Modified-Since is not earlier than last_modified
+    """
+
+    headers = request_headers(event)
+
+    if "if-none-match" in headers:
+        tags = [tag.strip() for tag in headers["if-none-match"].split(",")]
+        # If-None-Match uses the weak comparison, a W/ prefix is ignored
+        return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+    if "if-modified-since" in headers:
+        try:
+            modified_since = parsedate_to_datetime(headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return False
+
+        if modified_since is None or modified_since.tzinfo is None:
+            return False
+        return last_modified.replace(microsecond=0) <= modified_since
+
+    return False
+
+
+def payload_response(body, gzip_encoded):
+    """
+    Parameters
+    ----------
+    body: bytes, gzip compressed JSON response body, see get_payload
+
+    gzip_encoded: bool, True to return the body compressed with a Content-Encoding header, see accepts_gzip
+
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict
+        A compressed body is base64 encoded, API Gateway decodes it back to bytes for the client
+    """
+
+    if not gzip_encoded:
+        return {
+            "statusCode": 200,
+            "headers": {"Access-Control-Allow-Origin":"*", "Content-Type": "application/json"},
+            "body": gzip.decompress(body).decode("utf-8"),
+        }
+
+    return {
+        "statusCode": 200,
+        "headers": {"Access-Control-Allow-Origin":"*", "Content-Type": "application/json", "Content-Encoding": "gzip"},
+        "body": base64.b64encode(body).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
+def load_response(dataset):
+    """
+    Parameters
+    ----------
+    dataset: str in {'daily', 'metrics'}
+
+    Returns
+    ------
+    entry: dict, response of the data set with the object it was built from
+        key, etag: Key and ETag of the object, used to revalidate the entry
+        last_modified: datetime, LastModified of the object
+        body: bytes if compressed, the precomputed gzip response, str otherwise, the JSON response built from S3 Select
+        compressed: bool
+    """
+
+    key, data_format = get_dataset_source(dataset)
+
+    if USE_PAYLOAD:
+        res = get_payload(dataset)
+        if res is not None:
+            return {"key": PAYLOAD_KEYS[dataset], "etag": res["ETag"], "last_modified": res["LastModified"],
+                    "body": res["Body"].read(), "compressed": True}
+
+    metadata = get_object_metadata(key)
+
+    data = get_covid_data(key, data_format, get_compression_type(metadata))
+    body = json.dumps({
+        "data": data,
+        "last_modified_date": get_last_modified_date(metadata)
+    })
+
+    return {"key": key, "etag": metadata["ETag"], "last_modified": metadata["LastModified"], "body": body,
+            "compressed": False}
+
+
+def get_response(dataset):
+    """
+    Parameters
+    ----------
+    dataset: str in {'daily', 'metrics'}
+
+    Returns
+    ------
+    entry: dict, cached response of the data set, see load_response
+
+    A cached response is returned as is for RESPONSE_CACHE_SECONDS after it was last validated.  After that a head_object call
+    compares the object's ETag with the cached one, and the response is only rebuilt if the object changed.  Hit rate and
+    revalidation latency are logged with every request
+    """
+
+    CACHE_STATS["requests"] += 1
+    entry = RESPONSE_CACHE.get(dataset)
+    status = "miss"
+
+    if entry is not None and time.monotonic() - entry["validated_at"] < RESPONSE_CACHE_SECONDS:
+        status = "hit"
+    elif entry is not None:
+        start = time.perf_counter()
+        try:
+            etag = s3.head_object(Bucket=BUCKET_NAME, Key=entry["key"])["ETag"]
+        except ClientError:
+            etag = None
+        revalidation_ms = (time.perf_counter() - start) * 1000
+
+        CACHE_STATS["revalidations"] += 1
+        CACHE_STATS["revalidation_ms"] += revalidation_ms
+
+        if etag == entry["etag"]:
+            entry["validated_at"] = time.monotonic()
+            status = "revalidated"
+
+    if status == "miss":
+        entry = load_response(dataset)
+        entry["validated_at"] = time.monotonic()
+        RESPONSE_CACHE[dataset] = entry
+    else:
+        CACHE_STATS["hits"] += 1
+
+    extra_data = {
+        "Dataset": dataset,
+        "Cache": status,
+        "Hit Rate": round(CACHE_STATS["hits"] / CACHE_STATS["requests"], 4),
+        "Revalidations": CACHE_STATS["revalidations"],
+        "Mean Revalidation ms": round(CACHE_STATS["revalidation_ms"] / max(CACHE_STATS["revalidations"], 1), 3),
+    }
+    logger.info("Response cache", extra=dict(data=extra_data))
+
+    return entry
+
+
+def get_object_metadata(key=KEY_NAME):
+    """
+    Parameters
+    ----------
+    key: str, Key of the file, the daily data set by default
+    Returns
+    ------
+    metadata: dict, head_object response of the file
+    """
+
+    return s3.head_object(Bucket=BUCKET_NAME, Key=key)
+
+
+def get_compression_type(metadata):
+    """
+    Parameters
+    ----------
+    metadata: dict, head_object response of the file
+    Returns
+    ------
+    compression: str, S3 Select CompressionType of the file, 'GZIP' if the ETL process stored it with ContentEncoding gzip
+    """
+
+    encodings = metadata.get("ContentEncoding", "").split(",")
+    return "GZIP" if "gzip" in encodings else "NONE"
+
+
+def get_last_modified_date(metadata):
+    """
+    Parameters
+    ----------
+    metadata: dict, head_object response of the file
+    Returns
+    ------
+    last modified date: str, last modified date of covid data csv converted to string and formatted
+    """
+
+    return metadata['LastModified'].strftime("%m/%d/%Y, %H:%M:%S")
 
 def lambda_handler(event, context):
     """
     Parameters
     ----------
     event: dict, required 
+        queryStringParameters may contain dataset in {'daily', 'metrics'}, defaults to 'daily'.
+        metrics returns the precomputed rolling averages, growth rates and doubling times instead of the daily data.
+        The precomputed response of the data set is returned when it exists, the data set is queried with S3 Select otherwise.
+        Responses are cached by the container, see get_response.
+        If-None-Match and If-Modified-Since headers are answered with a 304 without body when the client's copy is current.
+        start, end, fields and last_n select part of the data set, see parse_query.  Such requests query the data set directly
 
     context: object, required
 
@@ -74,17 +735,32 @@ def lambda_handler(event, context):
     """
 
     try:
-        
-        data = get_covid_data()
-        last_modified_date = get_last_modified_date()
-        return {
-            "statusCode": 200,
-            "headers": {"Access-Control-Allow-Origin":"*"},
-            "body": json.dumps({
-                "data": data,
-                "last_modified_date": last_modified_date
-            }),
-        }
+        params = event.get("queryStringParameters") or {}
+        dataset = params.get("dataset", "daily")
+
+        query = parse_query(params, dataset)
+        if query is not None:
+            return query_response(event, dataset, query)
+
+        entry = get_response(dataset)
+
+        gzip_encoded = entry["compressed"] and accepts_gzip(event)
+        headers = cache_headers(entry, gzip_encoded)
+
+        if is_not_modified(event, headers["ETag"], entry["last_modified"]):
+            return not_modified_response(headers)
+
+        if entry["compressed"]:
+            res = payload_response(entry["body"], gzip_encoded)
+        else:
+            res = {
+                "statusCode": 200,
+                "headers": {"Access-Control-Allow-Origin":"*"},
+                "body": entry["body"],
+            }
+
+        res["headers"].update(headers)
+        return res
     except Exception as e:
         return {
             "statusCode": 400,
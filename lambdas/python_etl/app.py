@@ -1,14 +1,32 @@
 import os
 import boto3
-from extract_data import extract_data
-from transform_data import transform_data
-from load_data import load_data
+from extract_data import (discard_tail_updates, extract_data, extract_previous_metrics, extract_state_data, load_source_validators,
+                          save_source_validators)
+from transform_data import transform_data, transform_state_data
+from metrics import compute_metrics
+from load_data import load_data, load_metrics, load_state_data
+from county_pipeline import run_county_pipeline
 
 s3 = boto3.client('s3')
 
 BUCKET_NAME = os.environ["BUCKET_NAME"]
 KEY = os.environ["PREV_DATA"]
 CHANGE_LOG = os.environ["CHANGE_LOG"]
+CHANGE_LOG_PREFIX = os.environ.get("CHANGE_LOG_PREFIX", "change_log")
+METRICS_DATA = os.environ.get("METRICS_DATA", "acg-covid-metrics.csv")
+DATA_PARTITION_PREFIX = os.environ.get("DATA_PARTITION_PREFIX") or None
+COMPRESS_OUTPUT = os.environ.get("COMPRESS_OUTPUT", "false").lower() == "true"
+CONCURRENT_EXTRACT = os.environ.get("CONCURRENT_EXTRACT", "false").lower() == "true"
+CONDITIONAL_FETCH = os.environ.get("CONDITIONAL_FETCH", "false").lower() == "true"
+INCREMENTAL_FETCH = os.environ.get("INCREMENTAL_FETCH", "false").lower() == "true"
+TRANSFORM_MODE = os.environ.get("TRANSFORM_MODE", "full")
+COMPACT_SCHEMA = os.environ.get("COMPACT_SCHEMA", "false").lower() == "true"
+TRANSFORM_ENGINE = os.environ.get("TRANSFORM_ENGINE", "pandas")
+STATE_DATA = os.environ.get("STATE_DATA", "acg-covid-state-data.csv")
+STATE_CHANGE_LOG = os.environ.get("STATE_CHANGE_LOG", "CHANGE_LOG_STATES.csv")
+TRANSFORM_WORKERS = int(os.environ.get("TRANSFORM_WORKERS", "1"))
+COUNTY_PREFIX = os.environ.get("COUNTY_PREFIX", "counties")
+COUNTY_MEMORY_BUDGET_MB = int(os.environ.get("COUNTY_MEMORY_BUDGET_MB", "64"))
 
 
 def lambda_handler(event, context):
@@ -20,6 +38,8 @@ def lambda_handler(event, context):
         keys:
             environment: str in {'production', 'testing'} determines which download URLs to use
 
+            granularity: str in {'national', 'state', 'county'}, optional, defaults to 'national'
+
     context: object, required
         Lambda Context runtime methods and attributes
 
@@ -30,14 +50,71 @@ def lambda_handler(event, context):
 
     env = event["environment"]
 
+    granularity = event.get("granularity", "national")
+    if granularity == "state":
+        return state_handler(env)
+    if granularity == "county":
+        return county_handler(env)
+
+    validators = None
+    if CONDITIONAL_FETCH:
+        validators = load_source_validators(env, BUCKET_NAME, s3)
+
+    tail_updates = {}
+
+    try:
+        return national_handler(env, validators, tail_updates)
+    finally:
+        discard_tail_updates(tail_updates)
+
+
+def national_handler(env, validators, tail_updates):
+    """
+    Parameters
+    ----------
+    env: str in {'production', 'testing'} determines which download URLs to use
+
+    validators: dict or None, ETag/Last-Modified values of each source from the previous run, see load_source_validators
+
+    tail_updates: dict, filled with the copies and tail states of the incrementally fetched sources, see extract_data
+
+    Returns
+    ------
+    Same status payload as lambda_handler
+    """
+
     ny_times_data, jh_data, prev_data = extract_data(
-        env, BUCKET_NAME, KEY, s3)
+        env, BUCKET_NAME, KEY, s3, concurrent=CONCURRENT_EXTRACT, validators=validators,
+        incremental=INCREMENTAL_FETCH, partition_prefix=DATA_PARTITION_PREFIX, tail_updates=tail_updates)
+
+    if ny_times_data is None and jh_data is None:
+        # Nothing to load, a tail state refreshed by a periodic full download still describes the same copy
+        if len(tail_updates) > 0:
+            save_source_validators(env, BUCKET_NAME, None, s3, tail_updates)
+        return {
+            "Status": "No Change",
+            "New Records": "0",
+            "Updated Records": "0"
+        }
 
     transformed_data, new_records, updated_records = transform_data(
-        ny_times_data, jh_data, prev_data)
+        ny_times_data, jh_data, prev_data, mode=TRANSFORM_MODE, compact=COMPACT_SCHEMA,
+        engine=TRANSFORM_ENGINE)
 
     load_data(env, BUCKET_NAME, KEY, CHANGE_LOG,
-              transformed_data, new_records, updated_records, s3)
+              transformed_data, new_records, updated_records, s3, partition_prefix=DATA_PARTITION_PREFIX,
+              compress=COMPRESS_OUTPUT, change_log_prefix=CHANGE_LOG_PREFIX)
+
+    if prev_data is None:
+        metrics = compute_metrics(transformed_data)
+    else:
+        prev_metrics = extract_previous_metrics(BUCKET_NAME, env + '/' + METRICS_DATA, s3)
+        metrics = compute_metrics(transformed_data, prev_metrics, new_records + updated_records)
+
+    load_metrics(env, BUCKET_NAME, METRICS_DATA, metrics, s3, compress=COMPRESS_OUTPUT)
+
+    if validators is not None or len(tail_updates) > 0:
+        save_source_validators(env, BUCKET_NAME, validators, s3, tail_updates)
 
     if prev_data is None:
         return {
@@ -50,4 +127,59 @@ def lambda_handler(event, context):
         "Status": "Daily Data Updated",
         "New Records": str(len(new_records)),
         "Updated Records": str(len(updated_records))
-    }
\ No newline at end of file
+    }
+
+
+def state_handler(env):
+    """
+    Parameters
+    ----------
+    env: str in {'production', 'testing'} determines which download URL to use
+
+    Returns
+    ------
+    Same status payload as lambda_handler, record counts are (state, date) pairs
+    """
+
+    states_data, prev_data = extract_state_data(
+        env, BUCKET_NAME, STATE_DATA, s3, concurrent=CONCURRENT_EXTRACT)
+
+    transformed_data, new_records, updated_records = transform_state_data(
+        states_data, prev_data, workers=TRANSFORM_WORKERS)
+
+    load_state_data(env, BUCKET_NAME, STATE_DATA, STATE_CHANGE_LOG,
+                    transformed_data, new_records, updated_records, s3, compress=COMPRESS_OUTPUT)
+
+    if prev_data is None:
+        return {
+            "Status": "New Data Loaded",
+            "New Records": str(len(new_records)),
+            "Updated Records": "--"
+        }
+
+    return {
+        "Status": "Daily Data Updated",
+        "New Records": str(len(new_records)),
+        "Updated Records": str(len(updated_records))
+    }
+
+
+def county_handler(env):
+    """
+    Parameters
+    ----------
+    env: str in {'production', 'testing'} determines which download URL to use
+
+    Returns
+    ------
+    Same status payload as lambda_handler.  The county data set is rewritten in full each run, so every row is reported as new
+    """
+
+    summary = run_county_pipeline(
+        env, BUCKET_NAME, COUNTY_PREFIX, s3, memory_budget_mb=COUNTY_MEMORY_BUDGET_MB)
+
+    return {
+        "Status": "County Data Loaded",
+        "New Records": str(summary["Rows"]),
+        "Updated Records": "--"
+    }
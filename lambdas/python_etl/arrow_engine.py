@@ -0,0 +1,408 @@
+import logging
+import math
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from json_logger import setup_logging
+from date_index import format_date_index, report_missing_dates, set_date_index
+from fingerprints import FINGERPRINT_COLUMN, compare_fingerprints, compute_fingerprints, stored_fingerprints
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+COUNT_COLUMNS = ["cases", "deaths", "recoveries"]
+
+OUTPUT_COLUMNS = ["date", "cases", "deaths", "recoveries", "date-diff", "month", "day_of_week",
+                  "cases-diff", "cases-log", "deaths-diff", "deaths-log", "recoveries-diff", "recoveries-log"]
+
+DAY_OF_WEEK_NAMES = pa.array(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])
+
+MONTH_NAMES = pa.array(["January", "February", "March", "April", "May", "June", "July",
+                        "August", "September", "October", "November", "December"])
+
+SECONDS_PER_DAY = 86400
+
+NUMERIC_TEXT_PATTERN = r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$"
+
+
+def transform_data(ny_times_data, jh_data, prev_data):
+    """
+    Parameters
+    ----------
+    ny_times_data: DataFrame or Table, downloaded NY Times Data
+
+    jh_data: DataFrame or Table, downloaded Johns Hopkins Data
+
+    prev_data: DataFrame, Table or None, previous day's/run's data retrieved from s3 Bucket.  On initial load of data, this will be None
+
+    Returns
+    ------
+    covid_data: DataFrame, same output as the pandas engine, the steps run on Arrow tables and only the result is converted
+
+    new_records: List, list of dates that are newly added to the daily data set
+
+    updated_records: List, list of dates that were previously in the data set that have updated fields
+    """
+
+    jh_data = filter_jh_data(as_table(jh_data))
+
+    covid_data = merge_data(as_table(ny_times_data), jh_data)
+    covid_data = check_count_validity(covid_data)
+
+    if prev_data is None:
+        new_records = sorted(pc.unique(covid_data["date"]).to_pylist())
+        updated_records = []
+    else:
+        try:
+            new_records, updated_records = get_changed_records(
+                covid_data, as_table(prev_data))
+        except:
+            logger.error(
+                "Error while getting updated/changed records, previous data and current data are not comparable")
+            raise
+
+    try:
+        covid_data = add_new_fields(covid_data)
+    except pa.ArrowInvalid:
+        logger.error(
+            "Invalid date field format, field must be in YYYY-MM-DD format")
+        raise
+    except:
+        logger.error("Error adding new fields")
+        raise
+
+    logger.info("Data Transformations Complete")
+    return covid_data.to_pandas(), new_records, updated_records
+
+
+def as_table(data):
+    """
+    Parameters
+    ----------
+    data: DataFrame or Table
+
+    Returns
+    ------
+    table: Table, the input as an Arrow table, without the pandas index
+    """
+
+    if isinstance(data, pa.Table):
+        return data
+
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+
+def cast_column(table, column, data_type):
+    """
+    Parameters
+    ----------
+    table: Table
+
+    column: str, name of the field to cast
+
+    data_type: DataType, type the field is cast to
+
+    Returns
+    ------
+    table: Table, input table with the field replaced by its cast values
+    """
+
+    return table.set_column(table.schema.get_field_index(column), column, pc.cast(table[column], data_type))
+
+
+def filter_jh_data(jh_data):
+    """
+    Parameters
+    ----------
+    jh_data: Table, downloaded Johns Hopkins Data
+
+    Returns
+    ------
+    jh_data: Table, Johns Hopkins Data filtered to US records with only Date and Recovered fields
+    """
+
+    try:
+        jh_data = jh_data.filter(pc.equal(jh_data["Country/Region"], "US"))
+        jh_data = jh_data.select(["Date", "Recovered"])
+    except:
+        extra_data = {
+            "Column Names": jh_data.column_names
+        }
+        logger.error("Error filtering Johns Hopkins Data",
+                     extra=dict(data=extra_data))
+        raise
+
+    if jh_data.num_rows == 0:
+        logger.error("Johns Hopkins Data has no US data")
+        raise Exception
+
+    return jh_data
+
+
+def merge_data(nyt_data, jh_data):
+    """
+    Parameters
+    ----------
+    nyt_data: Table, downloaded NY Times Data
+
+    jh_data: Table, Johns Hopkins Data filtered to US records with only Date and Recovered fields
+
+    Returns
+    ------
+    covid_data: Table, merged data in date order with Johns Hopkins Date key removed and fields renamed
+        columns: "date", "cases", "deaths", "recoveries"
+    """
+
+    try:
+        # Text keys only join on identical types, pandas string fields may arrive as large_string
+        nyt_data = cast_column(nyt_data, "date", pa.string())
+        jh_data = cast_column(jh_data, "Date", pa.string())
+
+        report_missing_dates({
+            "NY Times": missing_values(nyt_data["date"], jh_data["Date"]),
+            "Johns Hopkins": missing_values(jh_data["Date"], nyt_data["date"]),
+        }, "Dates missing from the other source are dropped from the merged data")
+
+        covid_data = nyt_data.join(
+            jh_data, keys="date", right_keys="Date", join_type="inner")
+        covid_data = covid_data.select(["date", "cases", "deaths", "Recovered"])
+        covid_data = covid_data.rename_columns(["date", "cases", "deaths", "recoveries"])
+        covid_data = covid_data.sort_by("date")
+    except:
+        extra_data = {
+            "NYT_Columns": nyt_data.column_names,
+            "JH_Columns": jh_data.column_names,
+        }
+        logger.error("Error merging data", extra=dict(data=extra_data))
+        raise
+
+    if covid_data.num_rows == 0:
+        logger.error("Merged data contains no records")
+        raise Exception
+
+    return covid_data
+
+
+def missing_values(values, other):
+    """
+    Parameters
+    ----------
+    values: ChunkedArray, key values of one side of a join
+
+    other: ChunkedArray, key values of the other side
+
+    Returns
+    ------
+    missing: List, values that other does not contain
+    """
+
+    return values.filter(pc.invert(pc.is_in(values, value_set=other.combine_chunks()))).to_pylist()
+
+
+def check_count_validity(covid_data):
+    """
+    Parameters
+    ----------
+    covid_data: Table, merged data
+        columns: "date", "cases", "deaths", "recoveries"
+
+    Returns
+    ------
+    covid_data: Table, input data with all numeric fields parsed to int64
+    """
+
+    report = {}
+    for col in COUNT_COLUMNS:
+        values = covid_data[col].combine_chunks()
+        numbers, non_numeric = parse_numbers(values)
+        negative = pc.fill_null(pc.less(numbers, 0), False)
+
+        if pc.any(non_numeric).as_py() or pc.any(negative).as_py():
+            report[col] = {
+                "non_numeric": offending_rows(covid_data, values, non_numeric),
+                "negative": offending_rows(covid_data, values, negative),
+            }
+            continue
+
+        covid_data = covid_data.set_column(
+            covid_data.schema.get_field_index(col), col, pc.cast(pc.trunc(numbers), pa.int64()))
+
+    covid_data = cast_column(covid_data, "date", pa.string())
+
+    if len(report) > 0:
+        logger.error("Count fields contain non-numeric or negative values",
+                     extra=dict(data=report))
+        raise ValueError(f"Invalid count fields: {sorted(report)}")
+
+    return covid_data
+
+
+def parse_numbers(values):
+    """
+    Parameters
+    ----------
+    values: Array, count field as numbers or text
+
+    Returns
+    ------
+    numbers: Array, count field as float64, invalid values are null
+
+    non_numeric: Array, boolean array marking missing, NaN or non-numeric values
+    """
+
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+        is_numeric = pc.fill_null(pc.match_substring_regex(values, NUMERIC_TEXT_PATTERN), False)
+        values = pc.if_else(is_numeric, values, pa.scalar(None, values.type))
+
+    numbers = pc.cast(values, pa.float64())
+    non_numeric = pc.fill_null(pc.is_nan(numbers), True)
+
+    return numbers, non_numeric
+
+
+def offending_rows(covid_data, values, mask):
+    """
+    Parameters
+    ----------
+    covid_data: Table, merged data with "date" field
+
+    values: Array, raw values of the field being validated
+
+    mask: Array, boolean array marking the offending rows
+
+    Returns
+    ------
+    rows: List, list of dicts with the position, date and raw value of each offending row
+    """
+
+    positions = np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+    dates = covid_data["date"].to_pylist()
+    raw_values = values.to_pylist()
+
+    return [
+        {
+            "row": int(position),
+            "date": str(dates[position]),
+            "value": str(raw_values[position]),
+        }
+        for position in positions
+    ]
+
+
+def get_changed_records(covid_data, prev_data):
+    """
+    Parameters
+    ----------
+    covid_data: Table, merged data with all numeric fields parsed to int64
+        columns: "date", "cases", "deaths", "recoveries"
+
+    prev_data: Table, previous day's/run's data, with a fingerprint field if it was read from the Parquet snapshot
+
+    Returns
+    ------
+    new_records: List, list of dates that are newly added to the daily data set
+
+    updated_records: List, list of dates that were previously in the data set that have updated fields
+
+    Records are compared by the fingerprints of the pandas engine, see fingerprints.py, so both engines detect the same changes.
+    Only the date, count and fingerprint fields are converted for the comparison
+    """
+
+    previous_columns = ["date"] + COUNT_COLUMNS
+    if FINGERPRINT_COLUMN in prev_data.column_names:
+        previous_columns.append(FINGERPRINT_COLUMN)
+
+    current = cast_column(covid_data.select(["date"] + COUNT_COLUMNS), "date", pa.string()).to_pandas()
+    previous = cast_column(prev_data.select(previous_columns), "date", pa.string()).to_pandas()
+
+    current = compute_fingerprints(current, COUNT_COLUMNS)
+    previous = stored_fingerprints(previous, COUNT_COLUMNS)
+
+    current = set_date_index(current, current.index, "Current data")
+    previous = set_date_index(previous, previous.index, "Previous data")
+
+    new_keys, updated_keys = compare_fingerprints(current, previous)
+
+    report_missing_dates({"Previous data": previous.index.difference(current.index)},
+                         "Dates of the previous data are missing from the current data")
+
+    return list(format_date_index(new_keys.unique())), list(format_date_index(updated_keys.unique()))
+
+
+def add_new_fields(covid_data):
+    """
+    Parameters
+    ----------
+    covid_data: Table, merged data in date order with all numeric fields parsed to int64 and the date field as YYYY-MM-DD text or date32
+        columns: "date", "cases", "deaths", "recoveries"
+
+    Returns
+    ------
+    covid_data: Table, merged data with the derived fields of the pandas engine added and the date field as date32
+    """
+
+    dates = covid_data["date"].combine_chunks()
+    if pa.types.is_date(dates.type):
+        timestamps = pc.cast(dates, pa.timestamp("s"))
+    else:
+        timestamps = pc.strptime(dates, format="%Y-%m-%d", unit="s")
+    days = pc.divide(pc.cast(timestamps, pa.int64()), SECONDS_PER_DAY)
+
+    columns = {
+        "date": pc.cast(timestamps, pa.date32()),
+        "cases": covid_data["cases"],
+        "deaths": covid_data["deaths"],
+        "recoveries": covid_data["recoveries"],
+        "date-diff": diff(days),
+        "month": pc.take(MONTH_NAMES, pc.subtract(pc.month(timestamps), 1)),
+        "day_of_week": pc.take(DAY_OF_WEEK_NAMES, pc.day_of_week(timestamps)),
+    }
+
+    for col in COUNT_COLUMNS:
+        values = covid_data[col].combine_chunks()
+        columns[f"{col}-diff"] = diff(values)
+        columns[f"{col}-log"] = log_counts(values)
+
+    return pa.table([columns[col] for col in OUTPUT_COLUMNS], names=OUTPUT_COLUMNS)
+
+
+def diff(values):
+    """
+    Parameters
+    ----------
+    values: Array, Integer field
+
+    Returns
+    ------
+    diffs: Array, int64 difference from the previous record, 0 for the first record
+    """
+
+    values = pc.cast(values, pa.int64())
+    if len(values) == 0:
+        return values
+
+    diffs = pc.subtract(values.slice(1), values.slice(0, len(values) - 1))
+    return pa.concat_arrays([pa.array([0], pa.int64()), diffs])
+
+
+def log_counts(values):
+    """
+    Parameters
+    ----------
+    values: Array, Integer count field
+
+    Returns
+    ------
+    logs: Array, natural log of each count, 0 where the count is not positive.
+        int64 if no count is positive, matching the pandas engine
+
+    The logs are taken with math.log like the pandas engine, pc.ln can differ in the last digit and both engines have to
+    publish byte for byte identical csv files
+    """
+
+    positive = pc.greater(values, 0)
+
+    if not pc.any(positive).as_py():
+        return pa.array(np.zeros(len(values), dtype="int64"))
+
+    return pa.array([math.log(x) if x > 0 else 0.0 for x in values.to_pylist()], pa.float64())
@@ -0,0 +1,247 @@
+from datetime import datetime
+from io import BytesIO
+import json
+import logging
+import pandas as pd
+from botocore.exceptions import ClientError
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+CHANGE_LOG_PREFIX = "change_log"
+INDEX_KEY = "index.json"
+SEGMENTS_DIR = "segments"
+COMPACTED_DIR = "compacted"
+
+# Segments are merged into one compacted file once this many of them have accumulated, about a month of daily runs
+COMPACTION_SEGMENTS = 30
+
+RUN_ID_FORMAT = "%Y%m%dT%H%M%S%fZ"
+
+
+def new_run_id(run_time=None):
+    """
+    Parameters
+    ----------
+    run_time: datetime or None, UTC time of the run, now by default
+
+    Returns
+    ------
+    run_id: str, e.g. "20201023T210000123456Z".  Run ids sort in the order the runs happened
+    """
+
+    return (run_time or datetime.utcnow()).strftime(RUN_ID_FORMAT)
+
+
+def append_change_log(change_log, bucket, key_prefix, s3, run_time=None, min_segments=COMPACTION_SEGMENTS):
+    """
+    Parameters
+    ----------
+    change_log: DataFrame, 'date' and 'status_update' fields of this run, see load_data.create_change_log
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the change log including the environment, e.g. "production/change_log"
+
+    s3: s3 Client
+
+    run_time: datetime or None, UTC time of the run, now by default
+
+    min_segments: int, number of segments that triggers a compaction, see compact_change_log
+
+    Returns
+    ------
+    run_id: str, id of the run the segment was written for
+
+    Each run writes one small segment, <key_prefix>/segments/run=<run_id>.csv, with its run id and timestamp on every row and
+    adds the segment to the index.  Earlier segments are never rewritten, and compaction keeps the index at one entry per
+    segment not yet compacted plus one per compacted file, so the cost of a run does not grow with the number of runs
+    """
+
+    run_time = run_time or datetime.utcnow()
+    run_id = new_run_id(run_time)
+
+    segment = change_log.copy()
+    segment.insert(0, "run_id", run_id)
+    segment.insert(1, "run_timestamp", run_time.isoformat())
+
+    index = read_index(bucket, key_prefix, s3)
+
+    segment_key = f"{SEGMENTS_DIR}/run={run_id}.csv"
+    s3.put_object(Bucket=bucket, Body=segment.to_csv(index=False), Key=key_prefix + '/' + segment_key)
+
+    index["segments"].append({
+        "run_id": run_id,
+        "timestamp": run_time.isoformat(),
+        "key": segment_key,
+        "records": len(segment),
+    })
+    write_index(index, bucket, key_prefix, s3)
+
+    logger.info("Change log segment written", extra=dict(data={"Run Id": run_id, "Records": len(segment)}))
+
+    if len(index["segments"]) >= min_segments:
+        compact_change_log(bucket, key_prefix, s3, min_segments)
+
+    return run_id
+
+
+def compact_change_log(bucket, key_prefix, s3, min_segments=COMPACTION_SEGMENTS):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the change log including the environment
+
+    s3: s3 Client
+
+    min_segments: int, segments are only compacted once at least this many have accumulated
+
+    Returns
+    ------
+    compacted_key: str or None, Key of the compacted file relative to key_prefix, e.g.
+        "compacted/runs=<first run_id>_<last run_id>.csv".  None if there were too few segments
+
+    The segment entries of the index are replaced by one entry for the compacted file with its run id range.  The index is
+    written before the segments are deleted, so readers never see a run without a file
+    """
+
+    index = read_index(bucket, key_prefix, s3)
+    runs = index["segments"]
+
+    if len(runs) == 0 or len(runs) < min_segments:
+        return None
+
+    segments = [read_change_log_file(bucket, key_prefix + '/' + run["key"], s3) for run in runs]
+    compacted = pd.concat(segments, ignore_index=True)
+
+    compacted_key = f"{COMPACTED_DIR}/runs={runs[0]['run_id']}_{runs[-1]['run_id']}.csv"
+    s3.put_object(Bucket=bucket, Body=compacted.to_csv(index=False), Key=key_prefix + '/' + compacted_key)
+
+    index["compacted"].append({
+        "key": compacted_key,
+        "first_run_id": runs[0]["run_id"],
+        "last_run_id": runs[-1]["run_id"],
+        "runs": len(runs),
+        "records": len(compacted),
+    })
+    index["segments"] = []
+    write_index(index, bucket, key_prefix, s3)
+
+    s3.delete_objects(Bucket=bucket, Delete={
+        "Objects": [{"Key": key_prefix + '/' + run["key"]} for run in runs]
+    })
+
+    logger.info("Change log compacted", extra=dict(data={"Key": compacted_key, "Segments": len(runs)}))
+    return compacted_key
+
+
+def get_changes_between(bucket, key_prefix, s3, start_run_id=None, end_run_id=None):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the change log including the environment
+
+    s3: s3 Client
+
+    start_run_id: str or None, changes of runs after this run are returned, from the first run if None
+
+    end_run_id: str or None, changes of runs up to and including this run are returned, up to the last run if None
+
+    Returns
+    ------
+    changes: DataFrame, 'run_id', 'run_timestamp', 'date' and 'status_update' fields of the matching runs in run order
+
+    Only the files whose run id range overlaps the requested one are read
+    """
+
+    def in_range(first_run_id, last_run_id):
+        return (start_run_id is None or last_run_id > start_run_id) and (end_run_id is None or first_run_id <= end_run_id)
+
+    index = read_index(bucket, key_prefix, s3)
+    keys = [entry["key"] for entry in index["compacted"] if in_range(entry["first_run_id"], entry["last_run_id"])]
+    keys += [entry["key"] for entry in index["segments"] if in_range(entry["run_id"], entry["run_id"])]
+
+    columns = ["run_id", "run_timestamp", "date", "status_update"]
+    if len(keys) == 0:
+        return pd.DataFrame(columns=columns)
+
+    changes = pd.concat([read_change_log_file(bucket, key_prefix + '/' + key, s3) for key in keys], ignore_index=True)
+    changes = changes[[in_range(run_id, run_id) for run_id in changes["run_id"]]].reset_index(drop=True)
+
+    logger.info("Change log read", extra=dict(data={"Files": len(keys), "Records": len(changes)}))
+    return changes[columns]
+
+
+def read_change_log_file(bucket, key, s3):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, full Key of a segment or compacted file
+
+    s3: s3 Client
+
+    Returns
+    ------
+    change_log: DataFrame, rows of the file with run ids and dates as text
+    """
+
+    res = s3.get_object(Bucket=bucket, Key=key)
+    return pd.read_csv(BytesIO(res["Body"].read()), dtype=str)
+
+
+def read_index(bucket, key_prefix, s3):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the change log including the environment
+
+    s3: s3 Client
+
+    Returns
+    ------
+    index: dict, files of the change log in run order.  An empty index if there is none yet
+        segments: List, run_id, timestamp, key and records of each run not yet compacted
+        compacted: List, key, first_run_id, last_run_id, runs and records of each compacted file
+
+    Any error other than a missing index is raised, an empty index written back after a transient error would drop the history
+    """
+
+    try:
+        res = s3.get_object(Bucket=bucket, Key=key_prefix + '/' + INDEX_KEY)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return {"segments": [], "compacted": []}
+        logger.error("Error reading change log index", extra=dict(data={"Key": key_prefix + '/' + INDEX_KEY}))
+        raise
+
+    return json.loads(res["Body"].read())
+
+
+def write_index(index, bucket, key_prefix, s3):
+    """
+    Parameters
+    ----------
+    index: dict, change log index, see read_index
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the change log including the environment
+
+    s3: s3 Client
+
+    Returns
+    ------
+    No returns, this function writes the index to <key_prefix>/index.json
+    """
+
+    index["updated_at"] = datetime.utcnow().isoformat()
+    s3.put_object(Bucket=bucket, Body=json.dumps(index), Key=key_prefix + '/' + INDEX_KEY)
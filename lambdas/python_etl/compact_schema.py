@@ -0,0 +1,94 @@
+import logging
+import pandas as pd
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+MONTH_CATEGORIES = ["January", "February", "March", "April", "May", "June", "July",
+                    "August", "September", "October", "November", "December"]
+
+DAY_OF_WEEK_CATEGORIES = ["Monday", "Tuesday", "Wednesday",
+                          "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def compact_integers(data, columns):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data set with Integer fields
+
+    columns: List, names of the Integer fields to narrow
+
+    Returns
+    ------
+    data: DataFrame, input data with each field cast to the narrowest signed Integer type that holds all of its values
+    """
+
+    for col in columns:
+        data[col] = pd.to_numeric(data[col], downcast="integer")
+
+    return data
+
+
+def compact_covid_data(covid_data):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, output of any transform stage, derived fields are compacted when present
+
+    Returns
+    ------
+    covid_data: DataFrame, input data with a compact schema
+        date: datetime64
+
+        month, day_of_week: Categoricals with calendar ordered categories
+
+        counts, date-diff and *-diff fields: narrowest signed Integer type
+
+        *-log fields: float32
+    """
+
+    covid_data["date"] = pd.to_datetime(covid_data["date"])
+
+    if "month" in covid_data.columns:
+        covid_data["month"] = pd.Categorical(
+            covid_data["month"], categories=MONTH_CATEGORIES, ordered=True)
+
+    if "day_of_week" in covid_data.columns:
+        covid_data["day_of_week"] = pd.Categorical(
+            covid_data["day_of_week"], categories=DAY_OF_WEEK_CATEGORIES, ordered=True)
+
+    integer_columns = [col for col in covid_data.columns
+                       if col in ["cases", "deaths", "recoveries", "date-diff"] or col.endswith("-diff")]
+    covid_data = compact_integers(covid_data, integer_columns)
+
+    for col in covid_data.columns:
+        if col.endswith("-log"):
+            covid_data[col] = covid_data[col].astype("float32")
+
+    return covid_data
+
+
+def log_memory_usage(data, stage):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data set at the end of a pipeline stage
+
+    stage: str, name of the pipeline stage, e.g. "merge_data"
+
+    Returns
+    ------
+    No returns, this function logs the rows, total bytes and bytes per field of the data set
+    """
+
+    usage = data.memory_usage(deep=True, index=True)
+
+    extra_data = {
+        "Stage": stage,
+        "Rows": len(data),
+        "Total Bytes": int(usage.sum()),
+        "Field Bytes": {str(col): int(size) for col, size in usage.items()},
+    }
+    logger.info("Memory usage", extra=dict(data=extra_data))
@@ -0,0 +1,262 @@
+from datetime import datetime
+import json
+import logging
+import pandas as pd
+from json_logger import setup_logging
+from extract_data import open_source, set_county_data_source
+from transform_data import add_new_fields, validate_counts
+from load_data import upload_csv_to_s3
+from partitions import MANIFEST_KEY, read_manifest
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+COUNTY_DTYPES = {"date": str, "county": str, "state": str, "fips": str}
+COUNTY_COUNT_COLUMNS = ["cases", "deaths"]
+COUNTY_KEY_COLUMN = "county_key"
+ANCHOR_COLUMN = "_anchor"
+
+# Starting estimate of the in-memory size of a parsed row with its derived fields, replaced by a measurement after the first chunk
+INITIAL_ROW_BYTES = 600
+
+
+def run_county_pipeline(environment, bucket, prefix, s3, memory_budget_mb=64):
+    """
+    Parameters
+    ----------
+    environment: str in {'production', 'testing'} determines which download URL to use and S3 key name
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    prefix: str, Key prefix that will be used with environment to store the partitioned county data, e.g. "counties"
+
+    s3: s3 Client
+
+    memory_budget_mb: int, approximate peak memory the pipeline may use for data, split between the chunk being
+        processed and the partition buffers waiting to be written
+
+    Returns
+    ------
+    summary: dict, number of rows, counties, partitions and parts written
+
+    The NY Times county level Data is downloaded to a local file in blocks and read from it in chunks.  Each chunk is validated, gets the derived fields of add_new_fields per
+    county and is appended to a buffer per year/month partition.  Diffs across chunk boundaries use the last record of each
+    county from earlier chunks, so the only state kept between chunks is one row per county.  As the source is in date order,
+    a partition is written to S3 as soon as the data moves past its month, or earlier in parts if its buffer outgrows the budget.
+    A manifest of the written parts replaces the previous run's manifest, parts it no longer lists are deleted
+    """
+
+    budget_bytes = memory_budget_mb * 1024 * 1024
+    row_bytes = INITIAL_ROW_BYTES
+
+    writer = PartitionWriter(bucket, environment + '/' + prefix, s3, budget_bytes // 2)
+    carry = None
+    rows = 0
+
+    with open_source(set_county_data_source(environment)) as source:
+        reader = pd.read_csv(source, dtype=COUNTY_DTYPES, iterator=True)
+
+        while True:
+            try:
+                chunk = reader.get_chunk(max(1000, budget_bytes // 2 // row_bytes))
+            except StopIteration:
+                break
+
+            chunk = prepare_county_chunk(chunk)
+            chunk = add_county_fields(chunk, carry)
+            carry = update_carry(carry, chunk)
+
+            if rows == 0:
+                row_bytes = max(1, int(chunk.memory_usage(deep=True).sum() / len(chunk)))
+
+            writer.add(chunk, row_bytes)
+            rows += len(chunk)
+
+        reader.close()
+
+    manifest = writer.close()
+
+    summary = {
+        "Rows": rows,
+        "Counties": 0 if carry is None else len(carry),
+        "Partitions": len(manifest["partitions"]),
+        "Parts": sum(len(partition["parts"]) for partition in manifest["partitions"].values()),
+    }
+    logger.info("County Data Pipeline Complete", extra=dict(data=summary))
+    return summary
+
+
+def prepare_county_chunk(chunk):
+    """
+    Parameters
+    ----------
+    chunk: DataFrame, chunk of NY Times county level Data
+        columns: "date", "county", "state", "fips", "cases", "deaths"
+
+    Returns
+    ------
+    chunk: DataFrame, validated chunk with nullable Integer counts and a county_key field.  Missing counts stay missing,
+        filling them with 0 would show up as false drops and jumps in the diffs.  The key is the fips code, or state and
+        county name for the records the NY Times publishes without one (e.g. "New York City", "Unknown")
+    """
+
+    missing = chunk[COUNTY_COUNT_COLUMNS].isna()
+    if missing.any().any():
+        logger.info("Missing county counts kept as missing",
+                    extra=dict(data={col: int(count) for col, count in missing.sum().items()}))
+
+    # Missing counts are not invalid, only values that are present are validated
+    counts, report = validate_counts(chunk.fillna({col: 0 for col in COUNTY_COUNT_COLUMNS}), COUNTY_COUNT_COLUMNS)
+    if len(report) > 0:
+        logger.error("County count fields contain non-numeric or negative values",
+                     extra=dict(data=report))
+        raise ValueError(f"Invalid count fields: {sorted(report)}")
+
+    chunk = chunk.assign(**{col: counts[col].mask(missing[col]).astype("Int64") for col in COUNTY_COUNT_COLUMNS})
+    chunk[COUNTY_KEY_COLUMN] = chunk["fips"].fillna(chunk["state"] + "|" + chunk["county"])
+
+    return chunk
+
+
+def add_county_fields(chunk, carry):
+    """
+    Parameters
+    ----------
+    chunk: DataFrame, output of prepare_county_chunk
+
+    carry: DataFrame or None, last record of each county seen in earlier chunks, see update_carry
+
+    Returns
+    ------
+    chunk: DataFrame, chunk with the derived fields of add_new_fields computed per county.  The carried records are added
+        in front of the chunk as anchors for the diffs and removed again afterwards
+    """
+
+    chunk = chunk.assign(**{ANCHOR_COLUMN: False})
+
+    if carry is not None:
+        anchors = carry[carry[COUNTY_KEY_COLUMN].isin(chunk[COUNTY_KEY_COLUMN])]
+        chunk = pd.concat([anchors.assign(**{ANCHOR_COLUMN: True}), chunk], ignore_index=True)
+
+    chunk = add_new_fields(chunk, COUNTY_COUNT_COLUMNS, COUNTY_KEY_COLUMN)
+
+    return chunk[~chunk[ANCHOR_COLUMN]].drop(columns=[ANCHOR_COLUMN]).reset_index(drop=True)
+
+
+def update_carry(carry, chunk):
+    """
+    Parameters
+    ----------
+    carry: DataFrame or None, last record of each county seen in earlier chunks
+
+    chunk: DataFrame, chunk with derived fields, see add_county_fields
+
+    Returns
+    ------
+    carry: DataFrame, last record of each county seen so far, with only the fields the diffs need
+    """
+
+    latest = chunk.groupby(COUNTY_KEY_COLUMN, sort=False).tail(1)[
+        [COUNTY_KEY_COLUMN, "date"] + COUNTY_COUNT_COLUMNS]
+
+    if carry is None:
+        return latest.reset_index(drop=True)
+
+    carry = carry[~carry[COUNTY_KEY_COLUMN].isin(latest[COUNTY_KEY_COLUMN])]
+    return pd.concat([carry, latest], ignore_index=True)
+
+
+class PartitionWriter:
+    """
+    Buffers county records per year/month partition and writes them to S3 as numbered csv parts
+        <key_prefix>/year=YYYY/month=MM/part-NNNN.csv
+
+    A partition is flushed once a later month arrives (the source is in date order), or early when all buffers together
+    exceed flush_bytes.  close() flushes what is left, writes the manifest and deletes parts of the previous run's
+    manifest that were not rewritten
+    """
+
+    def __init__(self, bucket, key_prefix, s3, flush_bytes):
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.s3 = s3
+        self.flush_bytes = flush_bytes
+        self.buffers = {}
+        self.buffered_bytes = {}
+        self.partitions = {}
+
+    def add(self, chunk, row_bytes):
+        dates = pd.to_datetime(chunk["date"])
+        partition_names = "year=" + dates.dt.strftime("%Y") + "/month=" + dates.dt.strftime("%m")
+
+        for name, rows in chunk.groupby(partition_names.to_numpy(), sort=True):
+            self.buffers.setdefault(name, []).append(rows)
+            self.buffered_bytes[name] = self.buffered_bytes.get(name, 0) + len(rows) * row_bytes
+
+        latest = partition_names.max()
+        for name in sorted(self.buffers):
+            if name < latest:
+                self.flush(name)
+
+        while sum(self.buffered_bytes.values()) > self.flush_bytes and len(self.buffers) > 0:
+            self.flush(max(self.buffered_bytes, key=self.buffered_bytes.get))
+
+    def flush(self, name):
+        data = pd.concat(self.buffers.pop(name), ignore_index=True)
+        del self.buffered_bytes[name]
+
+        partition = self.partitions.setdefault(name, {"rows": 0, "parts": []})
+        part_key = f"{name}/part-{len(partition['parts']):04d}.csv"
+
+        upload_csv_to_s3(data.drop(columns=[COUNTY_KEY_COLUMN]), self.bucket, self.key_prefix + '/' + part_key, self.s3)
+
+        partition["rows"] += len(data)
+        partition["parts"].append(part_key)
+
+    def close(self):
+        for name in sorted(self.buffers):
+            self.flush(name)
+
+        previous_manifest = read_manifest(self.bucket, self.key_prefix, self.s3)
+
+        manifest = {
+            "updated_at": datetime.utcnow().isoformat(),
+            "partitions": self.partitions,
+        }
+        self.s3.put_object(Bucket=self.bucket, Body=json.dumps(manifest),
+                           Key=self.key_prefix + '/' + MANIFEST_KEY)
+
+        if previous_manifest is not None:
+            delete_stale_parts(self.bucket, self.key_prefix, previous_manifest, manifest, self.s3)
+
+        return manifest
+
+
+def delete_stale_parts(bucket, key_prefix, previous_manifest, manifest, s3):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the partitioned data set including the environment
+
+    previous_manifest: dict, manifest replaced by this run
+
+    manifest: dict, manifest written by this run
+
+    s3: s3 Client
+
+    Returns
+    ------
+    No returns, this function deletes the parts listed only in the previous manifest
+    """
+
+    current_parts = {part for partition in manifest["partitions"].values() for part in partition["parts"]}
+    stale_parts = [part for partition in previous_manifest["partitions"].values()
+                   for part in partition["parts"] if part not in current_parts]
+
+    # delete_objects accepts at most 1000 keys per request
+    for i in range(0, len(stale_parts), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key_prefix + '/' + part} for part in stale_parts[i:i + 1000]]
+        })
@@ -0,0 +1,102 @@
+import logging
+import numpy as np
+import pandas as pd
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def set_date_index(data, dates, source):
+    """
+    Parameters
+    ----------
+    data: DataFrame or Series, daily time series
+
+    dates: array-like, YYYY-MM-DD dates aligned with the rows of data
+
+    source: str, name of the data set used in the log, e.g. "NY Times"
+
+    Returns
+    ------
+    data: DataFrame or Series, data indexed by a DatetimeIndex named "date" in ascending order.  The order is checked
+        once here, the sources are published in date order so the sort only runs if that ever changes
+    """
+
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(dates), format=DATE_FORMAT), name="date")
+    data = data.set_axis(index)
+
+    if not index.is_monotonic_increasing:
+        logger.info(f"{source} dates are not in ascending order, sorting")
+        data = data.sort_index(kind="stable")
+
+    return data
+
+
+def format_date_index(index):
+    """
+    Parameters
+    ----------
+    index: DatetimeIndex
+
+    Returns
+    ------
+    dates: ndarray, dates as YYYY-MM-DD text
+    """
+
+    return index.strftime(DATE_FORMAT).to_numpy(dtype=object)
+
+
+def date_ranges(dates):
+    """
+    Parameters
+    ----------
+    dates: DatetimeIndex or array-like of YYYY-MM-DD dates
+
+    Returns
+    ------
+    ranges: List, consecutive runs of the dates as [first, last] YYYY-MM-DD pairs, e.g. [["2020-01-21", "2020-01-21"], ["2023-03-10", "2023-03-23"]]
+    """
+
+    dates = pd.DatetimeIndex(pd.to_datetime(np.asarray(dates), format=DATE_FORMAT)).unique().sort_values()
+    if len(dates) == 0:
+        return []
+
+    days = dates.to_numpy().astype("datetime64[D]").astype("int64")
+    breaks = np.flatnonzero(np.diff(days) != 1) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks - 1, [len(dates) - 1]])
+
+    text = format_date_index(dates)
+    return [[text[start], text[end]] for start, end in zip(starts, ends)]
+
+
+def report_missing_dates(missing, message):
+    """
+    Parameters
+    ----------
+    missing: dict, dates of each source that the other side of a join does not have, keyed by source name
+
+    message: str, log message describing the join
+
+    Returns
+    ------
+    report: dict, number of missing dates and their consecutive ranges per source, only sources with missing dates.
+        Logged with message when not empty
+        e.g. {"NY Times": {"count": 1, "ranges": [["2020-01-21", "2020-01-21"]]}}
+    """
+
+    report = {
+        source: {
+            "count": len(dates),
+            "ranges": date_ranges(dates),
+        }
+        for source, dates in missing.items() if len(dates) > 0
+    }
+
+    if len(report) > 0:
+        logger.info(message, extra=dict(data=report))
+
+    return report
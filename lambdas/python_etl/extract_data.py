@@ -1,13 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
+import gzip
+import hashlib
+from io import BytesIO
+import json
 import logging
 import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
 import pandas as pd
 from json_logger import setup_logging
+from storage_keys import snapshot_key
+from partitions import read_partitions
+from local_cache import CACHE_ENABLED, cache_key, get_cached, get_cached_metadata, move_to_cache, open_cached, put_cached
 
 setup_logging(logging.INFO)
 logger = logging.getLogger()
 
+SOURCE_VALIDATORS_KEY = "source_validators.json"
+HTTP_TIMEOUT = 30
 
-def extract_data(environment, bucket, key, s3):
+# Downloads are copied to disk in blocks of this size, so a response body is never held in memory as a whole
+DOWNLOAD_BLOCK_BYTES = 1024 * 1024
+
+# End of a downloaded file read to find its last row, doubled until the block holds a whole row
+LAST_ROW_BLOCK_BYTES = 64 * 1024
+
+JH_COLUMNS = ["Date", "Country/Region", "Recovered"]
+JH_DTYPES = {"Date": str, "Country/Region": str, "Recovered": "float64"}
+JH_CHUNK_SIZE = 50000
+
+STATE_DTYPES = {"date": str, "state": str, "fips": str}
+
+TAIL_STATE_PREFIX = "sources/"
+TAIL_FULL_FETCH_DAYS = 7
+
+
+def extract_data(environment, bucket, key, s3, concurrent=False, validators=None, incremental=False, partition_prefix=None,
+                 tail_updates=None):
     """
     Parameters
     ----------
@@ -19,43 +54,717 @@ def extract_data(environment, bucket, key, s3):
 
     s3: s3 Client 
 
+    concurrent: bool, when True the NY Times, Johns Hopkins and previous data fetches run at the same time in a thread pool
+
+    validators: dict or None, ETag/Last-Modified values of each source from the previous run, see load_source_validators.
+        When given, the downloads are conditional GETs and the dict is updated in place with the values of this run
+
+    incremental: bool, when True the append-only NY Times Data is fetched with a Range request for the bytes added since the
+        previous run, see fetch_appended
+
+    tail_updates: dict or None, filled in place with the copy and tail state of each incrementally fetched source.  Nothing is
+        written during extract, pass the dict to save_source_validators after a successful load to keep them for the next run,
+        and to discard_tail_updates in any case to remove the temporary copies
+
+    partition_prefix: str or None, Key prefix of the data set partitioned by month, e.g. "data".  When given, the previous
+        data is read from the partitions in parallel, see partitions.read_partitions
+
     Returns
     ------
-    ny_times_data: DataFrame, downloaded NY Times Data
+    ny_times_data: DataFrame or None, downloaded NY Times Data.  None if neither source changed since the previous run
 
-    jh_data: DataFrame, downloaded Johns Hopkins Data
+    jh_data: DataFrame or None, downloaded Johns Hopkins Data.  None if neither source changed since the previous run
 
     prev_data: DataFrame or None, previous day's/run's data retrieved from s3 Bucket.  On initial load of data, this will be None
     """
 
     ny_times_url, jh_data_url = set_data_sources(environment)
 
+    source_urls = {
+        "ny_times": ny_times_url,
+        "johns_hopkins": jh_data_url,
+    }
+
+    error_messages = {
+        "ny_times": "Error downloading NY Times dataset",
+        "johns_hopkins": "Error downloading Johns Hopkins dataset",
+        "previous_data": f"Error retrieving previous data from s3 Bucket: {bucket}",
+    }
+
+    source_readers = {
+        "ny_times": pd.read_csv,
+        "johns_hopkins": read_jh_data,
+    }
+
+    tail_stores = {
+        "ny_times": (bucket, environment + '/' + TAIL_STATE_PREFIX + "ny_times", s3) if incremental else None,
+        "johns_hopkins": None,
+    }
+
+    if tail_updates is None:
+        tail_updates = {}
+
+    sources = [
+        (name, partial(read_source, name, url, validators, source_readers[name], tail_stores[name], tail_updates),
+         error_messages[name])
+        for name, url in source_urls.items()
+    ]
+    sources.append(
+        ("previous_data", partial(extract_previous_data, bucket, environment + '/' + key, s3,
+                                  None if partition_prefix is None else environment + '/' + partition_prefix),
+         error_messages["previous_data"])
+    )
+
+    if concurrent:
+        results, latencies = fetch_sources_concurrently(sources)
+    else:
+        results, latencies = fetch_sources_sequentially(sources)
+
+    prev_data = results["previous_data"]
+
+    unchanged_sources = [
+        name for name in source_urls if results[name] is None]
+
+    if len(unchanged_sources) == len(source_urls) and prev_data is not None:
+        logger.info("Source data unchanged since previous run",
+                    extra=dict(data={"Latency Seconds": latencies}))
+        return None, None, prev_data
+
+    # A partial change (or a missing previous data set) still needs the full copy of the unchanged source(s)
+    for name in unchanged_sources:
+        results[name], latencies[name] = fetch_source(
+            name, partial(read_source, name, source_urls[name], None, source_readers[name], tail_stores[name], tail_updates),
+            error_messages[name])
+
+    ny_times_data = results["ny_times"]
+    jh_data = results["johns_hopkins"]
+
+    if len(ny_times_data) == 0 or len(jh_data) == 0:
+        logger.error(
+            "Error with downloaded data sets, one or more data sets are empty")
+        raise
+
+    extra_data = {
+        "Concurrent": concurrent,
+        "Conditional": validators is not None,
+        "Incremental": incremental,
+        "Latency Seconds": latencies
+    }
+    logger.info("Data extracted successfully", extra=dict(data=extra_data))
+    return ny_times_data, jh_data, prev_data
+
+
+def read_source(name, url, validators, reader=pd.read_csv, tail_store=None, tail_updates=None):
+    """
+    Parameters
+    ----------
+    name: str, name of the data source, used as key in validators
+
+    url: str, download source of the data set
+
+    validators: dict or None, ETag/Last-Modified values of each source from the previous run, updated in place.
+        If None, the source is downloaded unconditionally
+
+    reader: function, parses the downloaded file, opened for reading, into a DataFrame, e.g. pd.read_csv or read_jh_data
+
+    tail_store: tuple or None, (bucket, key prefix, s3 Client) where the copy of an append-only source is kept, see fetch_appended.
+        If given, the source is fetched incrementally and validators are not used
+
+    tail_updates: dict or None, the pending copy and tail state of an incrementally fetched source are added to it under name,
+        their temporary files are removed by discard_tail_updates
+
+    Returns
+    ------
+    data: DataFrame or None, downloaded data set.  None if validators are given and the source is unchanged since the previous run
+
+    A copy of the source in the local cache is revalidated with its own ETag/Last-Modified, so a retry on a warm container after
+    a failed run, which saved no validators, gets a 304 and parses the cached copy instead of downloading the source again
+    """
+
+    if tail_store is not None:
+        path, changed, tail_update = fetch_appended(url, *tail_store)
+        keep = tail_update is not None and tail_updates is not None
+        if keep:
+            # A source fetched again in the same run replaces the copy of the first fetch
+            discard_tail_updates({name: tail_updates[name]} if name in tail_updates else {})
+            tail_updates[name] = tail_update
+
+        try:
+            if validators is not None and not changed:
+                return None
+            with open(path, "rb") as source:
+                return reader(source)
+        finally:
+            if not keep:
+                os.remove(path)
+
+    if validators is None:
+        with open_source(url) as source:
+            return reader(source)
+
+    previous_validator = validators.get(name)
+    if previous_validator is not None and previous_validator.get("url") != url:
+        previous_validator = None
+
+    key = cache_key("source", url)
+    cached_file = open_cached(key, url)
+    cached_validator = get_cached_metadata(key) if cached_file is not None else None
+
+    if cached_file is not None and (cached_validator is None or cached_validator.get("url") != url):
+        cached_file.close()
+        cached_file = None
+
     try:
-        ny_times_data = pd.read_csv(ny_times_url)
+        download_path, validator = conditional_get(url, previous_validator if cached_file is None else cached_validator)
     except:
-        logger.error("Error downloading NY Times dataset")
+        if cached_file is not None:
+            cached_file.close()
         raise
 
+    if download_path is not None:
+        if cached_file is not None:
+            cached_file.close()
+        validators[name] = validator
+        with local_source(url, download_path, validator) as source:
+            return reader(source)
+
+    if cached_file is None:
+        validators[name] = previous_validator
+        return None
+
+    with cached_file:
+        if same_version(cached_validator, previous_validator):
+            validators[name] = previous_validator
+            return None
+
+        logger.info("Source unchanged since it was cached, reading cached copy", extra=dict(data={"Source": name}))
+        validators[name] = cached_validator
+        return reader(cached_file)
+
+
+def same_version(validator, other):
+    """
+    Parameters
+    ----------
+    validator: dict or None, "url", "ETag" and "Last-Modified" values of a download
+
+    other: dict or None, "url", "ETag" and "Last-Modified" values of a download
+
+    Returns
+    ------
+    same: bool, True if both identify the same version of the same source
+    """
+
+    if validator is None or other is None:
+        return False
+
+    return all(validator.get(field) == other.get(field) for field in ("url", "ETag", "Last-Modified"))
+
+
+@contextmanager
+def open_source(url):
+    """
+    Parameters
+    ----------
+    url: str, download source of the data set
+
+    Returns
+    ------
+    source: file object, context manager yielding a local copy of the source opened for reading, see local_source.
+        A copy in the local cache is used as is
+    """
+
+    cached_file = open_cached(cache_key("source", url), url)
+    if cached_file is not None:
+        with cached_file:
+            yield cached_file
+        return
+
+    with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as response:
+        validator = {"url": url, "ETag": response.headers.get("ETag"), "Last-Modified": response.headers.get("Last-Modified")}
+        download_path = download_to_temp_file(response)
+
+    with local_source(url, download_path, validator) as source:
+        yield source
+
+
+@contextmanager
+def local_source(url, download_path, validator=None):
+    """
+    Parameters
+    ----------
+    url: str, download source of the data set
+
+    download_path: str, temporary file holding the downloaded source, see download_to_temp_file
+
+    validator: dict or None, "url", "ETag" and "Last-Modified" values of the download, cached with it for revalidation
+
+    Returns
+    ------
+    source: file object, context manager yielding the downloaded source opened for reading.  The file is moved into the local
+        cache if it is enabled and the file fits, otherwise the temporary file is used and removed on exit.  Readers parse the
+        file in chunks from disk, so peak memory does not depend on the size of the source
+    """
+
     try:
-        jh_data = pd.read_csv(jh_data_url)
+        source = move_to_cache(cache_key("source", url), download_path, validator) or open(download_path, "rb")
+        with source:
+            yield source
+    finally:
+        if os.path.exists(download_path):
+            os.remove(download_path)
+
+
+def download_to_temp_file(*responses):
+    """
+    Parameters
+    ----------
+    responses: file-like objects, HTTP responses or S3 object bodies of a download, copied one after the other
+
+    Returns
+    ------
+    path: str, temporary file the response bodies were copied to in blocks of DOWNLOAD_BLOCK_BYTES.  The caller removes it
+    """
+
+    download = tempfile.NamedTemporaryFile(suffix=".download", delete=False)
+
+    try:
+        with download:
+            for response in responses:
+                shutil.copyfileobj(response, download, DOWNLOAD_BLOCK_BYTES)
     except:
-        logger.error("Error downloading Johns Hopking dataset")
+        os.remove(download.name)
         raise
 
-    if len(ny_times_data) == 0 or len(jh_data) == 0:
-        logger.error(
-            "Error with downloaded data sets, one or more data sets are empty")
+    return download.name
+
+
+def read_jh_data(source, chunksize=JH_CHUNK_SIZE):
+    """
+    Parameters
+    ----------
+    source: str or file-like object, Johns Hopkins Data download source or downloaded bytes
+
+    chunksize: int, number of rows parsed at a time
+
+    Returns
+    ------
+    jh_data: DataFrame, Johns Hopkins Data limited to US records and the Date, Country/Region and Recovered fields
+
+    The file is parsed in chunks and each chunk is filtered to US records before the next is read, so peak memory
+    depends on the number of US rows rather than the size of the global data set
+    """
+
+    chunks = pd.read_csv(source, usecols=JH_COLUMNS,
+                         dtype=JH_DTYPES, chunksize=chunksize)
+
+    jh_data = pd.concat(
+        (chunk[chunk["Country/Region"] == "US"] for chunk in chunks), ignore_index=True)
+
+    return jh_data
+
+
+def conditional_get(url, validator=None):
+    """
+    Parameters
+    ----------
+    url: str, download source of the data set
+
+    validator: dict or None, "url", "ETag" and "Last-Modified" values saved from the previous download of this url
+
+    Returns
+    ------
+    path: str or None, temporary file holding the response body, copied in blocks, see download_to_temp_file.
+        None if the server responded 304 Not Modified
+
+    validator: dict, "url", "ETag" and "Last-Modified" values to send on the next download of this url
+    """
+
+    request = urllib.request.Request(url)
+    if validator is not None:
+        if validator.get("ETag"):
+            request.add_header("If-None-Match", validator["ETag"])
+        if validator.get("Last-Modified"):
+            request.add_header("If-Modified-Since", validator["Last-Modified"])
+
+    try:
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            headers = response.headers
+            path = download_to_temp_file(response)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, validator
         raise
-    
+
+    new_validator = {
+        "url": url,
+        "ETag": headers.get("ETag"),
+        "Last-Modified": headers.get("Last-Modified"),
+    }
+
+    return path, new_validator
+
+
+def fetch_appended(url, bucket, key, s3):
+    """
+    Parameters
+    ----------
+    url: str, download source of an append-only data set
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key prefix of the copy of the source (key + ".csv") and its tail state (key + ".json") in the S3 bucket
+
+    s3: s3 Client 
+
+    Returns
+    ------
+    path: str, temporary file holding the full contents of the source, written in blocks.  The caller removes it, unless it is
+        kept for tail_update, see discard_tail_updates
+
+    changed: bool, False if the source is identical to the copy saved by the previous run
+
+    tail_update: dict or None, "key", "path" and "state" of the new copy and tail state, path is the returned file.  None if
+        they are unchanged.  They are not written here, save_source_validators writes them once the run has loaded its data,
+        so a failed run fetches the same bytes again instead of finding them already in the copy
+
+    Only the bytes from the start of the previously last row onward are requested, and the saved copy is streamed from S3 in
+    front of them.  If that row no longer matches, the server ignores the Range header or the saved state is older than
+    TAIL_FULL_FETCH_DAYS, the full file is downloaded instead.  Neither the source nor the copy is held in memory as a whole,
+    but a changed run still reads and writes a full copy of the source in S3.
+
+    A tail fetch only checks the last row, revisions to earlier rows (the NY Times revises past days now and then) are not
+    seen until the next full download.  The data set can therefore lag behind such revisions for up to TAIL_FULL_FETCH_DAYS
+    """
+
+    state = None
+    previous_length = None
     try:
-        prev_data = extract_previous_data(bucket, environment + '/' + key, s3)
+        res = s3.get_object(Bucket=bucket, Key=key + ".json")
+        state = json.loads(res["Body"].read())
+        previous_length = s3.head_object(Bucket=bucket, Key=key + ".csv")["ContentLength"]
     except:
-        logger.error(
-            f"Error retrieving previous data from s3 Bucket: {bucket}")
+        state = None
+
+    path = None
+    if state is not None and is_tail_state_valid(state, url, previous_length):
+        path = fetch_tail(url, bucket, key, s3, state)
+
+    mode = "tail"
+    if path is None:
+        mode = "full"
+        with urllib.request.urlopen(url, timeout=HTTP_TIMEOUT) as response:
+            path = download_to_temp_file(response)
+
+    length = os.path.getsize(path)
+    digest = file_sha256(path)
+    changed = state is None or state.get("sha256") != digest
+
+    tail_update = None
+    if changed or mode == "full":
+        last_row = read_last_row(path)
+        new_state = {
+            "url": url,
+            "length": length,
+            "sha256": digest,
+            "last_row_length": len(last_row),
+            "last_row_sha256": hashlib.sha256(last_row).hexdigest(),
+            "full_fetch_at": state["full_fetch_at"] if mode == "tail" else datetime.utcnow().isoformat(),
+        }
+        tail_update = {"key": key, "path": path, "state": new_state}
+
+    extra_data = {
+        "url": url,
+        "mode": mode,
+        "changed": changed,
+        "downloaded_bytes": length if mode == "full" else length - previous_length + state["last_row_length"],
+    }
+    logger.info("Append-only source fetched", extra=dict(data=extra_data))
+    return path, changed, tail_update
+
+
+def is_tail_state_valid(state, url, previous_length):
+    """
+    Parameters
+    ----------
+    state: dict, tail state saved by fetch_appended
+
+    url: str, download source of the append-only data set
+
+    previous_length: int or None, size of the copy of the source saved by the previous run
+
+    Returns
+    ------
+    valid: bool, True if the state belongs to this url, matches the saved copy and is recent enough for a tail fetch
+    """
+
+    if previous_length is None or state.get("url") != url or state.get("length") != previous_length:
+        return False
+
+    full_fetch_at = datetime.fromisoformat(state["full_fetch_at"])
+    return datetime.utcnow() - full_fetch_at < timedelta(days=TAIL_FULL_FETCH_DAYS)
+
+
+def fetch_tail(url, bucket, key, s3, state):
+    """
+    Parameters
+    ----------
+    url: str, download source of the append-only data set
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key prefix of the copy of the source saved by the previous run, see fetch_appended
+
+    s3: s3 Client 
+
+    state: dict, tail state saved by fetch_appended
+
+    Returns
+    ------
+    path: str or None, temporary file holding the previous copy with the new bytes appended.  None if the tail does not line
+        up with the previous copy
+    """
+
+    last_row_length = state["last_row_length"]
+    start = state["length"] - last_row_length
+
+    request = urllib.request.Request(url)
+    request.add_header("Range", f"bytes={start}-")
+
+    try:
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            if response.status != 206:
+                return None
+
+            if hashlib.sha256(response.read(last_row_length)).hexdigest() != state["last_row_sha256"]:
+                logger.info("Last row of append-only source changed, falling back to full download",
+                            extra=dict(data={"url": url}))
+                return None
+
+            previous_copy = s3.get_object(Bucket=bucket, Key=key + ".csv")["Body"]
+            return download_to_temp_file(previous_copy, response)
+    except urllib.error.HTTPError as e:
+        # 416, the file is now shorter than the previous copy, so it was not only appended to
+        if e.code == 416:
+            return None
         raise
 
-    logger.info("Data extracted successfully")
-    return ny_times_data, jh_data, prev_data
+
+def get_last_row(body):
+    """
+    Parameters
+    ----------
+    body: bytes, contents of a csv file
+
+    Returns
+    ------
+    last_row: bytes, last line of the file including its line terminator, if any
+    """
+
+    return body[body.rstrip(b"\r\n").rfind(b"\n") + 1:]
+
+
+def read_last_row(path):
+    """
+    Parameters
+    ----------
+    path: str, csv file
+
+    Returns
+    ------
+    last_row: bytes, last line of the file including its line terminator, see get_last_row.  Only the end of the file is read
+    """
+
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        block_bytes = LAST_ROW_BLOCK_BYTES
+
+        while True:
+            start = max(0, size - block_bytes)
+            f.seek(start)
+            tail = f.read()
+            last_row = get_last_row(tail)
+            if start == 0 or len(last_row) < len(tail):
+                return last_row
+            block_bytes *= 2
+
+
+def file_sha256(path):
+    """
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    ------
+    digest: str, hex SHA-256 of the file contents, read in blocks of DOWNLOAD_BLOCK_BYTES
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(partial(f.read, DOWNLOAD_BLOCK_BYTES), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def discard_tail_updates(tail_updates):
+    """
+    Parameters
+    ----------
+    tail_updates: dict, copies and tail states of the incrementally fetched sources, as filled by extract_data
+
+    Returns
+    ------
+    No returns, this function removes the temporary files of the copies.  Call it once the run is over, saved or not
+    """
+
+    for tail_update in tail_updates.values():
+        if os.path.exists(tail_update["path"]):
+            os.remove(tail_update["path"])
+
+
+def load_source_validators(environment, bucket, s3):
+    """
+    Parameters
+    ----------
+    environment: str in {'production', 'testing'} determines S3 key name (prefix)
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    s3: s3 Client 
+
+    Returns
+    ------
+    validators: dict, ETag/Last-Modified values of each source saved by the previous run.  Empty if none were saved
+    """
+
+    try:
+        res = s3.get_object(
+            Bucket=bucket, Key=environment + '/' + SOURCE_VALIDATORS_KEY)
+        validators = json.loads(res["Body"].read())
+    except:
+        return {}
+
+    return validators
+
+
+def save_source_validators(environment, bucket, validators, s3, tail_updates=None):
+    """
+    Parameters
+    ----------
+    environment: str in {'production', 'testing'} determines S3 key name (prefix)
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    validators: dict or None, ETag/Last-Modified values of each source, as updated by extract_data
+
+    s3: s3 Client 
+
+    tail_updates: dict or None, copies and tail states of the incrementally fetched sources, as filled by extract_data
+
+    Returns
+    ------
+    No returns, this function writes the validators to s3 as a json file, and the copy and tail state of each incrementally
+    fetched source.  It should only be called after a successful load, otherwise a failed run would mark the sources as
+    already processed
+    """
+
+    for tail_update in (tail_updates or {}).values():
+        # The copy goes first, a state written without its copy would not match the copy's length and is ignored
+        with open(tail_update["path"], "rb") as body:
+            s3.put_object(Bucket=bucket, Body=body, Key=tail_update["key"] + ".csv")
+        s3.put_object(Bucket=bucket, Body=json.dumps(tail_update["state"]), Key=tail_update["key"] + ".json")
+
+    if validators is not None:
+        s3.put_object(Bucket=bucket, Body=json.dumps(validators),
+                      Key=environment + '/' + SOURCE_VALIDATORS_KEY)
+
+
+def fetch_source(name, fetch, error_message):
+    """
+    Parameters
+    ----------
+    name: str, name of the data source, used as key in the latency report
+
+    fetch: function, no argument function that downloads/retrieves the data source
+
+    error_message: str, message logged if the fetch fails
+
+    Returns
+    ------
+    data: DataFrame or None, output of the fetch function
+
+    latency: float, seconds taken by the fetch function
+    """
+
+    start = time.perf_counter()
+    try:
+        data = fetch()
+    except:
+        logger.error(error_message)
+        raise
+
+    return data, round(time.perf_counter() - start, 3)
+
+
+def fetch_sources_sequentially(sources):
+    """
+    Parameters
+    ----------
+    sources: List, list of (name, fetch, error_message) tuples, see fetch_source
+
+    Returns
+    ------
+    results: dict, source name to fetched data
+
+    latencies: dict, source name to seconds taken by each fetch
+    """
+
+    results = {}
+    latencies = {}
+    for name, fetch, error_message in sources:
+        results[name], latencies[name] = fetch_source(
+            name, fetch, error_message)
+
+    return results, latencies
+
+
+def fetch_sources_concurrently(sources):
+    """
+    Parameters
+    ----------
+    sources: List, list of (name, fetch, error_message) tuples, see fetch_source
+
+    Returns
+    ------
+    results: dict, source name to fetched data
+
+    latencies: dict, source name to seconds taken by each fetch
+
+    The first failing fetch is re-raised straight away, the executor is not waited on so the remaining fetches are abandoned
+    """
+
+    executor = ThreadPoolExecutor(max_workers=len(sources))
+    futures = {
+        executor.submit(fetch_source, name, fetch, error_message): name
+        for name, fetch, error_message in sources
+    }
+
+    results = {}
+    latencies = {}
+    try:
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name], latencies[name] = future.result()
+    except:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+        raise
+
+    executor.shutdown(wait=True)
+    return results, latencies
 
 
 def set_data_sources(environment):
@@ -85,7 +794,114 @@ def set_data_sources(environment):
     return ny_times_url, jh_data_url
 
 
-def extract_previous_data(bucket, key, s3):
+def extract_state_data(environment, bucket, key, s3, concurrent=False):
+    """
+    Parameters
+    ----------
+    environment: str in {'production', 'testing'} determines which download URL to use and S3 key name
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key of the state level csv file in S3 bucket, used to retrieve previous day's/run's state level data
+
+    s3: s3 Client 
+
+    concurrent: bool, when True the NY Times and previous data fetches run at the same time in a thread pool
+
+    Returns
+    ------
+    states_data: DataFrame, downloaded NY Times state level Data
+
+    prev_data: DataFrame or None, previous day's/run's state level data retrieved from s3 Bucket.  On initial load of data, this will be None
+    """
+
+    states_url = set_state_data_source(environment)
+
+    sources = [
+        ("ny_times_states", partial(read_source, "ny_times_states", states_url, None, read_state_data),
+         "Error downloading NY Times state dataset"),
+        ("previous_data", partial(extract_previous_data, bucket, environment + '/' + key, s3),
+         f"Error retrieving previous state data from s3 Bucket: {bucket}"),
+    ]
+
+    if concurrent:
+        results, latencies = fetch_sources_concurrently(sources)
+    else:
+        results, latencies = fetch_sources_sequentially(sources)
+
+    states_data = results["ny_times_states"]
+
+    if len(states_data) == 0:
+        logger.error("Error with downloaded state data set, data set is empty")
+        raise Exception
+
+    extra_data = {
+        "Concurrent": concurrent,
+        "Latency Seconds": latencies
+    }
+    logger.info("State data extracted successfully", extra=dict(data=extra_data))
+    return states_data, results["previous_data"]
+
+
+def read_state_data(source):
+    """
+    Parameters
+    ----------
+    source: str or file-like object, NY Times state level Data download source or downloaded bytes
+
+    Returns
+    ------
+    states_data: DataFrame, NY Times state level Data, fips is kept as text so leading zeros are preserved
+    """
+
+    return pd.read_csv(source, dtype=STATE_DTYPES)
+
+
+def set_state_data_source(environment):
+    """
+    Parameters
+    ----------
+    environment: str in {'production', 'testing'} determines which download URL to use
+
+    Returns
+    ------
+    states_url: str, NY Times state level Data download source
+    """
+
+    if environment == "production":
+        states_url = os.environ["PROD_NYT_STATES_URL"]
+    elif environment == "testing":
+        states_url = os.environ["TEST_NYT_STATES_URL"]
+    else:
+        logger.error("Invalid environment")
+        raise Exception
+
+    return states_url
+
+
+def set_county_data_source(environment):
+    """
+    Parameters
+    ----------
+    environment: str in {'production', 'testing'} determines which download URL to use
+
+    Returns
+    ------
+    counties_url: str, NY Times county level Data download source
+    """
+
+    if environment == "production":
+        counties_url = os.environ["PROD_NYT_COUNTIES_URL"]
+    elif environment == "testing":
+        counties_url = os.environ["TEST_NYT_COUNTIES_URL"]
+    else:
+        logger.error("Invalid environment")
+        raise Exception
+
+    return counties_url
+
+
+def extract_previous_data(bucket, key, s3, partition_prefix=None):
     """
     Parameters
     ----------
@@ -95,16 +911,123 @@ def extract_previous_data(bucket, key, s3):
 
     s3: s3 Client 
 
+    partition_prefix: str or None, full Key prefix of the data set partitioned by month
+
     Returns
     ------
     prev_data: DataFrame or None, previous day's/run's data retrieved from s3 Bucket.  On initial load of data, this will be None
+
+    The partitions are preferred if a prefix is given, then the typed Parquet snapshot written by the load step.  The csv file
+    is only parsed if neither is usable, e.g. on the first run after switching layouts
+    """
+
+    if partition_prefix is not None:
+        try:
+            prev_data = read_partitions(bucket, partition_prefix, s3, pd.read_parquet)
+        except:
+            logger.warning("Error reading previous data partitions, falling back to snapshot",
+                           extra=dict(data={"Prefix": partition_prefix}))
+            prev_data = None
+
+        if prev_data is not None:
+            return prev_data
+
+    try:
+        prev_data = read_s3_object(bucket, snapshot_key(key), s3, pd.read_parquet)
+    except:
+        logger.warning("Error reading previous data snapshot, falling back to csv",
+                       extra=dict(data={"Key": snapshot_key(key)}))
+        prev_data = None
+
+    if prev_data is None:
+        prev_data = read_s3_object(bucket, key, s3, pd.read_csv)
+
+    return prev_data
+
+
+def extract_previous_metrics(bucket, key, s3):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, full Key of the metrics csv file in S3 bucket
+
+    s3: s3 Client 
+
+    Returns
+    ------
+    prev_metrics: DataFrame or None, previous run's rolling window metrics, see metrics.compute_metrics.  None if they do not exist
+        or cannot be read, the metrics are then computed for the whole history
     """
 
     try:
-        res = s3.get_object(Bucket=bucket, Key=key)
-        prev_data = pd.read_csv(res["Body"])
+        return read_s3_object(bucket, key, s3, partial(pd.read_csv, dtype={"date": str}))
     except:
+        logger.warning("Error reading previous metrics, computing all metrics",
+                       extra=dict(data={"Key": key}))
         return None
 
-    return prev_data
-    
\ No newline at end of file
+
+def read_s3_object(bucket, key, s3, reader):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, full Key of the object in S3 bucket
+
+    s3: s3 Client 
+
+    reader: function, parses a file-like object into a DataFrame, e.g. pd.read_csv or pd.read_parquet
+
+    Returns
+    ------
+    data: DataFrame or None, parsed object.  None if the object does not exist
+
+    With local caching enabled the object's ETag is checked first, so a warm container only downloads it again after a new load
+    """
+
+    if not CACHE_ENABLED:
+        try:
+            res = s3.get_object(Bucket=bucket, Key=key)
+            body = res["Body"].read()
+        except:
+            return None
+
+        return reader(open_body(body))
+
+    try:
+        etag = s3.head_object(Bucket=bucket, Key=key)["ETag"]
+    except:
+        return None
+
+    cache_entry = cache_key("s3", bucket, key, etag)
+    body = get_cached(cache_entry, f"s3://{bucket}/{key}")
+
+    if body is None:
+        try:
+            res = s3.get_object(Bucket=bucket, Key=key, IfMatch=etag)
+            body = res["Body"].read()
+        except:
+            return None
+        put_cached(cache_entry, body)
+
+    return reader(open_body(body))
+
+
+def open_body(body):
+    """
+    Parameters
+    ----------
+    body: bytes, contents of an S3 object
+
+    Returns
+    ------
+    file: file-like object, reads the contents, decompressed if the object was stored gzip compressed by upload_data_to_s3
+    """
+
+    if body[:2] == b"\x1f\x8b":
+        return gzip.GzipFile(fileobj=BytesIO(body))
+
+    return BytesIO(body)
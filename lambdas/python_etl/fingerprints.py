@@ -0,0 +1,83 @@
+import pandas as pd
+
+FINGERPRINT_COLUMN = "fingerprint"
+
+
+def compute_fingerprints(data, value_columns, key_columns=("date",)):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data set with the key and value fields
+
+    value_columns: List, names of the Integer fields a change is detected on, e.g. "cases", "deaths", "recoveries"
+
+    key_columns: tuple, names of the fields identifying a record, e.g. "date"
+
+    Returns
+    ------
+    fingerprints: Series, uint64 hash of the value fields of each record, indexed by the key fields as text.
+        Values are cast to int64 first so the hash does not depend on how the counts were stored
+    """
+
+    values = data[value_columns].astype("int64")
+    fingerprints = pd.util.hash_pandas_object(values, index=False)
+
+    if len(key_columns) == 1:
+        index = pd.Index(data[key_columns[0]].astype(str))
+    else:
+        index = pd.MultiIndex.from_frame(data[list(key_columns)].astype(str))
+
+    return pd.Series(fingerprints.to_numpy(), index=index, name=FINGERPRINT_COLUMN)
+
+
+def stored_fingerprints(prev_data, value_columns, key_columns=("date",)):
+    """
+    Parameters
+    ----------
+    prev_data: DataFrame, previous day's/run's data, with a fingerprint field if it was read from the Parquet snapshot
+
+    value_columns: List, names of the Integer fields a change is detected on
+
+    key_columns: tuple, names of the fields identifying a record
+
+    Returns
+    ------
+    fingerprints: Series, uint64 fingerprints of the previous data indexed by the key fields as text, see compute_fingerprints.
+        Taken from the stored fingerprint field when present, otherwise computed from the value fields
+    """
+
+    if FINGERPRINT_COLUMN not in prev_data.columns:
+        return compute_fingerprints(prev_data, value_columns, key_columns)
+
+    if len(key_columns) == 1:
+        index = pd.Index(prev_data[key_columns[0]].astype(str))
+    else:
+        index = pd.MultiIndex.from_frame(prev_data[list(key_columns)].astype(str))
+
+    return pd.Series(prev_data[FINGERPRINT_COLUMN].to_numpy(dtype="uint64"), index=index, name=FINGERPRINT_COLUMN)
+
+
+def compare_fingerprints(current, previous):
+    """
+    Parameters
+    ----------
+    current: Series, fingerprints of the current data set, see compute_fingerprints
+
+    previous: Series, fingerprints of the previous data set
+
+    Returns
+    ------
+    new_keys: Index, keys of the current data set that are not in the previous data set
+
+    updated_keys: Index, keys present in both data sets whose fingerprints differ
+    """
+
+    previous = previous[~previous.index.duplicated(keep="last")]
+
+    is_new = ~current.index.isin(previous.index)
+    existing = current[~is_new]
+
+    # Every existing key is in previous, so the reindex introduces no missing values and the uint64 dtype is kept
+    is_updated = existing.to_numpy() != previous.reindex(existing.index).to_numpy()
+
+    return current.index[is_new], existing.index[is_updated]
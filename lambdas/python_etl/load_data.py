@@ -1,13 +1,34 @@
-from io import StringIO
+import csv
+from datetime import datetime
+from functools import partial
+import gzip
+from io import BytesIO, StringIO, TextIOWrapper
+import json
 import logging
 import pandas as pd
 from json_logger import setup_logging
+from storage_keys import payload_key, snapshot_key
+from compact_schema import log_memory_usage
+from fingerprints import FINGERPRINT_COLUMN, compute_fingerprints
+from partitions import write_partitions
+from multipart_upload import MultipartUploadWriter
+from change_log import CHANGE_LOG_PREFIX, append_change_log
 
 setup_logging(logging.INFO)
 logger = logging.getLogger()
 
+# Snappy is one of the two column compressions S3 Select reads in Parquet objects, the other is GZIP
+PARQUET_COMPRESSION = "snappy"
 
-def load_data(env, bucket, key, change_log_key, new_data, new_records, updated_records, s3):
+# A year of daily records per row group, the min/max statistics of each group let readers skip it by date
+PARQUET_ROW_GROUP_SIZE = 366
+
+# Format of the last_modified_date field of the API response
+LAST_MODIFIED_FORMAT = "%m/%d/%Y, %H:%M:%S"
+
+
+def load_data(env, bucket, key, change_log_key, new_data, new_records, updated_records, s3, partition_prefix=None,
+              compress=False, change_log_prefix=CHANGE_LOG_PREFIX):
     """
     Parameters
     ----------
@@ -27,13 +48,36 @@ def load_data(env, bucket, key, change_log_key, new_data, new_records, updated_r
 
     s3: s3 Client 
 
+    partition_prefix: str or None, Key prefix that will be used with env to store the data set partitioned by month, e.g. "data".
+        When given, the partitions are written next to the single Parquet snapshot, which the API keeps querying, and only those
+        with new/updated records are rewritten, see partitions.write_partitions
+
+    compress: bool, when True the csv files are gzip compressed, see upload_data_to_s3
+
+    change_log_prefix: str, Key prefix of the append-only change log history under env, see change_log.append_change_log
+
     Returns
     ------
-    No returns, this function uploads two csv files to s3: the resulting data set from the Transform step and a change log of which dates are new/updated
+    No returns, this function uploads two csv files to s3: the resulting data set from the Transform step and a change log of which dates are new/updated.
+    A typed Parquet snapshot of the data set is uploaded next to the csv file for the next run's extract step.
+    The change log of this run is also appended to the change log history as a segment, change_log_key only holds the latest run.
+    The finished API response for the data set is uploaded last, see upload_api_payload_to_s3
     """
 
+    log_memory_usage(new_data, "load_data")
+
+    # The snapshot goes first, a failed csv upload is then corrected by the next run instead of leaving a stale snapshot behind
     try:
-        upload_data_to_s3(new_data, env, bucket, key, s3)
+        upload_snapshot_to_s3(new_data, env, bucket, key, s3)
+        if partition_prefix is not None:
+            write_partitions(new_data, bucket, env + '/' + partition_prefix, new_records + updated_records, s3,
+                             partial(snapshot_to_parquet, value_columns=["cases", "deaths", "recoveries"]))
+    except:
+        logger.error("Error uploading data snapshot to S3")
+        raise
+
+    try:
+        upload_data_to_s3(new_data, env, bucket, key, s3, compress)
     except:
         logger.error("Error uploading new data to S3")
         raise
@@ -45,14 +89,63 @@ def load_data(env, bucket, key, change_log_key, new_data, new_records, updated_r
         raise
 
     try:
-        upload_data_to_s3(change_log_data, env, bucket, change_log_key, s3)
+        upload_data_to_s3(change_log_data, env, bucket, change_log_key, s3, compress)
     except:
         logger.error("Error uploading change log to S3")
         raise
 
+    try:
+        append_change_log(change_log_data, bucket, env + '/' + change_log_prefix, s3)
+    except:
+        logger.error("Error appending change log segment to S3")
+        raise
+
+    try:
+        upload_api_payload_to_s3(new_data, env, bucket, key, s3)
+    except:
+        logger.error("Error uploading API payload to S3")
+        raise
+
     logger.info("Data Loading Complete")
 
 
+def load_metrics(env, bucket, key, metrics, s3, compress=False):
+    """
+    Parameters
+    ----------
+    env: str in {'production', 'testing'} determines S3 key name (prefix)
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key that will be used with env to store the metrics csv file in S3 bucket
+
+    metrics: DataFrame, output of metrics.compute_metrics
+
+    s3: s3 Client 
+
+    compress: bool, when True the csv file is gzip compressed, see upload_data_to_s3
+
+    Returns
+    ------
+    No returns, this function uploads the rolling window metrics next to the data set so the API can serve them directly,
+    as a csv file and as the finished API response, see upload_api_payload_to_s3
+    """
+
+    try:
+        upload_data_to_s3(metrics, env, bucket, key, s3, compress)
+    except:
+        logger.error("Error uploading metrics to S3")
+        raise
+
+    try:
+        upload_api_payload_to_s3(metrics, env, bucket, key, s3)
+    except:
+        logger.error("Error uploading metrics API payload to S3")
+        raise
+
+    logger.info("Metrics Loading Complete", extra=dict(data={"Rows": len(metrics)}))
+
+
 def create_change_log(new_records, updated_records):
     """
     Parameters
@@ -66,17 +159,91 @@ def create_change_log(new_records, updated_records):
     change_log, DataFrame, dataframe with two fields, 'date' and 'status update' with all dates that are new/updated
     """
 
-    change_status_col = ["NEW RECORD"] * \
+    return pd.DataFrame({
+        "date": new_records + updated_records,
+        "status_update": ["NEW RECORD"] * len(new_records) + ["UPDATED_RECORD"] * len(updated_records),
+    }, columns=["date", "status_update"])
+
+
+def load_state_data(env, bucket, key, change_log_key, states_data, new_records, updated_records, s3, compress=False):
+    """
+    Parameters
+    ----------
+    env: str in {'production', 'testing'} determines S3 key name (prefix)
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key that will be used with env to store the state level csv file in S3 bucket
+
+    change_log_key: str, Key that will be used with env to store log of new/updated state records
+
+    states_data: DataFrame, output of transform_state_data that will be uploaded to s3
+
+    new_records: List, list of (state, date) tuples that are newly added to the data set
+
+    updated_records: List, list of (state, date) tuples that were previously in the data set that have updated fields
+
+    s3: s3 Client 
+
+    compress: bool, when True the csv files are gzip compressed, see upload_data_to_s3
+
+    Returns
+    ------
+    No returns, this function uploads the state level data set with its Parquet snapshot and a per state change log
+    """
+
+    log_memory_usage(states_data, "load_state_data")
+
+    try:
+        upload_snapshot_to_s3(states_data, env, bucket, key, s3,
+                              value_columns=["cases", "deaths"], key_columns=("state", "date"))
+    except:
+        logger.error("Error uploading state data snapshot to S3")
+        raise
+
+    try:
+        upload_data_to_s3(states_data, env, bucket, key, s3, compress)
+    except:
+        logger.error("Error uploading new state data to S3")
+        raise
+
+    try:
+        change_log_data = create_state_change_log(new_records, updated_records)
+    except:
+        logger.error("Error creating state change log")
+        raise
+
+    try:
+        upload_data_to_s3(change_log_data, env, bucket, change_log_key, s3, compress)
+    except:
+        logger.error("Error uploading state change log to S3")
+        raise
+
+    logger.info("State Data Loading Complete")
+
+
+def create_state_change_log(new_records, updated_records):
+    """
+    Parameters
+    ----------
+    new_records: List, list of (state, date) tuples that are newly added to the data set
+
+    updated_records: List, list of (state, date) tuples that were previously in the data set that have updated fields
+
+    Returns
+    ------
+    change_log, DataFrame, dataframe with three fields, 'state', 'date' and 'status_update', sorted by state and date
+    """
+
+    change_log = pd.DataFrame(new_records + updated_records,
+                              columns=["state", "date"])
+    change_log["status_update"] = ["NEW RECORD"] * \
         len(new_records) + ["UPDATED_RECORD"] * len(updated_records)
-    change_record_col = new_records + updated_records
 
-    change_log = pd.DataFrame(
-        [change_record_col, change_status_col]).transpose()
-    change_log.columns = ["date", "status_update"]
-    return change_log
+    return change_log.sort_values(["state", "date"], kind="mergesort").reset_index(drop=True)
 
 
-def upload_data_to_s3(data, env, bucket, key, s3):
+def upload_data_to_s3(data, env, bucket, key, s3, compress=False):
     """
     Parameters
     ----------
@@ -90,14 +257,192 @@ def upload_data_to_s3(data, env, bucket, key, s3):
 
     s3: s3 Client 
 
+    compress: bool, when True the csv file is gzip compressed and stored with ContentEncoding gzip under the same key
+
+    Returns
+    ------
+    No returns, this function writes a DataFrame to s3 as a csv file, see upload_csv_to_s3
+    """
+
+    upload_csv_to_s3(data, bucket, env + '/' + key, s3, compress)
+
+
+def upload_csv_to_s3(data, bucket, key, s3, compress=False):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data to be written to s3
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, full Key of the csv file, e.g. "production/counties/year=2020/month=04/part-0000.csv"
+
+    s3: s3 Client 
+
+    compress: bool, when True the csv file is gzip compressed and stored with ContentEncoding gzip under the same key
+
+    Returns
+    ------
+    No returns, this function writes a DataFrame to s3 as a csv file.  The csv text is encoded (and compressed) as it is
+    written and streamed to S3 in multipart upload parts, see multipart_upload.MultipartUploadWriter
+    """
+
+    put_args = {"ContentType": "text/csv"}
+    if compress:
+        put_args["ContentEncoding"] = "gzip"
+
+    with MultipartUploadWriter(bucket, key, s3, **put_args) as upload:
+        # mtime=0 keeps the compressed bytes, and so the ETag, identical for identical data
+        body = gzip.GzipFile(fileobj=upload, mode="wb", mtime=0) if compress else upload
+
+        # Detached rather than closed, closing would also close the upload and complete it even if to_csv failed
+        csv_buffer = TextIOWrapper(body, encoding="utf-8", newline="")
+        data.to_csv(csv_buffer, index=False)
+        csv_buffer.detach()
+
+        if compress:
+            body.close()
+
+    extra_data = {
+        "Key": key,
+        "Compressed": compress,
+        "Uploaded Bytes": upload.uploaded_bytes,
+    }
+    logger.info("Data uploaded to S3", extra=dict(data=extra_data))
+
+
+def upload_snapshot_to_s3(data, env, bucket, key, s3, value_columns=None, key_columns=("date",)):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data to be written to s3
+
+    env: str in {'production', 'testing'} determines S3 key name (prefix)
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key of the csv file, the snapshot is stored next to it with a .parquet extension
+
+    s3: s3 Client 
+
+    value_columns: List or None, names of the count fields the stored fingerprints are computed from, defaults to the national counts
+
+    key_columns: tuple, names of the fields identifying a record
+
+    Returns
+    ------
+    No returns, this function writes a DataFrame to s3 as a Parquet file.  The date field is stored as YYYY-MM-DD text
+    so the snapshot reads back in the same shape as the csv file, and a fingerprint field holds the hash of each record's
+    counts for the next run's change detection.
+
+    The file is also the typed columnar copy of the data set that the API queries with S3 Select, so it is written with
+    a compression S3 Select supports and with column statistics per row group
+    """
+
+    if value_columns is None:
+        value_columns = ["cases", "deaths", "recoveries"]
+
+    s3.put_object(Bucket=bucket, Body=snapshot_to_parquet(data, value_columns, key_columns),
+                  Key=env + '/' + snapshot_key(key))
+
+
+def upload_api_payload_to_s3(data, env, bucket, key, s3, last_modified=None):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data set served by the API
+
+    env: str in {'production', 'testing'} determines S3 key name (prefix)
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key: str, Key of the csv file, the payload is stored next to it with a .json extension
+
+    s3: s3 Client 
+
+    last_modified: datetime or None, UTC time reported as last_modified_date, now by default
+
+    Returns
+    ------
+    No returns, this function writes the response body of the API, see api_payload, as a gzip compressed JSON object
+    with ContentEncoding gzip.  The API returns it as is instead of querying the csv file on every request
+    """
+
+    body = api_payload(data, last_modified or datetime.utcnow())
+    s3.put_object(Bucket=bucket, Body=body, Key=env + '/' + payload_key(key),
+                  ContentType="application/json", ContentEncoding="gzip")
+
+    logger.info("API payload uploaded to S3",
+                extra=dict(data={"Key": env + '/' + payload_key(key), "Rows": len(data), "Bytes": len(body)}))
+
+
+def api_payload(data, last_modified):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data set served by the API
+
+    last_modified: datetime, UTC time reported as last_modified_date
+
+    Returns
+    ------
+    body: bytes, gzip compressed JSON object {"data": [records], "last_modified_date": "MM/DD/YYYY, HH:MM:SS"}
+
+    The records are built from the csv text of the data set, so every field is text exactly as S3 Select returns it from the csv
+    file and existing clients see the same response
+    """
+
+    records = list(csv.DictReader(StringIO(data.to_csv(index=False))))
+    payload = json.dumps({
+        "data": records,
+        "last_modified_date": last_modified.strftime(LAST_MODIFIED_FORMAT),
+    })
+
+    # mtime=0 keeps the compressed bytes a function of the payload alone
+    return gzip.compress(payload.encode("utf-8"), mtime=0)
+
+
+def snapshot_to_parquet(data, value_columns, key_columns=("date",)):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data to be written
+
+    value_columns: List, names of the count fields the stored fingerprints are computed from
+
+    key_columns: tuple, names of the fields identifying a record
+
+    Returns
+    ------
+    body: bytes, Parquet file of the data with the date field as YYYY-MM-DD text and a fingerprint field, see upload_snapshot_to_s3
+    """
+
+    snapshot = data.copy()
+    snapshot["date"] = format_dates(snapshot["date"])
+    snapshot[FINGERPRINT_COLUMN] = compute_fingerprints(
+        snapshot, value_columns, key_columns).to_numpy()
+
+    parquet_buffer = BytesIO()
+    snapshot.to_parquet(parquet_buffer, engine="pyarrow", index=False, compression=PARQUET_COMPRESSION,
+                        row_group_size=PARQUET_ROW_GROUP_SIZE, write_statistics=True)
+    body = parquet_buffer.getvalue()
+
+    parquet_buffer.close()
+    return body
+
+
+def format_dates(dates):
+    """
+    Parameters
+    ----------
+    dates: Series, date field as Date objects, datetime64 or YYYY-MM-DD text
+
     Returns
     ------
-    No returns, this function writes a DataFrame to s3 as a csv file
+    dates: Series, date field as YYYY-MM-DD text
     """
 
-    csv_buffer = StringIO()
-    data.to_csv(csv_buffer, index=False)
-    s3.put_object(Bucket=bucket, Body=csv_buffer.getvalue(),
-                  Key=env + '/' + key)
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.strftime("%Y-%m-%d")
 
-    csv_buffer.close()
+    return dates.astype(str)
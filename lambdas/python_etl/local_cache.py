@@ -0,0 +1,318 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+CACHE_ENABLED = os.environ.get("LOCAL_CACHE", "false").lower() == "true"
+CACHE_DIR = os.environ.get("LOCAL_CACHE_DIR", "/tmp/etl_cache")
+CACHE_TTL_SECONDS = int(os.environ.get("LOCAL_CACHE_TTL_SECONDS", "900"))
+CACHE_MAX_BYTES = int(os.environ.get("LOCAL_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Space left free in /tmp for everything else the function writes there
+CACHE_RESERVED_BYTES = 64 * 1024 * 1024
+
+# Metadata of a cached object, e.g. the ETag of a download, is kept in a file with this suffix next to it
+METADATA_SUFFIX = ".meta"
+
+# Held while objects are looked up and opened, and while they are evicted, so the extraction threads never evict an object
+# another thread has found but not opened yet.  Once opened, a file stays readable after it is removed
+CACHE_LOCK = threading.RLock()
+
+
+def cache_key(*parts):
+    """
+    Parameters
+    ----------
+    parts: str, values identifying the cached object, e.g. a download url or an S3 bucket, key and ETag
+
+    Returns
+    ------
+    key: str, file name the object is cached under
+    """
+
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def get_cached_path(key, description):
+    """
+    Parameters
+    ----------
+    key: str, output of cache_key
+
+    description: str, human readable name of the cached object used in the hit/miss log
+
+    Returns
+    ------
+    path: str or None, path of the cached object.  None if caching is disabled, the object is not cached or it is older than the TTL
+    """
+
+    if not CACHE_ENABLED:
+        return None
+
+    path = os.path.join(CACHE_DIR, key)
+
+    try:
+        age = time.time() - os.path.getmtime(path)
+        size = os.path.getsize(path)
+        if age > CACHE_TTL_SECONDS:
+            remove_entry(path)
+            path = None
+    except OSError:
+        path = None
+
+    extra_data = {
+        "object": description,
+        "hit": path is not None,
+    }
+    if path is not None:
+        extra_data["bytes"] = size
+        extra_data["age_seconds"] = round(age, 1)
+
+    logger.info("Local cache " + ("hit" if path is not None else "miss"),
+                extra=dict(data=extra_data))
+    return path
+
+
+def get_cached(key, description):
+    """
+    Parameters
+    ----------
+    key: str, output of cache_key
+
+    description: str, human readable name of the cached object used in the hit/miss log
+
+    Returns
+    ------
+    body: bytes or None, cached object.  None if caching is disabled, the object is not cached or it is older than the TTL
+    """
+
+    cached_file = open_cached(key, description)
+    if cached_file is None:
+        return None
+
+    with cached_file:
+        return cached_file.read()
+
+
+def open_cached(key, description):
+    """
+    Parameters
+    ----------
+    key: str, output of cache_key
+
+    description: str, human readable name of the cached object used in the hit/miss log
+
+    Returns
+    ------
+    file: file object or None, cached object opened for reading, see get_cached_path.  The caller closes it.  The object is
+        looked up and opened under CACHE_LOCK, so it cannot be evicted in between
+    """
+
+    with CACHE_LOCK:
+        path = get_cached_path(key, description)
+        if path is None:
+            return None
+
+        try:
+            return open(path, "rb")
+        except OSError:
+            return None
+
+
+def get_cached_metadata(key):
+    """
+    Parameters
+    ----------
+    key: str, output of cache_key
+
+    Returns
+    ------
+    metadata: dict or None, metadata stored with the cached object by move_to_cache.  None if there is none
+    """
+
+    try:
+        with open(os.path.join(CACHE_DIR, key) + METADATA_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def put_cached(key, body, expected_bytes=0):
+    """
+    Parameters
+    ----------
+    key: str, output of cache_key
+
+    body: bytes or file-like object, object to cache.  File-like objects are copied in blocks rather than read into memory
+
+    expected_bytes: int, size of a file-like body if known, e.g. from a Content-Length header, used to make room before writing
+
+    Returns
+    ------
+    path: str or None, path of the cached object.  None if caching is disabled or the write failed
+
+    Expired and least recently written objects are evicted to stay within the size budget.  Failures are logged and
+    ignored, the cache is only an optimization
+    """
+
+    if not CACHE_ENABLED:
+        return None
+
+    path = os.path.join(CACHE_DIR, key)
+    tmp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        incoming_bytes = len(body) if isinstance(body, bytes) else expected_bytes
+        evict(incoming_bytes)
+
+        with open(tmp_path, "wb") as f:
+            if isinstance(body, bytes):
+                f.write(body)
+            else:
+                shutil.copyfileobj(body, f)
+
+        if os.path.getsize(tmp_path) > CACHE_MAX_BYTES:
+            logger.info("Object too large for local cache",
+                        extra=dict(data={"bytes": os.path.getsize(tmp_path)}))
+            os.remove(tmp_path)
+            return None
+
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.exception("Error writing to local cache")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    return path
+
+
+def move_to_cache(key, file_path, metadata=None):
+    """
+    Parameters
+    ----------
+    key: str, output of cache_key
+
+    file_path: str, downloaded file to keep in the cache.  It is moved rather than copied
+
+    metadata: dict or None, stored next to the object, see get_cached_metadata
+
+    Returns
+    ------
+    file: file object or None, the cached object opened for reading, the caller closes it.  None if caching is disabled, the
+        file is too large or the move failed, file_path is then left where it is
+    """
+
+    if not CACHE_ENABLED:
+        return None
+
+    path = os.path.join(CACHE_DIR, key)
+
+    try:
+        size = os.path.getsize(file_path)
+        if size > CACHE_MAX_BYTES:
+            logger.info("Object too large for local cache", extra=dict(data={"bytes": size}))
+            return None
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        with CACHE_LOCK:
+            evict(size)
+            if os.path.exists(path + METADATA_SUFFIX):
+                os.remove(path + METADATA_SUFFIX)
+            shutil.move(file_path, path)
+            if metadata is not None:
+                with open(path + METADATA_SUFFIX, "w") as f:
+                    json.dump(metadata, f)
+
+            return open(path, "rb")
+    except OSError:
+        logger.exception("Error writing to local cache")
+        return None
+
+
+def get_cache_budget():
+    """
+    Returns
+    ------
+    budget: int, bytes the cache may occupy, the smaller of CACHE_MAX_BYTES and what the ephemeral storage has left
+        after CACHE_RESERVED_BYTES
+    """
+
+    free_bytes = shutil.disk_usage(CACHE_DIR).free
+    used_bytes = sum(size for _, size, _ in list_cache_entries())
+
+    return max(0, min(CACHE_MAX_BYTES, used_bytes + free_bytes - CACHE_RESERVED_BYTES))
+
+
+def list_cache_entries():
+    """
+    Returns
+    ------
+    entries: List, list of (path, size in bytes, modified time) tuples for every cached object
+    """
+
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.is_file() and not entry.name.endswith((".tmp", METADATA_SUFFIX)):
+            stat = entry.stat()
+            entries.append((entry.path, stat.st_size, stat.st_mtime))
+
+    return entries
+
+
+def evict(incoming_bytes=0):
+    """
+    Parameters
+    ----------
+    incoming_bytes: int, size of an object about to be written
+
+    Returns
+    ------
+    No returns, this function removes expired objects, then the oldest objects until the incoming object fits the budget.
+    Objects already opened by a reader stay readable, see open_cached
+    """
+
+    with CACHE_LOCK:
+        now = time.time()
+        entries = []
+        for path, size, mtime in list_cache_entries():
+            if now - mtime > CACHE_TTL_SECONDS:
+                remove_entry(path)
+            else:
+                entries.append((path, size, mtime))
+
+        budget = get_cache_budget()
+        used_bytes = sum(size for _, size, _ in entries)
+
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if used_bytes + incoming_bytes <= budget:
+                break
+            remove_entry(path)
+            used_bytes -= size
+
+
+def remove_entry(path):
+    """
+    Parameters
+    ----------
+    path: str, path of a cached object
+
+    Returns
+    ------
+    No returns, this function removes the object and its metadata
+    """
+
+    for entry_path in (path, path + METADATA_SUFFIX):
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
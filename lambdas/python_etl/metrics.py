@@ -0,0 +1,171 @@
+import logging
+import numpy as np
+import pandas as pd
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+COUNT_COLUMNS = ["cases", "deaths", "recoveries"]
+ROLLING_WINDOWS = (7, 14)
+GROWTH_PERIOD = 7
+METRIC_DECIMALS = 4
+
+# A metric row depends on the records of the previous 13 days at most: the 14 day window, and the 7 day window a week earlier
+CONTEXT_DAYS = max(max(ROLLING_WINDOWS), 2 * GROWTH_PERIOD) - 1
+
+
+def metric_columns(count_columns=COUNT_COLUMNS):
+    """
+    Parameters
+    ----------
+    count_columns: List, names of the Integer count fields, e.g. "cases", "deaths", "recoveries"
+
+    Returns
+    ------
+    columns: List, names of the metric fields in output order, after "date"
+    """
+
+    columns = []
+    for col in count_columns:
+        columns += [f"{col}-diff-avg{window}" for window in ROLLING_WINDOWS]
+        columns += [f"{col}-growth-wow", f"{col}-doubling-days"]
+
+    return columns
+
+
+def compute_metrics(covid_data, prev_metrics=None, changed_records=None, count_columns=COUNT_COLUMNS):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, output of transform_data with the count and *-diff fields
+
+    prev_metrics: DataFrame or None, metrics of the previous run, see extract_data.extract_previous_metrics
+
+    changed_records: List or None, dates that are new or updated in this run.  None computes the metrics for the whole history
+
+    count_columns: List, names of the Integer count fields
+
+    Returns
+    ------
+    metrics: DataFrame, one row per date of covid_data
+        columns: "date" as YYYY-MM-DD text, then per count field
+            <col>-diff-avg7, <col>-diff-avg14: rolling mean of the daily diffs over the last 7/14 days
+            <col>-growth-wow: week-over-week growth of the 7 day mean, e.g. 0.25 for 25% more than a week earlier
+            <col>-doubling-days: days the cumulative count takes to double at the growth rate of the last 7 days
+
+    Metrics are empty where their window lacks a record, or where the growth is not positive.  With previous metrics, only
+    the tail from the earliest changed date is computed, from that date minus CONTEXT_DAYS onward, earlier rows are reused.
+    Without changed records the previous metrics are returned as is if they cover exactly the dates of covid_data
+    """
+
+    dates = pd.DatetimeIndex(pd.to_datetime(covid_data["date"]))
+
+    if changed_records is not None and prev_metrics is not None:
+        if len(changed_records) == 0:
+            # Dates can also disappear from the data set without any record changing
+            if prev_metrics["date"].astype(str).tolist() == list(dates.strftime("%Y-%m-%d")):
+                logger.info("No changed records, previous metrics reused")
+                return prev_metrics
+
+            logger.info("Previous metrics do not match the data set, computing all metrics")
+            return rolling_metrics(covid_data, dates, count_columns)
+
+        start = pd.Timestamp(min(changed_records))
+        kept = prev_metrics[pd.to_datetime(prev_metrics["date"]) < start]
+
+        # The previous metrics can only be reused if they cover exactly the unchanged dates
+        if kept["date"].astype(str).tolist() == list(dates[dates < start].strftime("%Y-%m-%d")):
+            context = dates >= start - pd.Timedelta(days=CONTEXT_DAYS)
+            tail = rolling_metrics(covid_data[context], dates[context], count_columns)
+            tail = tail[pd.to_datetime(tail["date"]) >= start]
+
+            logger.info("Metrics computed incrementally",
+                        extra=dict(data={"Start": str(start.date()), "Rows": len(tail), "Reused Rows": len(kept)}))
+            return pd.concat([kept[tail.columns], tail], ignore_index=True)
+
+        logger.info("Previous metrics do not match the data set, computing all metrics")
+
+    return rolling_metrics(covid_data, dates, count_columns)
+
+
+def rolling_metrics(covid_data, dates, count_columns=COUNT_COLUMNS):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, daily data in date order with the count and *-diff fields
+
+    dates: DatetimeIndex, dates of the rows of covid_data
+
+    count_columns: List, names of the Integer count fields
+
+    Returns
+    ------
+    metrics: DataFrame, see compute_metrics
+
+    All fields are computed together on a gapless daily grid.  Window sums are differences of Integer cumulative sums, so
+    a window gives the same result no matter where the computation started
+    """
+
+    diff_columns = [f"{col}-diff" for col in count_columns]
+    if len(covid_data) == 0:
+        return pd.DataFrame(columns=["date"] + metric_columns(count_columns))
+
+    grid = pd.date_range(dates.min(), dates.max(), freq="D")
+    positions = grid.get_indexer(dates)
+
+    diffs = np.zeros((len(grid), len(count_columns)), dtype="int64")
+    counts = np.zeros((len(grid), len(count_columns)), dtype="int64")
+    present = np.zeros(len(grid), dtype="int64")
+
+    diffs[positions] = covid_data[diff_columns].to_numpy(dtype="int64")
+    counts[positions] = covid_data[count_columns].to_numpy(dtype="int64")
+    present[positions] = 1
+
+    diff_sums = np.vstack([np.zeros((1, len(count_columns)), dtype="int64"), np.cumsum(diffs, axis=0)])
+    present_sums = np.concatenate([[0], np.cumsum(present)])
+
+    means = {}
+    for window in ROLLING_WINDOWS:
+        means[window] = np.full(diffs.shape, np.nan)
+        if len(grid) >= window:
+            full = (present_sums[window:] - present_sums[:-window]) == window
+            window_means = (diff_sums[window:] - diff_sums[:-window]) / window
+            means[window][window - 1:] = np.where(full[:, None], window_means, np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        week_earlier_means = shift_rows(means[GROWTH_PERIOD], GROWTH_PERIOD)
+        growth = np.where(week_earlier_means > 0, means[GROWTH_PERIOD] / week_earlier_means - 1, np.nan)
+
+        week_earlier_counts = shift_rows(np.where(present[:, None] == 1, counts, np.nan), GROWTH_PERIOD)
+        ratio = counts / week_earlier_counts
+        doubling = np.where(ratio > 1, GROWTH_PERIOD * np.log(2) / np.log(ratio), np.nan)
+
+    metrics = {"date": grid[positions].strftime("%Y-%m-%d")}
+    for i, col in enumerate(count_columns):
+        for window in ROLLING_WINDOWS:
+            metrics[f"{col}-diff-avg{window}"] = means[window][positions, i]
+        metrics[f"{col}-growth-wow"] = growth[positions, i]
+        metrics[f"{col}-doubling-days"] = doubling[positions, i]
+
+    return pd.DataFrame(metrics).round(METRIC_DECIMALS)
+
+
+def shift_rows(values, periods):
+    """
+    Parameters
+    ----------
+    values: ndarray, float values per day of the daily grid
+
+    periods: int, number of days to shift by
+
+    Returns
+    ------
+    shifted: ndarray, values of periods days earlier, NaN for the first periods days
+    """
+
+    shifted = np.full(values.shape, np.nan)
+    if len(values) > periods:
+        shifted[periods:] = values[:-periods]
+
+    return shifted
@@ -0,0 +1,92 @@
+import io
+import logging
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+# S3 requires every part but the last to be at least 5 MiB
+MULTIPART_PART_BYTES = 8 * 1024 * 1024
+
+
+class MultipartUploadWriter(io.RawIOBase):
+    """
+    Writable file object that uploads what is written to it to S3 in fixed size parts, so a serializer can stream its output
+    without the whole body ever being held in memory.  Memory use is bounded by part_bytes
+
+    A body that never fills a part is sent with a single put_object on close.  Leaving a with block on an exception aborts the
+    multipart upload instead of completing it, so a failed serialization never replaces the object
+
+    put_args are passed to put_object/create_multipart_upload, e.g. ContentType="text/csv", ContentEncoding="gzip"
+    """
+
+    def __init__(self, bucket, key, s3, part_bytes=MULTIPART_PART_BYTES, **put_args):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.s3 = s3
+        self.part_bytes = part_bytes
+        self.put_args = put_args
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.uploaded_bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buffer += b
+
+        while len(self.buffer) >= self.part_bytes:
+            self.upload_part(bytes(self.buffer[:self.part_bytes]))
+            del self.buffer[:self.part_bytes]
+
+        return len(b)
+
+    def upload_part(self, body):
+        if self.upload_id is None:
+            res = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.put_args)
+            self.upload_id = res["UploadId"]
+
+        part_number = len(self.parts) + 1
+        res = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                  PartNumber=part_number, Body=body)
+        self.parts.append({"ETag": res["ETag"], "PartNumber": part_number})
+        self.uploaded_bytes += len(body)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self.upload_id is None:
+                self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer), **self.put_args)
+                self.uploaded_bytes += len(self.buffer)
+            else:
+                if len(self.buffer) > 0:
+                    self.upload_part(bytes(self.buffer))
+                self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                  MultipartUpload={"Parts": self.parts})
+        except:
+            logger.error("Error completing upload to S3", extra=dict(data={"Key": self.key}))
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            super().close()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+            self.buffer = bytearray()
+            super().close()
+            return False
+
+        self.close()
+        return False
@@ -0,0 +1,196 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+import json
+import logging
+import numpy as np
+import pandas as pd
+from botocore.exceptions import ClientError
+from json_logger import setup_logging
+
+setup_logging(logging.INFO)
+logger = logging.getLogger()
+
+MANIFEST_KEY = "manifest.json"
+PART_FILE = "part.parquet"
+READ_WORKERS = 8
+
+
+def partition_names(dates):
+    """
+    Parameters
+    ----------
+    dates: Series, date field as Date objects, datetime64 or YYYY-MM-DD text
+
+    Returns
+    ------
+    names: Series, partition of each record, e.g. "year=2020/month=03"
+    """
+
+    dates = pd.to_datetime(dates)
+    return "year=" + dates.dt.strftime("%Y") + "/month=" + dates.dt.strftime("%m")
+
+
+def affected_partitions(dates, names, changed_records):
+    """
+    Parameters
+    ----------
+    dates: Series, date field of the data set in date order
+
+    names: Series, partition of each record, see partition_names
+
+    changed_records: List, YYYY-MM-DD dates that are new or updated in this run
+
+    Returns
+    ------
+    partitions: set, partitions holding a changed record or the record after it, whose diff fields depend on the changed record
+    """
+
+    text = pd.to_datetime(dates).dt.strftime("%Y-%m-%d")
+    positions = np.flatnonzero(text.isin(changed_records).to_numpy())
+    positions = np.union1d(positions, positions[positions + 1 < len(text)] + 1)
+
+    return set(names.iloc[positions])
+
+
+def write_partitions(data, bucket, key_prefix, changed_records, s3, serialize):
+    """
+    Parameters
+    ----------
+    data: DataFrame, complete data set in date order
+
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the partitioned data set including the environment, e.g. "production/data"
+
+    changed_records: List, YYYY-MM-DD dates that are new or updated in this run
+
+    s3: s3 Client
+
+    serialize: function, turns the records of one partition into the bytes of its file
+
+    Returns
+    ------
+    manifest: dict, manifest written for the data set, the rows and date range of each partition and the file holding it
+        <key_prefix>/year=YYYY/month=MM/part.parquet
+
+    Only partitions with changed records are rewritten, plus any partition the previous manifest does not list with the same
+    number of rows.  Without a previous manifest every partition is written.  Partitions no longer in the data set are deleted
+    """
+
+    names = partition_names(data["date"])
+    previous_manifest = read_manifest(bucket, key_prefix, s3)
+
+    if previous_manifest is None:
+        rewrite = set(names)
+        partitions = {}
+    else:
+        partitions = dict(previous_manifest["partitions"])
+        rewrite = affected_partitions(data["date"], names, changed_records)
+        for name, rows in names.value_counts().items():
+            if partitions.get(name, {}).get("rows") != rows:
+                rewrite.add(name)
+
+    written_bytes = 0
+    for name, rows in data.groupby(names.to_numpy(), sort=True):
+        if name not in rewrite:
+            continue
+
+        body = serialize(rows)
+        s3.put_object(Bucket=bucket, Body=body, Key=f"{key_prefix}/{name}/{PART_FILE}")
+        written_bytes += len(body)
+
+        dates = pd.to_datetime(rows["date"])
+        partitions[name] = {
+            "key": f"{name}/{PART_FILE}",
+            "rows": len(rows),
+            "min_date": dates.min().strftime("%Y-%m-%d"),
+            "max_date": dates.max().strftime("%Y-%m-%d"),
+        }
+
+    stale = sorted(set(partitions) - set(names))
+    if len(stale) > 0:
+        s3.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key_prefix + '/' + partitions.pop(name)["key"]} for name in stale]
+        })
+
+    manifest = {
+        "updated_at": datetime.utcnow().isoformat(),
+        "partitions": dict(sorted(partitions.items())),
+    }
+    s3.put_object(Bucket=bucket, Body=json.dumps(manifest), Key=key_prefix + '/' + MANIFEST_KEY)
+
+    extra_data = {
+        "Partitions": len(partitions),
+        "Rewritten": sorted(rewrite),
+        "Deleted": stale,
+        "Bytes Written": written_bytes,
+    }
+    logger.info("Partitioned data written", extra=dict(data=extra_data))
+    return manifest
+
+
+def read_partitions(bucket, key_prefix, s3, reader, workers=READ_WORKERS):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the partitioned data set including the environment
+
+    s3: s3 Client
+
+    reader: function, parses the file-like object of one partition into a DataFrame, e.g. pd.read_parquet
+
+    workers: int, number of partitions downloaded at the same time
+
+    Returns
+    ------
+    data: DataFrame or None, all partitions in date order.  None if there is no manifest
+    """
+
+    manifest = read_manifest(bucket, key_prefix, s3)
+    if manifest is None:
+        return None
+
+    keys = [key_prefix + '/' + partition["key"] for _, partition in sorted(manifest["partitions"].items())]
+    if len(keys) == 0:
+        return None
+
+    def read_partition(key):
+        res = s3.get_object(Bucket=bucket, Key=key)
+        return reader(BytesIO(res["Body"].read()))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        frames = list(executor.map(read_partition, keys))
+
+    logger.info("Partitioned data read", extra=dict(data={"Partitions": len(keys)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_manifest(bucket, key_prefix, s3):
+    """
+    Parameters
+    ----------
+    bucket: str, S3 Bucket Name used as "database" to store csv files in load step
+
+    key_prefix: str, Key prefix of the partitioned data set including the environment
+
+    s3: s3 Client
+
+    Returns
+    ------
+    manifest: dict or None, manifest of the partitioned data set.  None if it does not exist
+
+    Any error other than a missing manifest is raised, writers would otherwise delete the parts of a manifest they failed to read
+    """
+
+    try:
+        res = s3.get_object(Bucket=bucket, Key=key_prefix + '/' + MANIFEST_KEY)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        logger.error("Error reading manifest", extra=dict(data={"Key": key_prefix + '/' + MANIFEST_KEY}))
+        raise
+
+    return json.loads(res["Body"].read())
@@ -0,0 +1,29 @@
+import os
+
+
+def snapshot_key(key):
+    """
+    Parameters
+    ----------
+    key: str, Key of the csv file in S3 bucket, e.g. "acg-covid-data.csv"
+
+    Returns
+    ------
+    snapshot_key: str, Key of the typed Parquet snapshot stored next to the csv file, e.g. "acg-covid-data.parquet"
+    """
+
+    return os.path.splitext(key)[0] + ".parquet"
+
+
+def payload_key(key):
+    """
+    Parameters
+    ----------
+    key: str, Key of the csv file in S3 bucket, e.g. "acg-covid-data.csv"
+
+    Returns
+    ------
+    payload_key: str, Key of the gzip compressed API response stored next to the csv file, e.g. "acg-covid-data.json"
+    """
+
+    return os.path.splitext(key)[0] + ".json"
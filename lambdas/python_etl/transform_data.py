@@ -1,14 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
+from functools import partial
+import importlib
 import logging
 import math
+import sys
+import numpy as np
 import pandas as pd
 from json_logger import setup_logging
+from compact_schema import compact_covid_data, compact_integers, log_memory_usage
+from date_index import format_date_index, report_missing_dates, set_date_index
+from fingerprints import FINGERPRINT_COLUMN, compare_fingerprints, compute_fingerprints, stored_fingerprints
 
 setup_logging(logging.INFO)
 logger = logging.getLogger()
 
-
-def transform_data(ny_times_data, jh_data, prev_data):
+COUNT_COLUMNS = ["cases", "deaths", "recoveries"]
+
+STATE_COUNT_COLUMNS = ["cases", "deaths"]
+STATE_KEY_COLUMNS = ("state", "date")
+PARTITION_POOL_MIN_ROWS = 500000
+
+# Modules implementing filter_jh_data, merge_data, check_count_validity, get_changed_records, add_new_fields and transform_data,
+# imported on first use so pyarrow is only loaded when its engine is selected
+ENGINES = {
+    "pandas": __name__,
+    "arrow": "arrow_engine",
+}
+
+OUTPUT_COLUMNS = ["date", "cases", "deaths", "recoveries", "date-diff", "month", "day_of_week",
+                  "cases-diff", "cases-log", "deaths-diff", "deaths-log", "recoveries-diff", "recoveries-log"]
+
+DAY_OF_WEEK_NAMES = {
+    0: "Monday",
+    1: "Tuesday",
+    2: "Wednesday",
+    3: "Thursday",
+    4: "Friday",
+    5: "Saturday",
+    6: "Sunday",
+}
+
+MONTH_NAMES = {
+    1: "January",
+    2: "February",
+    3: "March",
+    4: "April",
+    5: "May",
+    6: "June",
+    7: "July",
+    8: "August",
+    9: "September",
+    10: "October",
+    11: "November",
+    12: "December",
+}
+
+
+def transform_data(ny_times_data, jh_data, prev_data, mode="full", compact=False, engine="pandas"):
     """
     Parameters
     ----------
@@ -18,6 +67,17 @@ def transform_data(ny_times_data, jh_data, prev_data):
 
     prev_data: DataFrame or None, previous day's/run's data retrieved from s3 Bucket.  On initial load of data, this will be None 
 
+    mode: str in {'full', 'incremental', 'verify'}
+        full: derived fields are computed for the whole history
+        incremental: derived fields are only computed from the earliest new/updated date onward, earlier rows are taken from prev_data
+        verify: both are computed and compared, the full result is returned
+
+    compact: bool, when True the data set is kept in a compact schema from merge_data onward, see compact_schema.compact_covid_data.
+        The date field is then datetime64 instead of Date objects
+
+    engine: str in {'pandas', 'arrow'}, compute engine running the transformation steps, see get_engine.
+        The arrow engine always computes the derived fields for the whole history and ignores mode and compact
+
     Returns
     ------
     covid_data: DataFrame, merged data filtered to US records with some derived fields added
@@ -27,10 +87,21 @@ def transform_data(ny_times_data, jh_data, prev_data):
     updated_records: List, list of dates that were previously in the data set that have updated fields
     """
 
+    if engine != "pandas":
+        if mode != "full" or compact:
+            logger.info(f"Transform mode and compact schema are not supported by the {engine} engine, computing all fields",
+                        extra=dict(data={"mode": mode, "compact": compact}))
+        return get_engine(engine).transform_data(ny_times_data, jh_data, prev_data)
+
     jh_data = filter_jh_data(jh_data)
 
     covid_data = merge_data(ny_times_data, jh_data)
+    log_memory_usage(covid_data, "merge_data")
+
     covid_data = check_count_validity(covid_data)
+    if compact:
+        covid_data = compact_integers(covid_data, COUNT_COLUMNS)
+    log_memory_usage(covid_data, "check_count_validity")
 
     if prev_data is None:
         new_records = sorted(list(covid_data["date"].unique()))
@@ -45,22 +116,62 @@ def transform_data(ny_times_data, jh_data, prev_data):
             raise
 
     try:
-        covid_data["date"] = covid_data["date"].apply(date.fromisoformat)
+        if compact:
+            covid_data["date"] = pd.to_datetime(covid_data["date"], format="%Y-%m-%d")
+        else:
+            covid_data["date"] = covid_data["date"].apply(date.fromisoformat)
     except ValueError:
         logger.error(
             "Invalid date field format, field must be in YYYY-MM-DD format")
         raise
 
     try:
-        covid_data = add_new_fields(covid_data)
+        if mode == "full" or prev_data is None:
+            covid_data = add_new_fields(covid_data)
+        elif mode == "incremental":
+            covid_data = add_new_fields_incremental(
+                covid_data, prev_data, new_records + updated_records)
+        elif mode == "verify":
+            covid_data = verify_incremental_fields(
+                covid_data, prev_data, new_records + updated_records)
+        else:
+            logger.error(f"Invalid transform mode: {mode}")
+            raise ValueError(mode)
     except:
         logger.error("Error adding new fields")
         raise
 
+    if compact:
+        covid_data = compact_covid_data(covid_data)
+    log_memory_usage(covid_data, "add_new_fields")
+
     logger.info("Data Transformations Complete")
     return covid_data, new_records, updated_records
 
 
+def get_engine(name):
+    """
+    Parameters
+    ----------
+    name: str in {'pandas', 'arrow'}, compute engine name
+
+    Returns
+    ------
+    engine: module, module providing the transformation steps of the engine.
+        pandas: this module, steps work on DataFrames
+        arrow: arrow_engine, steps work on pyarrow Tables with pyarrow.compute kernels, only the result is converted to a DataFrame
+    """
+
+    if name not in ENGINES:
+        logger.error(f"Invalid transform engine: {name}")
+        raise ValueError(name)
+
+    if ENGINES[name] == __name__:
+        return sys.modules[__name__]
+
+    return importlib.import_module(ENGINES[name])
+
+
 def filter_jh_data(jh_data):
     """
     Parameters
@@ -100,16 +211,26 @@ def merge_data(nyt_data, jh_data):
 
     Returns
     ------
-    covid_data: DataFrame, merged data with Johns Hopkins Date key removed and fields renamed
+    covid_data: DataFrame, merged data in date order with Johns Hopkins Date key removed and fields renamed
         columns: "date", "cases", "deaths", "recoveries"
 
+    Both sources are joined on a sorted DatetimeIndex.  Dates only one source has are dropped, they are logged as
+    ranges per source, see date_index.report_missing_dates
     """
 
     try:
-        covid_data = pd.merge(
-            nyt_data, jh_data, left_on="date", right_on="Date")
-        covid_data.drop(columns=["Date"], inplace=True)
-        covid_data.columns = ["date", "cases", "deaths", "recoveries"]
+        nyt_data = set_date_index(nyt_data.drop(columns=["date"]), nyt_data["date"], "NY Times")
+        jh_data = set_date_index(jh_data.drop(columns=["Date"]), jh_data["Date"], "Johns Hopkins")
+
+        report_missing_dates({
+            "NY Times": nyt_data.index.difference(jh_data.index),
+            "Johns Hopkins": jh_data.index.difference(nyt_data.index),
+        }, "Dates missing from the other source are dropped from the merged data")
+
+        covid_data = nyt_data.join(jh_data, how="inner")
+        covid_data.columns = ["cases", "deaths", "recoveries"]
+        covid_data.insert(0, "date", format_date_index(covid_data.index))
+        covid_data = covid_data.reset_index(drop=True)
     except:
         extra_data = {
             "NYT_Columns": nyt_data.columns,
@@ -138,21 +259,78 @@ def check_count_validity(covid_data):
 
     """
 
-    for col in ["cases", "deaths", "recoveries"]:
-        try:
-            covid_data[col] = covid_data[col].apply(int)
-        except:
-            logger.error(f"{col} contains non-numeric data")
-            raise
+    counts, report = validate_counts(covid_data)
 
-        min_value = min(covid_data[col])
-        if min_value < 0:
-            logger.error(f"{col} contains data with negative values")
-            raise
+    if len(report) > 0:
+        logger.error("Count fields contain non-numeric or negative values",
+                     extra=dict(data=report))
+        raise ValueError(f"Invalid count fields: {sorted(report)}")
+
+    for col in COUNT_COLUMNS:
+        covid_data[col] = counts[col].astype("int64")
 
     return covid_data
 
 
+def validate_counts(covid_data, columns=COUNT_COLUMNS):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, merged data with "date" field and the count fields in columns
+
+    columns: List, names of the count fields to validate
+
+    Returns
+    ------
+    counts: DataFrame, count fields parsed to numbers, invalid values are NaN
+
+    report: dict, offending rows keyed by column name, empty if all counts are valid
+        e.g. {"cases": {"non_numeric": [{"row": 0, "date": "2020-01-23", "value": "a"}], "negative": []}}
+    """
+
+    counts = covid_data[columns].apply(pd.to_numeric, errors="coerce")
+    non_numeric = counts.isna().to_numpy()
+    negative = (counts < 0).to_numpy()
+
+    report = {}
+    for i, col in enumerate(columns):
+        if not (non_numeric[:, i].any() or negative[:, i].any()):
+            continue
+
+        report[col] = {
+            "non_numeric": offending_rows(covid_data, col, non_numeric[:, i]),
+            "negative": offending_rows(covid_data, col, negative[:, i]),
+        }
+
+    return counts, report
+
+
+def offending_rows(covid_data, col, mask):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, merged data with "date" field
+
+    col: str, name of the field being validated
+
+    mask: ndarray, boolean array marking the offending rows
+
+    Returns
+    ------
+    rows: List, list of dicts with the position, date and raw value of each offending row
+    """
+
+    positions = mask.nonzero()[0]
+    return [
+        {
+            "row": int(position),
+            "date": str(covid_data["date"].iat[position]),
+            "value": str(covid_data[col].iat[position]),
+        }
+        for position in positions
+    ]
+
+
 def get_changed_records(covid_data, prev_data):
     """
     Parameters
@@ -160,50 +338,51 @@ def get_changed_records(covid_data, prev_data):
     covid_data: DataFrame, merged data with all numeric fields parsed to Integers
         columns: "date", "cases", "deaths", "recoveries"
 
+    prev_data: DataFrame, previous day's/run's data, with a fingerprint field if it was read from the Parquet snapshot
+
     Returns
     ------
     new_records: List, list of dates that are newly added to the daily data set
 
     updated_records: List, list of dates that were previously in the data set that have updated fields
 
+    Each record is reduced to a hash of its count fields, so new and updated dates come from a single comparison of hash arrays
+    aligned on sorted DatetimeIndexes.  Dates of the previous data that the current data no longer has are logged
     """
 
-    for col in ["cases", "deaths", "recoveries"]:
-        prev_data[col] = prev_data[col].apply(int)
+    current = compute_fingerprints(covid_data, COUNT_COLUMNS)
+    previous = stored_fingerprints(prev_data, COUNT_COLUMNS)
 
-    comparison_data = covid_data.merge(prev_data, on=["date"], how="left")
+    current = set_date_index(current, current.index, "Current data")
+    previous = set_date_index(previous, previous.index, "Previous data")
 
-    new_records = comparison_data[comparison_data["cases_y"].isnull()]
-    new_records = list(new_records["date"].unique())
+    new_keys, updated_keys = compare_fingerprints(current, previous)
 
-    comparison_data = comparison_data[comparison_data["cases_y"].notnull()]
+    report_missing_dates({"Previous data": previous.index.difference(current.index)},
+                         "Dates of the previous data are missing from the current data")
 
-    updated_records = []
-    for item in ["cases", "deaths", "recoveries"]:
-        comparison_data[f"{item}_y"] = comparison_data[f"{item}_y"].apply(int)
-        comparison_data[f"{item}_diff"] = (
-            comparison_data[f"{item}_x"] - comparison_data[f"{item}_y"]
-        )
-        diff = comparison_data[comparison_data[f"{item}_diff"] != 0]
-        updated_records = updated_records + list(diff["date"].unique())
+    return list(format_date_index(new_keys.unique())), list(format_date_index(updated_keys.unique()))
 
-    updated_records = list(set(updated_records))
 
-    return new_records, updated_records
-
-
-def add_new_fields(covid_data):
+def add_new_fields(covid_data, count_columns=COUNT_COLUMNS, group_column=None):
     """
     Parameters
     ----------
     covid_data: DataFrame, merged data with all numeric fields parsed to Integers, and date field parsed to Date type
         columns: "date", "cases", "deaths", "recoveries"
 
+    count_columns: List, names of the count fields diffs and logs are derived for
+
+    group_column: str or None, name of the field identifying separate series, e.g. "state".  Diffs are then computed within
+        each series, rows of a series must be in date order
+
     Returns
     ------
     covid_data: DataFrame, merged data with the following derived fields added
         date-diff: Integer difference (days) in dates from record to record, used to detect dates where data wasn't reported
 
+        month: Month name that date represents
+
         day_of_week: Day of week that date represents, used as control in dashboard
 
         cases-diff: Incremental difference in cases from record to record
@@ -212,45 +391,275 @@ def add_new_fields(covid_data):
 
         recoveries-diff: Incremental difference in recoveries from record to record
 
+        cases-log, deaths-log, recoveries-log: Natural log of each count, 0 for counts that are not positive
+
+    Missing counts (e.g. in the county level Data) are kept as missing, as are the diffs next to them
+
+    All fields are computed on whole columns, see tests/benchmark_add_new_fields.py for a comparison with the per-row version
     """
 
-    day_of_week_dict = {
-        0: "Monday",
-        1: "Tuesday",
-        2: "Wednesday",
-        3: "Thursday",
-        4: "Friday",
-        5: "Saturday",
-        6: "Sunday",
-    }
+    dates = pd.to_datetime(covid_data["date"])
 
-    month_dict = {
-        1: "January",
-        2: "February",
-        3: "March",
-        4: "April",
-        5: "May",
-        6: "June",
-        7: "July",
-        8: "August",
-        9: "September",
-        10: "October",
-        11: "November",
-        12: "December",
-    }
+    if group_column is None:
+        date_diff = dates.diff()
+        count_diffs = covid_data[count_columns].diff()
+        first_records = np.arange(len(covid_data)) == 0
+    else:
+        groups = covid_data[group_column].to_numpy()
+        date_diff = dates.groupby(groups, sort=False).diff()
+        count_diffs = covid_data[count_columns].groupby(groups, sort=False).diff()
+        first_records = (covid_data.groupby(groups, sort=False).cumcount() == 0).to_numpy()
 
-    covid_data["date-diff"] = covid_data["date"].diff()
-    covid_data.loc[0, "date-diff"] = pd.Timedelta(value=0, unit="days")
-    covid_data["date-diff"] = covid_data["date-diff"].apply(lambda x: x.days)
+    covid_data["date-diff"] = date_diff.dt.days.fillna(0).astype("int64")
 
-    covid_data["month"] = covid_data["date"].apply(lambda x: month_dict[x.month])
-    covid_data["day_of_week"] = covid_data["date"].apply(
-        lambda x: day_of_week_dict[x.weekday()])
+    covid_data["month"] = dates.dt.month.map(MONTH_NAMES)
+    covid_data["day_of_week"] = dates.dt.dayofweek.map(DAY_OF_WEEK_NAMES)
 
-    for col in ["cases", "deaths", "recoveries"]:
-        covid_data[f"{col}-diff"] = covid_data[col].diff()
-        covid_data.loc[0, f"{col}-diff"] = 0
-        covid_data[f"{col}-diff"] = covid_data[f"{col}-diff"].apply(int)
-        covid_data[f"{col}-log"] = covid_data[col].apply(lambda x: math.log(x) if x > 0 else 0)
+    for col in count_columns:
+        # Only the first record of a series has no predecessor, a diff next to a missing count stays missing
+        count_diff = count_diffs[col].mask(first_records & covid_data[col].notna().to_numpy(), 0)
+        covid_data[f"{col}-diff"] = count_diff.astype("Int64" if count_diff.isna().any() else "int64")
+        covid_data[f"{col}-log"] = log_counts(covid_data[col])
 
     return covid_data
+
+
+def log_counts(counts):
+    """
+    Parameters
+    ----------
+    counts: Series, Integer count field, possibly with missing counts
+
+    Returns
+    ------
+    logs: Series, natural log of each count, 0 where the count is not positive and NaN where it is missing.
+        Integer typed if no count is positive, matching the csv output of the original per-row implementation
+
+    The masks and the result are built on whole columns, only the logs of the positive counts are taken one by one with
+    math.log.  np.log can differ from it in the last digit and the csv output has to stay byte for byte identical to the
+    per-row implementation.  The loop is most of the cost of add_new_fields, about 0.65 s of 1.06 s for 1M rows where np.log
+    would take 0.02 s, see tests/benchmark_add_new_fields.py
+    """
+
+    missing = counts.isna().to_numpy()
+    values = counts.to_numpy(dtype="float64", na_value=np.nan)
+    positive = ~missing & (np.nan_to_num(values) > 0)
+
+    if not positive.any() and not missing.any():
+        return pd.Series(0, index=counts.index, dtype="int64")
+
+    logs = np.zeros(len(values))
+    logs[missing] = np.nan
+    logs[positive] = [math.log(x) for x in counts[positive].tolist()]
+
+    return pd.Series(logs, index=counts.index)
+
+
+def add_new_fields_incremental(covid_data, prev_data, changed_records):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, merged data with all numeric fields parsed to Integers, and date field parsed to Date type
+        columns: "date", "cases", "deaths", "recoveries"
+
+    prev_data: DataFrame, previous day's/run's output of this step
+
+    changed_records: List, list of dates (YYYY-MM-DD) that are new or updated since the previous run
+
+    Returns
+    ------
+    covid_data: DataFrame, same output as add_new_fields.  Rows before the earliest changed date are taken from prev_data,
+        the derived fields are only computed from the row before that date onward, so the diffs of the first recomputed row
+        are still relative to its predecessor.  Falls back to add_new_fields if prev_data does not line up with covid_data,
+        or if it is not the typed Parquet snapshot (no fingerprint field): log fields parsed back from the csv file differ
+        from the computed ones in the last digit, and reusing them would carry that drift into every later run
+    """
+
+    dates_text = covid_data["date"].astype(str)
+    changed_positions = np.flatnonzero(dates_text.isin(set(changed_records)).to_numpy())
+    first_changed = changed_positions[0] if len(changed_positions) > 0 else len(covid_data)
+
+    if first_changed == 0:
+        return add_new_fields(covid_data)
+
+    if FINGERPRINT_COLUMN not in prev_data.columns:
+        logger.info("Previous data is not the typed snapshot, computing all derived fields")
+        return add_new_fields(covid_data)
+
+    stored = prev_data.drop(columns=[FINGERPRINT_COLUMN])
+    stored_prefix = stored.iloc[:first_changed]
+
+    if list(stored_prefix["date"].astype(str)) != list(dates_text.iloc[:first_changed]) or \
+            list(stored.columns) != OUTPUT_COLUMNS:
+        logger.info("Previous data does not line up with current data, computing all derived fields")
+        return add_new_fields(covid_data)
+
+    prefix = stored_prefix.copy()
+    prefix["date"] = covid_data["date"].iloc[:first_changed].to_numpy()
+
+    if first_changed == len(covid_data):
+        return prefix.reset_index(drop=True)
+
+    tail = add_new_fields(covid_data.iloc[first_changed - 1:].reset_index(drop=True))
+
+    extra_data = {
+        "Stored Rows": int(first_changed),
+        "Recomputed Rows": int(len(covid_data) - first_changed),
+    }
+    logger.info("Derived fields computed incrementally", extra=dict(data=extra_data))
+
+    return pd.concat([prefix, tail.iloc[1:][OUTPUT_COLUMNS]], ignore_index=True)
+
+
+def verify_incremental_fields(covid_data, prev_data, changed_records):
+    """
+    Parameters
+    ----------
+    covid_data: DataFrame, merged data with all numeric fields parsed to Integers, and date field parsed to Date type
+        columns: "date", "cases", "deaths", "recoveries"
+
+    prev_data: DataFrame, previous day's/run's output of this step
+
+    changed_records: List, list of dates (YYYY-MM-DD) that are new or updated since the previous run
+
+    Returns
+    ------
+    covid_data: DataFrame, output of add_new_fields.  The incremental output is computed as well and both are compared
+        by their csv serialization, i.e. exactly what the load step writes.  A mismatch is logged as an error
+    """
+
+    incremental = add_new_fields_incremental(
+        covid_data.copy(), prev_data, changed_records)
+    full = add_new_fields(covid_data)
+
+    incremental_rows = incremental.to_csv(index=False).splitlines()
+    full_rows = full.to_csv(index=False).splitlines()
+
+    if incremental_rows == full_rows:
+        logger.info("Incremental derived fields match full computation",
+                    extra=dict(data={"Rows": len(full)}))
+    else:
+        mismatches = [i - 1 for i, (a, b) in enumerate(zip(incremental_rows, full_rows)) if a != b]
+        extra_data = {
+            "Incremental Rows": len(incremental),
+            "Full Rows": len(full),
+            "Mismatched Rows": mismatches[:20],
+        }
+        logger.error("Incremental derived fields do not match full computation",
+                     extra=dict(data=extra_data))
+
+    return full
+
+
+def transform_state_data(states_data, prev_data, workers=1):
+    """
+    Parameters
+    ----------
+    states_data: DataFrame, downloaded NY Times state level Data
+        columns: "date", "state", "fips", "cases", "deaths"
+
+    prev_data: DataFrame or None, previous day's/run's state level data retrieved from s3 Bucket.  On initial load of data, this will be None
+
+    workers: int, number of processes the derived fields are computed with for large data sets, see add_new_fields_partitioned
+
+    Returns
+    ------
+    states_data: DataFrame, state level data in date, state order with the derived fields of add_new_fields computed per state
+
+    new_records: List, list of (state, date) tuples that are newly added to the data set
+
+    updated_records: List, list of (state, date) tuples that were previously in the data set that have updated fields
+
+    The Johns Hopkins Data has no state level recoveries, so only cases and deaths are included
+    """
+
+    try:
+        states_data = states_data[["date", "state", "fips"] + STATE_COUNT_COLUMNS]
+    except:
+        extra_data = {
+            "Column Names": list(states_data.columns)
+        }
+        logger.error("Error selecting state data fields",
+                     extra=dict(data=extra_data))
+        raise
+
+    counts, report = validate_counts(states_data, STATE_COUNT_COLUMNS)
+    if len(report) > 0:
+        logger.error("State count fields contain non-numeric or negative values",
+                     extra=dict(data=report))
+        raise ValueError(f"Invalid count fields: {sorted(report)}")
+
+    states_data = states_data.assign(**{col: counts[col].astype("int64") for col in STATE_COUNT_COLUMNS})
+    states_data = states_data.sort_values(["date", "state"], kind="mergesort").reset_index(drop=True)
+
+    current = compute_fingerprints(states_data, STATE_COUNT_COLUMNS, STATE_KEY_COLUMNS)
+    if prev_data is None:
+        new_keys, updated_keys = current.index, current.index[:0]
+    else:
+        try:
+            previous = stored_fingerprints(prev_data, STATE_COUNT_COLUMNS, STATE_KEY_COLUMNS)
+            new_keys, updated_keys = compare_fingerprints(current, previous)
+        except:
+            logger.error(
+                "Error while getting updated/changed state records, previous data and current data are not comparable")
+            raise
+
+    try:
+        states_data["date"] = states_data["date"].apply(date.fromisoformat)
+    except ValueError:
+        logger.error(
+            "Invalid date field format, field must be in YYYY-MM-DD format")
+        raise
+
+    try:
+        states_data = add_new_fields_partitioned(
+            states_data, STATE_COUNT_COLUMNS, "state", workers)
+    except:
+        logger.error("Error adding new fields to state data")
+        raise
+
+    logger.info("State Data Transformations Complete")
+    return states_data, list(new_keys), list(updated_keys)
+
+
+def add_new_fields_partitioned(data, count_columns, group_column, workers=1):
+    """
+    Parameters
+    ----------
+    data: DataFrame, data set with several series identified by group_column, each in date order
+
+    count_columns: List, names of the count fields diffs and logs are derived for
+
+    group_column: str, name of the field identifying separate series, e.g. "state"
+
+    workers: int, number of processes to use.  The pool is only used for data sets of at least PARTITION_POOL_MIN_ROWS rows
+
+    Returns
+    ------
+    data: DataFrame, output of add_new_fields with group_column, in the input row order
+
+    Small data sets are handled by one grouped, vectorized pass.  Large ones are split into one partition per series and the
+    partitions are spread over a process pool.  Environments without multiprocessing support (e.g. Lambda, which has no /dev/shm)
+    fall back to the grouped pass
+    """
+
+    if workers <= 1 or len(data) < PARTITION_POOL_MIN_ROWS:
+        return add_new_fields(data, count_columns, group_column)
+
+    partitions = [partition for _, partition in data.groupby(group_column, sort=False)]
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                partial(add_new_fields, count_columns=count_columns), partitions))
+    except (OSError, NotImplementedError):
+        logger.warning("Process pool unavailable, computing partitions in a single pass")
+        return add_new_fields(data, count_columns, group_column)
+
+    extra_data = {
+        "Partitions": len(partitions),
+        "Workers": workers,
+    }
+    logger.info("Derived fields computed in process pool", extra=dict(data=extra_data))
+
+    return pd.concat(results).sort_index()
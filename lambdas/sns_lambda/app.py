@@ -16,7 +16,7 @@ def create_message(payload, event_status, environment):
     Parameters
     ----------
     payload: dict
-        Status -- str in {New Data Loaded, Daily Data Updated}
+        Status -- str in {New Data Loaded, Daily Data Updated, No Change}
         New Records -- int, number of new records added since previous run
         Updated Records -- int, number of updated records from this new run
     
@@ -33,7 +33,10 @@ def create_message(payload, event_status, environment):
     
     if event_status == 'Success':
         message = f"Environment: {environment}\n{payload['Status']}\nNumber of New Records: {payload['New Records']}\nNumber of Updated Records: {payload['Updated Records']}"
-        subject = "COVID-19 ETL Process Successful, Data Updated"
+        if payload['Status'] == "No Change":
+            subject = "COVID-19 ETL Process Successful, No Data Changes"
+        else:
+            subject = "COVID-19 ETL Process Successful, Data Updated"
     else:
         message = "An error occured in the COVID-19 ETL Process"
         subject = "COVID-19 ETL Process Unsuccessful"
@@ -0,0 +1,94 @@
+import logging
+import math
+import os
+import sys
+import timeit
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambdas', 'python_etl'))
+
+# The lambda modules attach their JSON formatter to an existing root handler, outside Lambda one has to be created first
+logging.basicConfig(level=logging.WARNING)
+
+from transform_data import add_new_fields, log_counts
+
+ROW_COUNTS = [10000, 100000, 1000000]
+REPEATS = 3
+
+
+def per_row_add_new_fields(covid_data):
+    """
+    Per-row implementation of add_new_fields that the vectorized version replaced, kept as the benchmark baseline
+    """
+
+    day_of_week_dict = {0: "Monday", 1: "Tuesday", 2: "Wednesday", 3: "Thursday", 4: "Friday", 5: "Saturday", 6: "Sunday"}
+    month_dict = {1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 6: "June", 7: "July",
+                  8: "August", 9: "September", 10: "October", 11: "November", 12: "December"}
+
+    covid_data["date-diff"] = covid_data["date"].diff()
+    covid_data.loc[0, "date-diff"] = pd.Timedelta(value=0, unit="days")
+    covid_data["date-diff"] = covid_data["date-diff"].apply(lambda x: x.days)
+
+    covid_data["month"] = covid_data["date"].apply(lambda x: month_dict[x.month])
+    covid_data["day_of_week"] = covid_data["date"].apply(
+        lambda x: day_of_week_dict[x.weekday()])
+
+    for col in ["cases", "deaths", "recoveries"]:
+        covid_data[f"{col}-diff"] = covid_data[col].diff()
+        covid_data.loc[0, f"{col}-diff"] = 0
+        covid_data[f"{col}-diff"] = covid_data[f"{col}-diff"].apply(int)
+        covid_data[f"{col}-log"] = covid_data[col].apply(lambda x: math.log(x) if x > 0 else 0)
+
+    return covid_data
+
+
+def make_data(row_count):
+    """
+    Synthetic merged data set, dates wrap around every ten years so datetime64 stays in range at 1M rows
+    """
+
+    rng = np.random.default_rng(0)
+    start = date(2020, 1, 21)
+
+    return pd.DataFrame({
+        "date": [start + timedelta(days=i % 3650) for i in range(row_count)],
+        "cases": np.cumsum(rng.integers(0, 100000, row_count)),
+        "deaths": np.cumsum(rng.integers(0, 3000, row_count)),
+        "recoveries": np.cumsum(rng.integers(0, 50000, row_count)),
+    })
+
+
+def np_log_counts(counts):
+    """
+    Fully vectorized np.log version of log_counts, for the cost of the math.log loop.  Its output differs in the last digit
+    """
+
+    values = counts.to_numpy(dtype="float64")
+    return pd.Series(np.log(values, out=np.zeros(len(values)), where=values > 0), index=counts.index)
+
+
+def run_benchmark():
+    print(f"{'rows':>10} {'per-row (s)':>12} {'vectorized (s)':>15} {'speedup':>8} {'identical csv':>14} "
+          f"{'math.log (s)':>13} {'np.log (s)':>11}")
+
+    for row_count in ROW_COUNTS:
+        data = make_data(row_count)
+
+        per_row_time = min(timeit.repeat(lambda: per_row_add_new_fields(data.copy()), number=1, repeat=REPEATS))
+        vectorized_time = min(timeit.repeat(lambda: add_new_fields(data.copy()), number=1, repeat=REPEATS))
+
+        identical = (per_row_add_new_fields(data.copy()).to_csv(index=False)
+                     == add_new_fields(data.copy()).to_csv(index=False))
+
+        # Share of the log fields in the vectorized time, and what np.log would cost instead
+        columns = ["cases", "deaths", "recoveries"]
+        math_log_time = min(timeit.repeat(lambda: [log_counts(data[col]) for col in columns], number=1, repeat=REPEATS))
+        np_log_time = min(timeit.repeat(lambda: [np_log_counts(data[col]) for col in columns], number=1, repeat=REPEATS))
+
+        print(f"{row_count:>10} {per_row_time:>12.3f} {vectorized_time:>15.3f} "
+              f"{per_row_time / vectorized_time:>7.1f}x {str(identical):>14} {math_log_time:>13.3f} {np_log_time:>11.3f}")
+
+
+run_benchmark()
@@ -0,0 +1,83 @@
+import logging
+import os
+import sys
+import timeit
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambdas', 'python_etl'))
+
+# The lambda modules attach their JSON formatter to an existing root handler, outside Lambda one has to be created first
+logging.basicConfig(level=logging.WARNING)
+
+from transform_data import transform_data
+
+# setup_logging resets the root level to INFO, the per-stage logs would drown the results
+logging.disable(logging.INFO)
+
+ROW_COUNTS = [1000, 10000, 100000, 1000000]
+ENGINES = ["pandas", "arrow"]
+REPEATS = 3
+
+
+def make_sources(row_count):
+    """
+    Synthetic NY Times and Johns Hopkins downloads with one record per day, previous data lacks the last week and has one
+    revised day so both new and updated records are detected
+    """
+
+    rng = np.random.default_rng(0)
+    start = date(1800, 1, 1)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(row_count)]
+
+    ny_times_data = pd.DataFrame({
+        "date": dates,
+        "cases": np.cumsum(rng.integers(0, 100000, row_count)),
+        "deaths": np.cumsum(rng.integers(0, 3000, row_count)),
+    })
+
+    jh_data = pd.DataFrame({
+        "Date": dates,
+        "Country/Region": "US",
+        "Recovered": np.cumsum(rng.integers(0, 50000, row_count)),
+    })
+
+    prev_data = transform_data(ny_times_data.iloc[:-7], jh_data.iloc[:-7], None)[0]
+    prev_data["date"] = prev_data["date"].astype(str)
+    prev_data.loc[len(prev_data) // 2, "cases"] += 1
+
+    return ny_times_data, jh_data, prev_data
+
+
+def run_benchmark():
+    print(f"{'rows':>10} " + " ".join(f"{engine + ' (s)':>12}" for engine in ENGINES) + f" {'matching':>9}")
+
+    for row_count in ROW_COUNTS:
+        ny_times_data, jh_data, prev_data = make_sources(row_count)
+
+        def run(engine):
+            return transform_data(ny_times_data.copy(), jh_data.copy(), prev_data.copy(), engine=engine)
+
+        times = [min(timeit.repeat(lambda: run(engine), number=1, repeat=REPEATS)) for engine in ENGINES]
+        outputs = [run(engine) for engine in ENGINES]
+
+        matching = all(frames_match(output[0], outputs[0][0]) and output[1:] == outputs[0][1:] for output in outputs)
+
+        print(f"{row_count:>10} " + " ".join(f"{time:>12.3f}" for time in times) + f" {str(matching):>9}")
+
+
+def frames_match(data, expected):
+    """
+    Engines may differ in the last digit of the log fields as Arrow and numpy implement ln separately
+    """
+
+    try:
+        pd.testing.assert_frame_equal(data, expected, check_dtype=False)
+    except AssertionError:
+        return False
+
+    return True
+
+
+run_benchmark()
@@ -24,11 +24,36 @@ def run_smoke_test():
             {
                 'Key': 'testing/acg-covid-data.csv'
             },
+            {
+                'Key': 'testing/acg-covid-data.parquet'
+            },
             {
                 'Key': 'testing/CHANGE_LOG.csv'
+            },
+            {
+                'Key': 'testing/acg-covid-metrics.csv'
+            },
+            {
+                'Key': 'testing/acg-covid-data.json'
+            },
+            {
+                'Key': 'testing/acg-covid-metrics.json'
+            },
+            {
+                'Key': 'testing/source_validators.json'
+            },
+            {
+                'Key': 'testing/sources/ny_times.csv'
+            },
+            {
+                'Key': 'testing/sources/ny_times.json'
             }
         ]
 
+        # Change log segments are named by run id, so they are listed instead
+        res = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix='testing/change_log/')
+        testing_objects += [{'Key': item['Key']} for item in res.get('Contents', [])]
+
         print("Deleting Test Objects From S3")
         res = s3.delete_objects(Bucket=BUCKET_NAME, Delete={'Objects': testing_objects})
         if len(res["Deleted"]) != len(testing_objects):
@@ -0,0 +1,404 @@
+import base64
+import csv
+import datetime
+import gzip
+import io
+import json
+import re
+import pyarrow.parquet as pq
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+from python_etl import load_data, transform_data
+
+BUCKET_NAME = "TEST_BUCKET_NAME"
+KEY_NAME = "production/acg-covid-data.csv"
+LAST_MODIFIED = datetime.datetime(2020, 9, 23, 21, 5, 7, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture()
+def aws_credentials(monkeypatch):
+    """Mocked AWS Credentials for moto."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SECURITY_TOKEN", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-west-2")
+
+
+@pytest.fixture
+def api(monkeypatch, aws_credentials):
+    monkeypatch.setenv("BUCKET_NAME", BUCKET_NAME)
+    monkeypatch.setenv("KEY_NAME", KEY_NAME)
+
+    from covid_api import app
+
+    app.RESPONSE_CACHE.clear()
+    return app
+
+
+class RecordingS3:
+    """Records the S3 Select request and returns the given records as a single event"""
+
+    def __init__(self, records):
+        self.records = records
+        self.request = None
+
+    def select_object_content(self, **kwargs):
+        self.request = kwargs
+        payload = "".join(json.dumps(record) + "\n" for record in self.records)
+        return {"Payload": [{"Records": {"Payload": payload.encode("utf-8")}}, {"End": {}}]}
+
+
+def test_get_dataset_source_csv(api, monkeypatch):
+    monkeypatch.setattr(api, "DATA_FORMAT", "csv")
+
+    assert api.get_dataset_source("daily") == (api.KEY_NAME, "csv")
+    assert api.get_dataset_source("metrics") == (api.METRICS_KEY_NAME, "csv")
+
+
+def test_get_dataset_source_parquet(api, monkeypatch):
+    monkeypatch.setattr(api, "DATA_FORMAT", "parquet")
+
+    assert api.get_dataset_source("daily") == (api.PARQUET_KEY_NAME, "parquet")
+    assert api.get_dataset_source("metrics") == (api.METRICS_KEY_NAME, "csv")
+
+
+def test_get_dataset_source_invalid(api):
+    with pytest.raises(ValueError):
+        api.get_dataset_source("counties")
+
+
+def test_get_covid_data_parquet_projection(api, monkeypatch):
+    s3 = RecordingS3([{"date": "2020-01-23", "cases": 1, "cases-log": 0.6931471805599453}])
+    monkeypatch.setattr(api, "s3", s3)
+
+    records = api.get_covid_data(api.PARQUET_KEY_NAME, "parquet")
+
+    assert list(records[0]) == api.DATA_COLUMNS
+    assert records[0]["cases"] == "1" and records[0]["cases-log"] == "0.6931471805599453" and records[0]["deaths"] == ""
+    assert s3.request["InputSerialization"] == {"Parquet": {}}
+    assert 's."cases-diff"' in s3.request["Expression"]
+    assert "fingerprint" not in s3.request["Expression"]
+
+
+def test_get_covid_data_csv(api, monkeypatch):
+    s3 = RecordingS3([])
+    monkeypatch.setattr(api, "s3", s3)
+
+    assert api.get_covid_data() == []
+    assert s3.request["InputSerialization"] == {"CSV": {"FileHeaderInfo": "Use"}, "CompressionType": "NONE"}
+
+
+def test_get_covid_data_gzip_csv(api, monkeypatch):
+    s3 = RecordingS3([])
+    monkeypatch.setattr(api, "s3", s3)
+
+    api.get_covid_data(api.KEY_NAME, "csv", api.get_compression_type({"ContentEncoding": "gzip"}))
+
+    assert s3.request["InputSerialization"]["CompressionType"] == "GZIP"
+
+
+def test_get_compression_type_uncompressed(api):
+    assert api.get_compression_type({}) == "NONE"
+
+
+class PayloadS3:
+    """Returns the given body from get_object, or a NoSuchKey error if there is none, and counts the calls"""
+
+    def __init__(self, body=None, etag='"1"'):
+        self.body = body
+        self.etag = etag
+        self.calls = []
+
+    def get_object(self, **kwargs):
+        self.calls.append("get_object")
+        if self.body is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.body), "ETag": self.etag, "LastModified": LAST_MODIFIED}
+
+    def head_object(self, **kwargs):
+        self.calls.append("head_object")
+        return {"ETag": self.etag}
+
+
+def payload_body(data):
+    return gzip.compress(json.dumps({"data": data, "last_modified_date": "x"}).encode("utf-8"))
+
+
+def test_lambda_handler_payload_gzip(api, monkeypatch):
+    body = gzip.compress(json.dumps({"data": [{"date": "2020-01-23"}], "last_modified_date": "x"}).encode("utf-8"))
+    monkeypatch.setattr(api, "s3", PayloadS3(body))
+
+    res = api.lambda_handler({"headers": {"Accept-Encoding": "gzip, deflate, br"}}, None)
+
+    assert res["isBase64Encoded"] is True
+    assert res["headers"]["Content-Encoding"] == "gzip"
+    assert base64.b64decode(res["body"]) == body
+
+
+def test_lambda_handler_payload_identity(api, monkeypatch):
+    payload = {"data": [{"date": "2020-01-23"}], "last_modified_date": "x"}
+    monkeypatch.setattr(api, "s3", PayloadS3(gzip.compress(json.dumps(payload).encode("utf-8"))))
+
+    res = api.lambda_handler({"queryStringParameters": {"dataset": "metrics"}}, None)
+
+    assert "Content-Encoding" not in res["headers"]
+    assert json.loads(res["body"]) == payload
+
+
+def test_get_payload_missing(api, monkeypatch):
+    monkeypatch.setattr(api, "s3", PayloadS3())
+
+    assert api.get_payload("daily") is None
+
+
+def test_response_cache_hit(api, monkeypatch):
+    s3 = PayloadS3(payload_body([{"date": "2020-01-23"}]))
+    monkeypatch.setattr(api, "s3", s3)
+    monkeypatch.setattr(api, "RESPONSE_CACHE_SECONDS", 300)
+
+    first = api.lambda_handler({}, None)
+    second = api.lambda_handler({}, None)
+
+    assert first == second
+    assert s3.calls == ["get_object"]
+
+
+def test_response_cache_revalidation(api, monkeypatch):
+    s3 = PayloadS3(payload_body([{"date": "2020-01-23"}]))
+    monkeypatch.setattr(api, "s3", s3)
+    monkeypatch.setattr(api, "RESPONSE_CACHE_SECONDS", 0)
+
+    api.lambda_handler({}, None)
+    api.lambda_handler({}, None)
+    assert s3.calls == ["get_object", "head_object"]
+
+    s3.body, s3.etag = payload_body([{"date": "2020-01-24"}]), '"2"'
+    res = api.lambda_handler({}, None)
+
+    assert s3.calls == ["get_object", "head_object", "head_object", "get_object"]
+    assert json.loads(res["body"])["data"] == [{"date": "2020-01-24"}]
+
+
+def test_seconds_until_next_run(api, monkeypatch):
+    monkeypatch.setattr(api, "ETL_RUN_SECONDS", 600)
+
+    before_run = datetime.datetime(2020, 9, 23, 20, 0, tzinfo=datetime.timezone.utc)
+    after_run = datetime.datetime(2020, 9, 23, 22, 0, tzinfo=datetime.timezone.utc)
+
+    assert api.seconds_until_next_run(before_run) == 3600 + 600
+    assert api.seconds_until_next_run(after_run) == 23 * 3600 + 600
+
+
+def test_lambda_handler_cache_headers(api, monkeypatch):
+    monkeypatch.setattr(api, "s3", PayloadS3(payload_body([])))
+
+    compressed = api.lambda_handler({"headers": {"accept-encoding": "gzip"}}, None)
+    identity = api.lambda_handler({}, None)
+
+    assert compressed["headers"]["Last-Modified"] == "Wed, 23 Sep 2020 21:05:07 GMT"
+    assert compressed["headers"]["Cache-Control"].startswith("public, max-age=")
+    assert compressed["headers"]["Vary"] == "Accept-Encoding"
+    assert compressed["headers"]["ETag"] != identity["headers"]["ETag"]
+
+
+def test_lambda_handler_if_none_match(api, monkeypatch):
+    monkeypatch.setattr(api, "s3", PayloadS3(payload_body([])))
+    etag = api.lambda_handler({}, None)["headers"]["ETag"]
+
+    res = api.lambda_handler({"headers": {"If-None-Match": f'"other", W/{etag}'}}, None)
+
+    assert res["statusCode"] == 304
+    assert res["body"] == ""
+    assert res["headers"]["ETag"] == etag
+
+    assert api.lambda_handler({"headers": {"If-None-Match": '"other"'}}, None)["statusCode"] == 200
+
+
+def test_lambda_handler_if_modified_since(api, monkeypatch):
+    monkeypatch.setattr(api, "s3", PayloadS3(payload_body([])))
+
+    current = api.lambda_handler({"headers": {"If-Modified-Since": "Wed, 23 Sep 2020 21:05:07 GMT"}}, None)
+    stale = api.lambda_handler({"headers": {"If-Modified-Since": "Wed, 23 Sep 2020 21:00:00 GMT"}}, None)
+    invalid = api.lambda_handler({"headers": {"If-Modified-Since": "yesterday"}}, None)
+
+    assert current["statusCode"] == 304
+    assert stale["statusCode"] == 200
+    assert invalid["statusCode"] == 200
+
+
+class QueryS3(RecordingS3):
+    """RecordingS3 with the head_object response of the data set"""
+
+    def head_object(self, **kwargs):
+        return {"ETag": '"1"', "LastModified": LAST_MODIFIED}
+
+
+def test_select_expression_escaping(api):
+    expression = api.select_expression(['da"te'], (("date", ">=", "2020-09-01' or '1'='1"),))
+
+    assert expression == """select s."da""te" from s3object s where s."date" >= '2020-09-01'' or ''1''=''1'"""
+
+
+def test_parse_query(api):
+    assert api.parse_query({"dataset": "daily"}, "daily") is None
+
+    query = api.parse_query({"start": "2020-09-01", "fields": "deaths,cases", "last_n": "30"}, "daily")
+
+    assert query == {"start": "2020-09-01", "end": None, "fields": ["date", "cases", "deaths"], "last_n": 30}
+
+
+@pytest.mark.parametrize("params", [
+    {"start": "09/01/2020"},
+    {"start": "2020-09-02", "end": "2020-09-01"},
+    {"fields": "cases,1=1"},
+    {"last_n": "-1"},
+    {"last_n": "0"},
+])
+def test_parse_query_invalid(api, params):
+    with pytest.raises(ValueError):
+        api.parse_query(params, "daily")
+
+
+def test_lambda_handler_query(api, monkeypatch):
+    s3 = QueryS3([{"date": "2020-09-20", "cases": "5"}])
+    monkeypatch.setattr(api, "s3", s3)
+    monkeypatch.setattr(api, "DATA_FORMAT", "csv")
+
+    res = api.lambda_handler({"queryStringParameters": {"fields": "cases", "last_n": "7", "end": "2020-09-21"}}, None)
+
+    assert res["statusCode"] == 200
+    assert json.loads(res["body"])["data"] == [{"date": "2020-09-20", "cases": "5"}]
+    assert s3.request["Expression"] == (
+        """select s."date", s."cases" from s3object s where s."date" >= '2020-09-16' and s."date" <= '2020-09-21'""")
+    assert api.RESPONSE_CACHE == {}
+
+
+def test_lambda_handler_invalid_query(api, monkeypatch):
+    monkeypatch.setattr(api, "s3", QueryS3([]))
+
+    res = api.lambda_handler({"queryStringParameters": {"fields": "cases;drop"}}, None)
+
+    assert res["statusCode"] == 400
+    assert "Invalid fields" in json.loads(res["body"])["error"]
+
+
+def test_iter_select_records_split_chunks(api):
+    payload = '{"date": "2020-09-20", "state": "Nuevo León"}\n{"date": "2020-09-21"}\n'.encode("utf-8")
+    split = payload.index("ó".encode("utf-8")) + 1
+
+    events = [
+        {"Records": {"Payload": payload[:split]}},
+        {"Records": {"Payload": payload[split:-5]}},
+        {"Records": {"Payload": payload[-5:]}},
+        {"Stats": {"Details": {"BytesScanned": 100, "BytesProcessed": 100, "BytesReturned": len(payload)}}},
+        {"End": {}},
+    ]
+
+    records = list(api.iter_select_records(events))
+
+    assert records == [{"date": "2020-09-20", "state": "Nuevo León"}, {"date": "2020-09-21"}]
+
+
+def test_iter_select_records_yields_before_end(api):
+    def events():
+        yield {"Records": {"Payload": b'{"date": "2020-09-20"}\n{"da'}}
+        raise AssertionError("stream read past the first record")
+
+    assert next(api.iter_select_records(events())) == {"date": "2020-09-20"}
+
+
+@pytest.mark.parametrize("events", [
+    [{"Records": {"Payload": b'{"date": "2020-09-20"}\n'}}],
+    [{"Records": {"Payload": b'{"date": "2020-09-20"}\n'}}, {"Stats": {"Details": {"BytesReturned": 100}}}, {"End": {}}],
+])
+def test_iter_select_records_truncated(api, events):
+    with pytest.raises(IOError):
+        list(api.iter_select_records(events))
+
+
+class SelectS3:
+    """Runs the S3 Select projections and date predicates of the API on a data set, returning records the way S3 Select does:
+    csv fields as text, Parquet fields with their stored types.  get_object returns the precomputed payload"""
+
+    def __init__(self, data):
+        self.csv_records = list(csv.DictReader(io.StringIO(data.to_csv(index=False))))
+        self.parquet_records = pq.read_table(io.BytesIO(load_data.snapshot_to_parquet(
+            data, ["cases", "deaths", "recoveries"]))).to_pylist()
+        self.payload = load_data.api_payload(data, LAST_MODIFIED)
+
+    def head_object(self, **kwargs):
+        return {"ETag": '"1"', "LastModified": LAST_MODIFIED}
+
+    def get_object(self, **kwargs):
+        return {"Body": io.BytesIO(self.payload), "ETag": '"1"', "LastModified": LAST_MODIFIED}
+
+    def select_object_content(self, **kwargs):
+        expression = kwargs["Expression"]
+        projection, _, where = expression.partition(" from s3object s")
+        records = self.parquet_records if "Parquet" in kwargs["InputSerialization"] else self.csv_records
+
+        for field, operator, value in re.findall(r"""s\."([^"]+)" (>=|<=) '([^']+)'""", where):
+            records = [record for record in records
+                       if (record[field] >= value if operator == ">=" else record[field] <= value)]
+
+        fields = re.findall(r's\."([^"]+)"', projection)
+        if len(fields) > 0:
+            records = [{field: record[field] for field in fields} for record in records]
+
+        payload = "".join(json.dumps(record) + "\n" for record in records)
+        return {"Payload": [{"Records": {"Payload": payload.encode("utf-8")}}, {"End": {}}]}
+
+
+@pytest.fixture()
+def daily_data():
+    data = pd.DataFrame({
+        "date": pd.date_range("2020-09-14", "2020-09-23"),
+        "cases": [0, 1, 3, 3, 8, 13, 21, 34, 55, 89],
+        "deaths": [0, 0, 0, 1, 1, 2, 3, 5, 8, 13],
+        "recoveries": [0] * 10,
+    })
+    return transform_data.add_new_fields(data)
+
+
+def daily_response(api, params=None):
+    res = api.lambda_handler({"queryStringParameters": params}, None)
+    assert res["statusCode"] == 200
+    return json.loads(res["body"])["data"]
+
+
+def test_all_paths_return_csv_text(api, monkeypatch, daily_data):
+    monkeypatch.setattr(api, "s3", SelectS3(daily_data))
+
+    monkeypatch.setattr(api, "USE_PAYLOAD", True)
+    payload = daily_response(api)
+
+    monkeypatch.setattr(api, "USE_PAYLOAD", False)
+    monkeypatch.setattr(api, "DATA_FORMAT", "csv")
+    api.RESPONSE_CACHE.clear()
+    csv_data = daily_response(api)
+
+    monkeypatch.setattr(api, "DATA_FORMAT", "parquet")
+    api.RESPONSE_CACHE.clear()
+    parquet_data = daily_response(api)
+
+    assert payload == csv_data == parquet_data
+    assert all(isinstance(value, str) for record in payload for value in record.values())
+    assert payload[-1]["cases-log"] == str(daily_data["cases-log"].iloc[-1])
+
+
+@pytest.mark.parametrize("data_format", ["csv", "parquet"])
+def test_query_matches_unfiltered_response(api, monkeypatch, daily_data, data_format):
+    monkeypatch.setattr(api, "s3", SelectS3(daily_data))
+    monkeypatch.setattr(api, "USE_PAYLOAD", True)
+    monkeypatch.setattr(api, "DATA_FORMAT", data_format)
+
+    unfiltered = daily_response(api)
+    filtered = daily_response(api, {"start": "2020-09-16", "end": "2020-09-20", "fields": "cases-log,deaths"})
+
+    expected = [{field: record[field] for field in ["date", "deaths", "cases-log"]}
+                for record in unfiltered if "2020-09-16" <= record["date"] <= "2020-09-20"]
+
+    assert len(expected) == 5
+    assert filtered == expected
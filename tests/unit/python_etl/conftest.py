@@ -0,0 +1,20 @@
+import pytest
+from moto import mock_s3
+import boto3
+
+REGION = "us-west-2"
+BUCKET_NAME = "TEST_BUCKET_NAME"
+
+
+@pytest.fixture()
+def s3():
+    """moto s3 Client with BUCKET_NAME created, shared by the tests that read and write S3 objects"""
+    with mock_s3():
+        s3 = boto3.client('s3', region_name=REGION)
+        s3.create_bucket(
+            Bucket=BUCKET_NAME,
+            CreateBucketConfiguration={
+                'LocationConstraint': REGION,
+            },
+        )
+        yield s3
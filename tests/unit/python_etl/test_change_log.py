@@ -0,0 +1,105 @@
+import datetime
+import pytest
+from botocore.exceptions import ClientError
+from python_etl import change_log, load_data
+
+BUCKET_NAME = "TEST_BUCKET_NAME"
+PREFIX = "production/change_log"
+
+
+def append_runs(s3, days, min_segments=change_log.COMPACTION_SEGMENTS):
+    run_ids = []
+    for day in days:
+        date = datetime.date(2020, 9, 1) + datetime.timedelta(days=day)
+        records = load_data.create_change_log([date.isoformat()], [(date - datetime.timedelta(days=1)).isoformat()])
+        run_time = datetime.datetime(2020, 9, 1, 21) + datetime.timedelta(days=day)
+        run_ids.append(change_log.append_change_log(records, BUCKET_NAME, PREFIX, s3, run_time, min_segments))
+
+    return run_ids
+
+
+def list_keys(s3):
+    items = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=PREFIX + '/')
+    return sorted(item['Key'][len(PREFIX) + 1:] for item in items.get("Contents", []))
+
+
+def test_append_change_log_writes_segments(s3):
+    run_ids = append_runs(s3, range(2))
+
+    assert run_ids == ["20200901T210000000000Z", "20200902T210000000000Z"]
+    assert list_keys(s3) == [change_log.INDEX_KEY] + [f"segments/run={run_id}.csv" for run_id in run_ids]
+
+    index = change_log.read_index(BUCKET_NAME, PREFIX, s3)
+    assert [run["records"] for run in index["segments"]] == [2, 2]
+
+
+def test_get_changes_between(s3):
+    run_ids = append_runs(s3, range(3))
+
+    changes = change_log.get_changes_between(BUCKET_NAME, PREFIX, s3, run_ids[0], run_ids[2])
+
+    assert list(changes.columns) == ["run_id", "run_timestamp", "date", "status_update"]
+    assert list(changes["run_id"].unique()) == run_ids[1:]
+    assert list(changes["date"]) == ["2020-09-02", "2020-09-01", "2020-09-03", "2020-09-02"]
+    assert changes.loc[0, "run_timestamp"] == "2020-09-02T21:00:00"
+
+
+def test_get_changes_between_no_runs(s3):
+    changes = change_log.get_changes_between(BUCKET_NAME, PREFIX, s3)
+
+    assert len(changes) == 0
+    assert list(changes.columns) == ["run_id", "run_timestamp", "date", "status_update"]
+
+
+def test_compaction(s3):
+    run_ids = append_runs(s3, range(5), min_segments=3)
+
+    compacted_key = f"compacted/runs={run_ids[0]}_{run_ids[2]}.csv"
+    assert list_keys(s3) == [compacted_key, change_log.INDEX_KEY] + [f"segments/run={run_id}.csv" for run_id in run_ids[3:]]
+
+    changes = change_log.get_changes_between(BUCKET_NAME, PREFIX, s3, run_ids[1], run_ids[3])
+    assert list(changes["run_id"].unique()) == run_ids[2:4]
+
+    index = change_log.read_index(BUCKET_NAME, PREFIX, s3)
+    assert [run["run_id"] for run in index["segments"]] == run_ids[3:]
+    assert index["compacted"] == [{"key": compacted_key, "first_run_id": run_ids[0], "last_run_id": run_ids[2],
+                                   "runs": 3, "records": 6}]
+
+    assert change_log.compact_change_log(BUCKET_NAME, PREFIX, s3, min_segments=3) is None
+    assert len(change_log.get_changes_between(BUCKET_NAME, PREFIX, s3)) == 10
+
+
+class FailingIndexS3:
+    """Passes calls through to the s3 Client, but fails every get_object of the index with the given error code"""
+
+    def __init__(self, s3, code):
+        self.s3 = s3
+        self.code = code
+
+    def get_object(self, **kwargs):
+        if kwargs["Key"].endswith(change_log.INDEX_KEY):
+            raise ClientError({"Error": {"Code": self.code}}, "GetObject")
+        return self.s3.get_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.s3, name)
+
+
+@pytest.mark.parametrize("code", ["SlowDown", "AccessDenied", "InternalError"])
+def test_append_change_log_keeps_index_on_read_error(s3, code):
+    append_runs(s3, range(2))
+    before = s3.get_object(Bucket=BUCKET_NAME, Key=PREFIX + '/' + change_log.INDEX_KEY)["Body"].read()
+
+    records = load_data.create_change_log(["2020-09-10"], [])
+    with pytest.raises(ClientError):
+        change_log.append_change_log(records, BUCKET_NAME, PREFIX, FailingIndexS3(s3, code))
+
+    assert s3.get_object(Bucket=BUCKET_NAME, Key=PREFIX + '/' + change_log.INDEX_KEY)["Body"].read() == before
+    assert len(list_keys(s3)) == 3
+
+
+def test_read_index_corrupt(s3):
+    s3.put_object(Bucket=BUCKET_NAME, Body=b"{", Key=PREFIX + '/' + change_log.INDEX_KEY)
+
+    with pytest.raises(ValueError):
+        change_log.read_index(BUCKET_NAME, PREFIX, s3)
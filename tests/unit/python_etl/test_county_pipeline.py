@@ -0,0 +1,156 @@
+import http.server
+import io
+import json
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from moto import mock_s3
+import boto3
+from python_etl import county_pipeline
+
+REGION = "us-west-2"
+BUCKET_NAME = "TEST_BUCKET_NAME"
+PREFIX = "production/counties"
+
+
+@pytest.fixture()
+def counties_data():
+    return pd.DataFrame({
+        "date": ["2020-03-31", "2020-03-31", "2020-04-01", "2020-04-01", "2020-04-02", "2020-04-02"],
+        "county": ["King", "New York City", "King", "New York City", "King", "New York City"],
+        "state": ["Washington", "New York", "Washington", "New York", "Washington", "New York"],
+        "fips": ["53033", None, "53033", None, "53033", None],
+        "cases": [10, 100, 15, 130, 22, None],
+        "deaths": [1, 5, 2, 9, 2, 12]
+    })
+
+
+def test_prepare_county_chunk_keys(counties_data):
+    chunk = county_pipeline.prepare_county_chunk(counties_data)
+
+    assert list(chunk[county_pipeline.COUNTY_KEY_COLUMN].unique()) == ["53033", "New York|New York City"]
+    assert chunk["cases"].isna().tolist() == [False] * 5 + [True]
+    assert str(chunk["cases"].dtype) == "Int64"
+
+
+def test_add_county_fields_keeps_missing_counts(counties_data):
+    chunk = county_pipeline.add_county_fields(county_pipeline.prepare_county_chunk(counties_data), None)
+
+    assert chunk["cases-diff"].tolist()[:5] == [0, 0, 5, 30, 7]
+    assert chunk["cases-diff"].isna().tolist() == [False] * 5 + [True]
+    assert chunk["deaths-diff"].tolist() == [0, 0, 1, 4, 0, 3]
+
+
+def test_add_county_fields_across_chunks(counties_data):
+    counties_data = county_pipeline.prepare_county_chunk(counties_data)
+
+    single_pass = county_pipeline.add_county_fields(counties_data, None)
+
+    first = county_pipeline.add_county_fields(counties_data.iloc[:3].reset_index(drop=True), None)
+    carry = county_pipeline.update_carry(None, first)
+    second = county_pipeline.add_county_fields(counties_data.iloc[3:].reset_index(drop=True), carry)
+
+    chunked = pd.concat([first, second], ignore_index=True)
+
+    assert chunked.to_csv(index=False) == single_pass.to_csv(index=False)
+    assert len(county_pipeline.update_carry(carry, second)) == 2
+
+
+@mock_s3
+def test_partition_writer(counties_data):
+    s3 = boto3.client('s3')
+
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    chunk = county_pipeline.add_county_fields(county_pipeline.prepare_county_chunk(counties_data), None)
+
+    writer = county_pipeline.PartitionWriter(BUCKET_NAME, PREFIX, s3, 10 ** 6)
+    writer.add(chunk, 100)
+    manifest = writer.close()
+
+    assert sorted(manifest["partitions"]) == ["year=2020/month=03", "year=2020/month=04"]
+    assert manifest["partitions"]["year=2020/month=04"]["rows"] == 4
+
+    stored_manifest = json.loads(s3.get_object(Bucket=BUCKET_NAME, Key=PREFIX + "/manifest.json")["Body"].read())
+    assert stored_manifest["partitions"] == manifest["partitions"]
+
+
+class CountiesHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def counties_source():
+    dates = pd.date_range("2020-03-01", "2020-04-30").strftime("%Y-%m-%d")
+    counties = [f"{53000 + i}" for i in range(50)]
+    rng = np.random.default_rng(0)
+
+    data = pd.DataFrame({
+        "date": np.repeat(dates, len(counties)),
+        "county": [f"County {fips}" for fips in counties] * len(dates),
+        "state": "Washington",
+        "fips": counties * len(dates),
+    })
+    cumulative = rng.integers(0, 20, size=(len(data), 2)).reshape(len(dates), len(counties), 2).cumsum(axis=0)
+    data["cases"] = pd.array(cumulative[:, :, 0].ravel(), dtype="Int64")
+    data["deaths"] = pd.array(cumulative[:, :, 1].ravel(), dtype="Int64")
+    data.loc[rng.choice(len(data), size=20, replace=False), "cases"] = pd.NA
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), CountiesHandler)
+    server.body = data.to_csv(index=False).encode("utf-8")
+    server.url = f"http://127.0.0.1:{server.server_port}/us-counties.csv"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@mock_s3
+def test_run_county_pipeline_small_budget(counties_source, monkeypatch):
+    monkeypatch.setenv("TEST_NYT_COUNTIES_URL", counties_source.url)
+    s3 = boto3.client('s3', region_name=REGION)
+
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    summary = county_pipeline.run_county_pipeline("testing", BUCKET_NAME, "counties", s3, memory_budget_mb=0.001)
+
+    assert summary["Rows"] == 61 * 50 and summary["Counties"] == 50 and summary["Partitions"] == 2
+    assert summary["Parts"] > summary["Partitions"]
+
+    key_prefix = "testing/counties"
+    manifest = json.loads(s3.get_object(Bucket=BUCKET_NAME, Key=key_prefix + "/manifest.json")["Body"].read())
+    parts = [s3.get_object(Bucket=BUCKET_NAME, Key=key_prefix + '/' + part)["Body"].read().decode("utf-8")
+             for name in sorted(manifest["partitions"]) for part in manifest["partitions"][name]["parts"]]
+    written = pd.concat([pd.read_csv(io.StringIO(part), dtype=str, keep_default_na=False) for part in parts],
+                        ignore_index=True)
+
+    source = pd.read_csv(io.BytesIO(counties_source.body), dtype=county_pipeline.COUNTY_DTYPES)
+    expected = county_pipeline.add_county_fields(county_pipeline.prepare_county_chunk(source), None)
+    expected = expected.drop(columns=[county_pipeline.COUNTY_KEY_COLUMN])
+    expected = pd.read_csv(io.StringIO(expected.to_csv(index=False)), dtype=str, keep_default_na=False)
+
+    written = written.sort_values(["date", "fips"]).reset_index(drop=True)
+    expected = expected.sort_values(["date", "fips"]).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(written, expected)
+    assert (written["cases"] == "").sum() == 20
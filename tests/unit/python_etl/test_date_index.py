@@ -0,0 +1,35 @@
+import pandas as pd
+from python_etl import date_index
+
+
+def test_set_date_index_sorts_once():
+    data = pd.DataFrame({"cases": [2, 1, 3]})
+
+    data = date_index.set_date_index(data, ["2020-01-23", "2020-01-22", "2020-01-24"], "Test")
+
+    assert list(data["cases"]) == [1, 2, 3]
+    assert data.index.is_monotonic_increasing
+    assert data.index.name == "date"
+
+
+def test_date_ranges():
+    dates = ["2020-01-21", "2020-03-10", "2020-03-11", "2020-03-12", "2020-03-14"]
+
+    assert date_index.date_ranges(dates) == [
+        ["2020-01-21", "2020-01-21"],
+        ["2020-03-10", "2020-03-12"],
+        ["2020-03-14", "2020-03-14"],
+    ]
+
+
+def test_date_ranges_empty():
+    assert date_index.date_ranges([]) == []
+
+
+def test_report_missing_dates_skips_complete_sources():
+    report = date_index.report_missing_dates({
+        "NY Times": pd.DatetimeIndex(["2020-01-21"]),
+        "Johns Hopkins": pd.DatetimeIndex([]),
+    }, "Test")
+
+    assert report == {"NY Times": {"count": 1, "ranges": [["2020-01-21", "2020-01-21"]]}}
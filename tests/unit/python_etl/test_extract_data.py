@@ -1,4 +1,9 @@
+import datetime
+import http.server
+import json
 import os
+import sys
+import threading
 import pytest
 from moto import mock_s3
 import boto3
@@ -81,4 +86,321 @@ def test_extract_data_with_prev_data(mock_environment_variables):
     if len(prev_data) == 0:
         err_msg += "There is an error in the s3 GET logic, all data removed"
 
-    assert err_msg == ''
\ No newline at end of file
+    assert err_msg == ''
+
+@mock_s3
+def test_extract_data_concurrent(mock_environment_variables):
+
+    s3 = boto3.client('s3')
+        
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    with open(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'), 'rb') as data:
+        s3.upload_fileobj(data, BUCKET_NAME, ENVIRONMENT + '/' + PREV_DATA)
+
+    sequential = extract_data.extract_data(ENVIRONMENT, BUCKET_NAME, PREV_DATA, s3)
+    concurrent = extract_data.extract_data(ENVIRONMENT, BUCKET_NAME, PREV_DATA, s3, concurrent=True)
+
+    for sequential_data, concurrent_data in zip(sequential, concurrent):
+        assert sequential_data.equals(concurrent_data)
+
+
+def test_fetch_sources_concurrently_fails_fast():
+
+    def failing_fetch():
+        raise ValueError("source unavailable")
+
+    sources = [
+        ("ok", lambda: pd.DataFrame({"a": [1]}), "Error with ok source"),
+        ("failing", failing_fetch, "Error with failing source"),
+    ]
+
+    with pytest.raises(ValueError):
+        extract_data.fetch_sources_concurrently(sources)
+
+
+@mock_s3
+def test_extract_data_unchanged_sources(mock_environment_variables):
+
+    s3 = boto3.client('s3')
+        
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    with open(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'), 'rb') as data:
+        s3.upload_fileobj(data, BUCKET_NAME, ENVIRONMENT + '/' + PREV_DATA)
+
+    validators = extract_data.load_source_validators(ENVIRONMENT, BUCKET_NAME, s3)
+    extract_data.extract_data(ENVIRONMENT, BUCKET_NAME, PREV_DATA, s3, validators=validators)
+    extract_data.save_source_validators(ENVIRONMENT, BUCKET_NAME, validators, s3)
+
+    validators = extract_data.load_source_validators(ENVIRONMENT, BUCKET_NAME, s3)
+    nyt_data, jh_data, prev_data = extract_data.extract_data(ENVIRONMENT, BUCKET_NAME, PREV_DATA, s3, validators=validators)
+
+    assert nyt_data is None and jh_data is None and prev_data is not None
+
+
+def test_read_jh_data_filters_to_us_records():
+
+    jh_data = extract_data.read_jh_data(
+        os.path.join(os.path.dirname(__file__), 'test_jh_data.csv'), chunksize=1)
+
+    assert list(jh_data.columns) == ["Date", "Country/Region", "Recovered"]
+    assert set(jh_data["Country/Region"]) == {"US"}
+    assert len(jh_data) == 3
+
+
+test_cases = [
+    (b"date,cases\n2020-09-20,1\n2020-09-21,2\n", b"2020-09-21,2\n"),
+    (b"date,cases\n2020-09-20,1\n2020-09-21,2", b"2020-09-21,2"),
+    (b"date,cases\n", b"date,cases\n"),
+]
+
+
+@pytest.mark.parametrize("body,last_row", test_cases)
+def test_get_last_row(body, last_row):
+    assert extract_data.get_last_row(body) == last_row
+
+
+@mock_s3
+def test_extract_previous_data_prefers_snapshot():
+
+    s3 = boto3.client('s3')
+        
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    csv_data = pd.read_csv(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'))
+    snapshot = csv_data.iloc[:1]
+
+    s3.put_object(Bucket=BUCKET_NAME, Body=csv_data.to_csv(index=False), Key=ENVIRONMENT + '/' + PREV_DATA)
+    s3.put_object(Bucket=BUCKET_NAME, Body=snapshot.to_parquet(index=False), Key=ENVIRONMENT + '/acg-covid-data.parquet')
+
+    prev_data = extract_data.extract_previous_data(BUCKET_NAME, ENVIRONMENT + '/' + PREV_DATA, s3)
+
+    assert len(prev_data) == 1
+
+
+class AppendOnlyHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.body, honouring single open ended Range headers like raw.githubusercontent.com"""
+
+    def do_GET(self):
+        body = self.server.body
+        range_header = self.headers.get("Range")
+        self.server.ranges.append(range_header)
+
+        etag = '"%d"' % len(body)
+        if self.headers.get("If-None-Match") == etag:
+            self.server.statuses.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        if range_header is None:
+            self.server.statuses.append(200)
+            self.send_response(200)
+            self.send_header("ETag", etag)
+        else:
+            start = int(range_header[len("bytes="):-1])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            body = body[start:]
+
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def source_server():
+    server = http.server.HTTPServer(("127.0.0.1", 0), AppendOnlyHandler)
+    server.body = b"date,cases\n2020-09-20,1\n2020-09-21,2\n"
+    server.ranges = []
+    server.statuses = []
+    server.url = f"http://127.0.0.1:{server.server_port}/us.csv"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+TAIL_KEY = ENVIRONMENT + '/' + extract_data.TAIL_STATE_PREFIX + "ny_times"
+
+
+def fetch(source_server, s3):
+    path, changed, tail_update = extract_data.fetch_appended(source_server.url, BUCKET_NAME, TAIL_KEY, s3)
+    with open(path, "rb") as f:
+        body = f.read()
+    os.remove(path)
+
+    return body, changed, tail_update
+
+
+def fetch_and_save(source_server, s3):
+    path, changed, tail_update = extract_data.fetch_appended(source_server.url, BUCKET_NAME, TAIL_KEY, s3)
+    if tail_update is not None:
+        extract_data.save_source_validators(ENVIRONMENT, BUCKET_NAME, None, s3, {"ny_times": tail_update})
+
+    with open(path, "rb") as f:
+        body = f.read()
+    os.remove(path)
+
+    return body, changed, tail_update
+
+
+def test_fetch_appended_writes_nothing_before_load(source_server, s3):
+    path, changed, tail_update = extract_data.fetch_appended(source_server.url, BUCKET_NAME, TAIL_KEY, s3)
+
+    assert tail_update["path"] == path and open(path, "rb").read() == source_server.body and changed
+    assert tail_update["state"]["length"] == len(source_server.body)
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET_NAME)
+
+    extract_data.discard_tail_updates({"ny_times": tail_update})
+    assert not os.path.exists(path)
+
+
+def test_fetch_appended_failed_load_is_retried(source_server, s3):
+    fetch_and_save(source_server, s3)
+    source_server.body += b"2020-09-22,3\n"
+
+    # The run fails after extract, so nothing is saved and the retry still sees the appended row as a change
+    fetch(source_server, s3)
+    body, changed, _ = fetch(source_server, s3)
+
+    assert body == source_server.body and changed
+
+
+def test_fetch_appended_tail(source_server, s3):
+    fetch_and_save(source_server, s3)
+    source_server.body += b"2020-09-22,3\n"
+
+    body, changed, tail_update = fetch_and_save(source_server, s3)
+
+    assert body == source_server.body and changed
+    assert source_server.ranges == [None, "bytes=24-"]
+    assert tail_update["state"]["length"] == len(body)
+
+    body, changed, tail_update = fetch_and_save(source_server, s3)
+    assert body == source_server.body and not changed and tail_update is None
+
+
+def test_fetch_appended_416_falls_back(source_server, s3):
+    fetch_and_save(source_server, s3)
+    source_server.body = b"date,cases\n"
+
+    body, changed, _ = fetch_and_save(source_server, s3)
+
+    assert body == source_server.body and changed
+    assert source_server.ranges[-2:] == ["bytes=24-", None]
+
+
+def test_fetch_appended_changed_last_row_falls_back(source_server, s3):
+    fetch_and_save(source_server, s3)
+    source_server.body = b"date,cases\n2020-09-20,1\n2020-09-21,5\n2020-09-22,6\n"
+
+    body, changed, _ = fetch_and_save(source_server, s3)
+
+    assert body == source_server.body and changed
+    assert source_server.ranges[-2:] == ["bytes=24-", None]
+
+
+def test_fetch_appended_stale_state_falls_back(source_server, s3):
+    _, _, tail_update = fetch_and_save(source_server, s3)
+    state = dict(tail_update["state"], full_fetch_at=(
+        datetime.datetime.utcnow() - datetime.timedelta(days=extract_data.TAIL_FULL_FETCH_DAYS)).isoformat())
+    s3.put_object(Bucket=BUCKET_NAME, Body=json.dumps(state), Key=TAIL_KEY + ".json")
+
+    body, changed, tail_update = fetch_and_save(source_server, s3)
+
+    assert body == source_server.body and not changed
+    assert source_server.ranges == [None, None]
+    # The periodic full download restarts the tail fetch period
+    assert tail_update["state"]["full_fetch_at"] > state["full_fetch_at"]
+
+
+def test_read_source_conditional_streams_to_disk(source_server, monkeypatch):
+    monkeypatch.setattr(extract_data, "DOWNLOAD_BLOCK_BYTES", 8)
+    sources = []
+
+    def reader(source):
+        sources.append(source)
+        return pd.read_csv(source)
+
+    validators = {}
+    data = extract_data.read_source("ny_times", source_server.url, validators, reader)
+
+    assert data["cases"].tolist() == [1, 2]
+    assert sources[0].closed and not os.path.exists(sources[0].name)
+    assert validators["ny_times"]["url"] == source_server.url
+
+
+def test_read_source_conditional_reuses_cache(source_server, monkeypatch, tmp_path):
+    # extract_data imports local_cache as a top level module
+    local_cache = sys.modules[extract_data.open_cached.__module__]
+    monkeypatch.setattr(local_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(local_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(local_cache, "CACHE_RESERVED_BYTES", 0)
+
+    first_run = {}
+    extract_data.read_source("ny_times", source_server.url, first_run)
+
+    # The first run failed before saving its validators, the retry revalidates the cached copy instead
+    retry = {}
+    data = extract_data.read_source("ny_times", source_server.url, retry)
+
+    assert data["cases"].tolist() == [1, 2]
+    assert source_server.statuses == [200, 304]
+    assert retry == first_run
+
+    assert extract_data.read_source("ny_times", source_server.url, dict(retry)) is None
+    assert source_server.statuses == [200, 304, 304]
+
+
+def test_read_last_row_block_boundary(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract_data, "LAST_ROW_BLOCK_BYTES", 4)
+    path = tmp_path / "us.csv"
+    path.write_bytes(b"date,cases\n2020-09-20,1\n2020-09-21,2\n")
+
+    assert extract_data.read_last_row(str(path)) == b"2020-09-21,2\n"
+
+
+def test_read_source_tail_keeps_copy_until_discarded(source_server, s3):
+    tail_store = (BUCKET_NAME, TAIL_KEY, s3)
+    tail_updates = {}
+
+    data = extract_data.read_source("ny_times", source_server.url, None, pd.read_csv, tail_store, tail_updates)
+    first_path = tail_updates["ny_times"]["path"]
+
+    # A second fetch in the same run replaces the first copy
+    extract_data.read_source("ny_times", source_server.url, None, pd.read_csv, tail_store, tail_updates)
+    path = tail_updates["ny_times"]["path"]
+
+    assert data["cases"].tolist() == [1, 2]
+    assert path != first_path and not os.path.exists(first_path) and os.path.exists(path)
+    extract_data.save_source_validators(ENVIRONMENT, BUCKET_NAME, None, s3, tail_updates)
+    extract_data.discard_tail_updates(tail_updates)
+
+    assert not os.path.exists(path)
+    assert s3.get_object(Bucket=BUCKET_NAME, Key=TAIL_KEY + ".csv")["Body"].read() == source_server.body
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+from python_etl import fingerprints
+
+VALUE_COLUMNS = ["cases", "deaths", "recoveries"]
+
+
+@pytest.fixture()
+def prev_data():
+    return pd.DataFrame(data={
+        "date": ["2020-01-22", "2020-01-23"],
+        "cases": [1, 2],
+        "deaths": [0, 0],
+        "recoveries": [0, 1]
+    })
+
+
+@pytest.fixture()
+def covid_data():
+    return pd.DataFrame(data={
+        "date": ["2020-01-22", "2020-01-23", "2020-01-24"],
+        "cases": [1, 3, 4],
+        "deaths": [0, 0, 1],
+        "recoveries": [0, 1, 1]
+    })
+
+
+def test_fingerprints_ignore_storage_type(prev_data):
+    as_int = fingerprints.compute_fingerprints(prev_data, VALUE_COLUMNS)
+    as_float = fingerprints.compute_fingerprints(prev_data.astype({"cases": "float64"}), VALUE_COLUMNS)
+
+    assert (as_int == as_float).all()
+
+
+def test_compare_fingerprints(prev_data, covid_data):
+    current = fingerprints.compute_fingerprints(covid_data, VALUE_COLUMNS)
+    previous = fingerprints.compute_fingerprints(prev_data, VALUE_COLUMNS)
+
+    new_keys, updated_keys = fingerprints.compare_fingerprints(current, previous)
+
+    assert list(new_keys) == ["2020-01-24"]
+    assert list(updated_keys) == ["2020-01-23"]
+
+
+def test_stored_fingerprints_used(prev_data):
+    prev_data[fingerprints.FINGERPRINT_COLUMN] = [7, 8]
+
+    stored = fingerprints.stored_fingerprints(prev_data, VALUE_COLUMNS)
+
+    assert list(stored) == [7, 8]
@@ -1,3 +1,7 @@
+import datetime
+import gzip
+import io
+import json
 import os
 import pytest
 from moto import mock_s3
@@ -8,6 +12,8 @@ from python_etl import load_data
 REGION = "us-west-2"
 BUCKET_NAME = "TEST_BUCKET_NAME"
 KEY = "acg-covid-data.csv"
+SNAPSHOT = "acg-covid-data.parquet"
+PAYLOAD = "acg-covid-data.json"
 CHANGE_LOG = "CHANGE_LOG.csv"
 ENVIRONMENT = "production"
 
@@ -31,6 +37,17 @@ def test_create_change_log():
     assert err_msg == ''
 
 
+def test_create_state_change_log():
+
+    new_records = [("Washington", "2020-09-23"), ("New York", "2020-09-23")]
+    updated_records = [("New York", "2020-09-22")]
+
+    change_log = load_data.create_state_change_log(new_records, updated_records)
+
+    assert list(change_log.columns) == ["state", "date", "status_update"]
+    assert list(change_log["status_update"]) == ["UPDATED_RECORD", "NEW RECORD", "NEW RECORD"]
+
+
 @mock_s3
 def test_load_data():
 
@@ -52,5 +69,71 @@ def test_load_data():
     items = s3.list_objects_v2(Bucket=BUCKET_NAME)
 
     keys = set([item['Key'] for item in items["Contents"]])
+    change_log_keys = set([key for key in keys if key.startswith(ENVIRONMENT + '/change_log/')])
+
+    assert set([ENVIRONMENT + '/' + KEY, ENVIRONMENT + '/' + SNAPSHOT, ENVIRONMENT + '/' + CHANGE_LOG,
+                ENVIRONMENT + '/' + PAYLOAD]) == keys - change_log_keys
+    assert len(change_log_keys) == 2
+
+
+@mock_s3
+def test_load_data_snapshot_types():
+
+    s3 = boto3.client('s3')
+        
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    new_data = pd.read_csv(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'))
+
+    load_data.upload_snapshot_to_s3(new_data, ENVIRONMENT, BUCKET_NAME, KEY, s3)
+
+    res = s3.get_object(Bucket=BUCKET_NAME, Key=ENVIRONMENT + '/' + SNAPSHOT)
+    snapshot = pd.read_parquet(io.BytesIO(res["Body"].read()))
+
+    assert snapshot["cases"].dtype == "int64"
+    assert list(snapshot["date"]) == list(new_data["date"])
+
+
+@mock_s3
+def test_load_data_snapshot_layout():
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    s3 = boto3.client('s3')
+
+    s3.create_bucket(
+        Bucket=BUCKET_NAME,
+        CreateBucketConfiguration={
+            'LocationConstraint': REGION,
+        },
+    )
+
+    new_data = pd.read_csv(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'))
+    new_data = pd.concat([new_data] * 400, ignore_index=True)
+
+    load_data.upload_snapshot_to_s3(new_data, ENVIRONMENT, BUCKET_NAME, KEY, s3)
+
+    res = s3.get_object(Bucket=BUCKET_NAME, Key=ENVIRONMENT + '/' + SNAPSHOT)
+    metadata = pq.ParquetFile(io.BytesIO(res["Body"].read())).metadata
+
+    assert metadata.num_row_groups == -(-len(new_data) // load_data.PARQUET_ROW_GROUP_SIZE)
+    column = metadata.row_group(0).column(0)
+    assert column.compression == load_data.PARQUET_COMPRESSION.upper()
+    assert column.statistics.has_min_max
+
+
+def test_api_payload():
+    new_data = pd.read_csv(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'))
+
+    body = load_data.api_payload(new_data, datetime.datetime(2020, 9, 23, 21, 5, 7))
+    payload = json.loads(gzip.decompress(body))
 
-    assert set([ENVIRONMENT + '/' + KEY, ENVIRONMENT + '/' + CHANGE_LOG]) == keys
+    assert payload["last_modified_date"] == "09/23/2020, 21:05:07"
+    assert len(payload["data"]) == len(new_data)
+    # Fields are text, as S3 Select returns them from the csv file
+    assert payload["data"][0]["cases"] == str(new_data.loc[0, "cases"])
+    assert list(payload["data"][0]) == list(new_data.columns)
@@ -0,0 +1,90 @@
+import io
+import os
+import pytest
+from python_etl import local_cache
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(local_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(local_cache, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(local_cache, "CACHE_MAX_BYTES", 1000)
+    monkeypatch.setattr(local_cache, "CACHE_RESERVED_BYTES", 0)
+    return tmp_path
+
+
+def test_cache_miss_then_hit(cache_dir):
+    key = local_cache.cache_key("source", "https://example.com/us.csv")
+
+    assert local_cache.get_cached(key, "us.csv") is None
+
+    local_cache.put_cached(key, b"date,cases\n")
+
+    assert local_cache.get_cached(key, "us.csv") == b"date,cases\n"
+
+
+def test_cache_file_like_body(cache_dir):
+    key = local_cache.cache_key("source", "https://example.com/us.csv")
+
+    path = local_cache.put_cached(key, io.BytesIO(b"date,cases\n"), 11)
+
+    assert path is not None and open(path, "rb").read() == b"date,cases\n"
+
+
+def test_cache_expired_entry(cache_dir, monkeypatch):
+    key = local_cache.cache_key("source", "https://example.com/us.csv")
+    local_cache.put_cached(key, b"date,cases\n")
+
+    monkeypatch.setattr(local_cache, "CACHE_TTL_SECONDS", -1)
+
+    assert local_cache.get_cached(key, "us.csv") is None
+
+
+def test_cache_size_eviction(cache_dir):
+    for i in range(5):
+        local_cache.put_cached(local_cache.cache_key(str(i)), b"x" * 400)
+
+    cached_bytes = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+    assert cached_bytes <= 1000
+    assert local_cache.get_cached(local_cache.cache_key("4"), "4") is not None
+
+
+def test_cache_disabled(cache_dir, monkeypatch):
+    monkeypatch.setattr(local_cache, "CACHE_ENABLED", False)
+    key = local_cache.cache_key("source", "https://example.com/us.csv")
+
+    assert local_cache.put_cached(key, b"date,cases\n") is None
+    assert local_cache.get_cached(key, "us.csv") is None
+
+
+def test_move_to_cache(cache_dir, tmp_path_factory):
+    key = local_cache.cache_key("source", "https://example.com/us.csv")
+    download = tmp_path_factory.mktemp("download") / "us.csv"
+    download.write_bytes(b"date,cases\n")
+
+    with local_cache.move_to_cache(key, str(download), {"ETag": '"1"'}) as cached_file:
+        assert cached_file.read() == b"date,cases\n"
+
+    assert not download.exists()
+    assert local_cache.get_cached(key, "us.csv") == b"date,cases\n"
+    assert local_cache.get_cached_metadata(key) == {"ETag": '"1"'}
+
+
+def test_move_to_cache_too_large(cache_dir, tmp_path_factory):
+    download = tmp_path_factory.mktemp("download") / "us.csv"
+    download.write_bytes(b"x" * 2000)
+
+    assert local_cache.move_to_cache(local_cache.cache_key("large"), str(download)) is None
+    assert download.exists()
+
+
+def test_evict_keeps_opened_object_readable(cache_dir):
+    key = local_cache.cache_key("source", "https://example.com/us.csv")
+    local_cache.put_cached(key, b"date,cases\n")
+
+    with local_cache.open_cached(key, "us.csv") as cached_file:
+        local_cache.evict(1000)
+
+        assert local_cache.get_cached(key, "us.csv") is None
+        assert cached_file.read() == b"date,cases\n"
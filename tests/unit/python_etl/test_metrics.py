@@ -0,0 +1,93 @@
+import datetime
+import pandas as pd
+import pytest
+from python_etl import metrics, transform_data
+
+
+def make_covid_data(days, start=datetime.date(2020, 3, 1)):
+    covid_data = pd.DataFrame({
+        "date": [start + datetime.timedelta(days=i) for i in days],
+        "cases": [10 * 2 ** (i / 7) for i in days],
+        "deaths": [i for i in days],
+        "recoveries": [0 for i in days],
+    })
+    covid_data[transform_data.COUNT_COLUMNS] = covid_data[transform_data.COUNT_COLUMNS].round().astype("int64")
+
+    return transform_data.add_new_fields(covid_data)
+
+
+@pytest.fixture()
+def covid_data():
+    return make_covid_data(range(30))
+
+
+def test_compute_metrics_columns(covid_data):
+    result = metrics.compute_metrics(covid_data)
+
+    assert list(result.columns) == ["date"] + metrics.metric_columns()
+    assert len(result) == 30
+    assert result.loc[0, "date"] == "2020-03-01"
+
+
+def test_compute_metrics_rolling_means(covid_data):
+    result = metrics.compute_metrics(covid_data)
+
+    assert result["deaths-diff-avg7"].iloc[:6].isna().all()
+    assert result.loc[6, "deaths-diff-avg7"] == round(6 / 7, metrics.METRIC_DECIMALS)
+    assert result.loc[20, "deaths-diff-avg7"] == 1
+    assert result.loc[20, "deaths-diff-avg14"] == 1
+    assert result.loc[20, "deaths-growth-wow"] == 0
+
+
+def test_compute_metrics_doubling_days(covid_data):
+    result = metrics.compute_metrics(covid_data)
+
+    # Cases double every 7 days, up to rounding of the counts
+    assert result["cases-doubling-days"].iloc[:7].isna().all()
+    assert result.loc[29, "cases-doubling-days"] == pytest.approx(7, abs=0.1)
+    assert result.loc[29, "cases-growth-wow"] == pytest.approx(1, abs=0.1)
+    assert result["recoveries-doubling-days"].isna().all()
+
+
+def test_compute_metrics_missing_day():
+    result = metrics.compute_metrics(make_covid_data([i for i in range(30) if i != 15]))
+
+    assert len(result) == 29
+    assert result.loc[result["date"] == "2020-03-22", "deaths-diff-avg7"].isna().all()
+    assert result.loc[result["date"] == "2020-03-24", "deaths-diff-avg7"].notna().all()
+
+
+def test_compute_metrics_incremental_matches_full(covid_data):
+    prev_metrics = metrics.compute_metrics(covid_data.iloc[:25].copy())
+
+    covid_data.loc[23, "cases"] += 5
+    covid_data = transform_data.add_new_fields(covid_data[transform_data.COUNT_COLUMNS + ["date"]])
+    changed_records = ["2020-03-24", "2020-03-26", "2020-03-27", "2020-03-28", "2020-03-29", "2020-03-30"]
+
+    incremental = metrics.compute_metrics(covid_data, prev_metrics, changed_records)
+    full = metrics.compute_metrics(covid_data)
+
+    pd.testing.assert_frame_equal(incremental, full)
+
+
+def test_compute_metrics_stale_previous_metrics(covid_data):
+    prev_metrics = metrics.compute_metrics(covid_data.iloc[5:20].copy())
+
+    result = metrics.compute_metrics(covid_data, prev_metrics, ["2020-03-30"])
+
+    pd.testing.assert_frame_equal(result, metrics.compute_metrics(covid_data))
+
+
+def test_compute_metrics_no_changes(covid_data):
+    prev_metrics = metrics.compute_metrics(covid_data)
+
+    assert metrics.compute_metrics(covid_data, prev_metrics, []) is prev_metrics
+
+
+def test_compute_metrics_no_changes_removed_date(covid_data):
+    prev_metrics = metrics.compute_metrics(covid_data)
+    covid_data = make_covid_data([i for i in range(30) if i != 15])
+
+    result = metrics.compute_metrics(covid_data, prev_metrics, [])
+
+    pd.testing.assert_frame_equal(result, metrics.compute_metrics(covid_data))
@@ -0,0 +1,72 @@
+import os
+import pandas as pd
+import pytest
+from python_etl import extract_data, load_data
+from python_etl.multipart_upload import MultipartUploadWriter
+
+BUCKET_NAME = "TEST_BUCKET_NAME"
+KEY = "acg-covid-data.csv"
+ENVIRONMENT = "production"
+
+
+class CallRecorder:
+    """Passes calls through to the s3 Client and records the name of each call"""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.s3, name)
+
+
+def test_small_body_uses_put_object(s3):
+    recorder = CallRecorder(s3)
+
+    with MultipartUploadWriter(BUCKET_NAME, KEY, recorder) as upload:
+        upload.write(b"date,cases\n")
+
+    assert recorder.calls == ["put_object"]
+    assert s3.get_object(Bucket=BUCKET_NAME, Key=KEY)["Body"].read() == b"date,cases\n"
+
+
+def test_large_body_uses_multipart_upload(s3):
+    recorder = CallRecorder(s3)
+    part = b"x" * (5 * 1024 * 1024)
+
+    with MultipartUploadWriter(BUCKET_NAME, KEY, recorder, part_bytes=len(part)) as upload:
+        upload.write(part)
+        upload.write(part + b"tail")
+
+    assert recorder.calls.count("upload_part") == 3
+    assert recorder.calls[-1] == "complete_multipart_upload"
+    assert upload.uploaded_bytes == 2 * len(part) + 4
+    assert [part["PartNumber"] for part in upload.parts] == [1, 2, 3]
+
+
+def test_error_aborts_upload(s3):
+    recorder = CallRecorder(s3)
+    part = b"x" * (5 * 1024 * 1024)
+
+    with pytest.raises(ValueError):
+        with MultipartUploadWriter(BUCKET_NAME, KEY, recorder, part_bytes=len(part)) as upload:
+            upload.write(part)
+            raise ValueError("serialization failed")
+
+    assert "abort_multipart_upload" in recorder.calls
+    assert "complete_multipart_upload" not in recorder.calls
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET_NAME)
+
+
+def test_compressed_upload_round_trip(s3):
+    data = pd.read_csv(os.path.join(os.path.dirname(__file__), 'mock_prev_data.csv'))
+
+    load_data.upload_data_to_s3(data, ENVIRONMENT, BUCKET_NAME, KEY, s3, compress=True)
+
+    res = s3.get_object(Bucket=BUCKET_NAME, Key=ENVIRONMENT + '/' + KEY)
+    assert "gzip" in res["ContentEncoding"].split(",")
+    assert res["Body"].read()[:2] == b"\x1f\x8b"
+
+    result = extract_data.read_s3_object(BUCKET_NAME, ENVIRONMENT + '/' + KEY, s3, pd.read_csv)
+    pd.testing.assert_frame_equal(result, data)
@@ -0,0 +1,122 @@
+import datetime
+import pandas as pd
+import pytest
+from botocore.exceptions import ClientError
+from python_etl import load_data, partitions
+
+BUCKET_NAME = "TEST_BUCKET_NAME"
+PREFIX = "production/data"
+
+
+class PutRecorder:
+    """Passes calls through to the s3 Client and records the keys of put_object calls"""
+
+    def __init__(self, s3):
+        self.s3 = s3
+        self.put_keys = []
+
+    def put_object(self, **kwargs):
+        self.put_keys.append(kwargs["Key"])
+        return self.s3.put_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.s3, name)
+
+
+class FailingManifestS3(PutRecorder):
+    """PutRecorder that fails every get_object of the manifest with the given error code"""
+
+    def __init__(self, s3, code):
+        super().__init__(s3)
+        self.code = code
+
+    def get_object(self, **kwargs):
+        if kwargs["Key"].endswith(partitions.MANIFEST_KEY):
+            raise ClientError({"Error": {"Code": self.code}}, "GetObject")
+        return self.s3.get_object(**kwargs)
+
+
+@pytest.fixture()
+def covid_data():
+    dates = [datetime.date(2020, 1, 30) + datetime.timedelta(days=i) for i in range(40)]
+
+    return pd.DataFrame({
+        "date": dates,
+        "cases": range(40),
+        "deaths": [0] * 40,
+        "recoveries": [0] * 40,
+    })
+
+
+def serialize(data):
+    return load_data.snapshot_to_parquet(data, ["cases", "deaths", "recoveries"])
+
+
+def test_partition_names(covid_data):
+    names = partitions.partition_names(covid_data["date"])
+
+    assert list(names.unique()) == ["year=2020/month=01", "year=2020/month=02", "year=2020/month=03"]
+
+
+def test_affected_partitions_include_next_record(covid_data):
+    names = partitions.partition_names(covid_data["date"])
+
+    assert partitions.affected_partitions(covid_data["date"], names, ["2020-02-29"]) == {
+        "year=2020/month=02", "year=2020/month=03"}
+    assert partitions.affected_partitions(covid_data["date"], names, ["2020-03-09"]) == {"year=2020/month=03"}
+
+
+def test_write_partitions_only_changed(covid_data, s3):
+    partitions.write_partitions(covid_data, BUCKET_NAME, PREFIX, [], s3, serialize)
+
+    recorder = PutRecorder(s3)
+    covid_data.loc[35, "cases"] = 100
+    manifest = partitions.write_partitions(covid_data, BUCKET_NAME, PREFIX, ["2020-03-05"], recorder, serialize)
+
+    assert recorder.put_keys == [PREFIX + "/year=2020/month=03/part.parquet", PREFIX + "/manifest.json"]
+    assert manifest["partitions"]["year=2020/month=02"]["rows"] == 29
+
+
+def test_write_partitions_deletes_stale(covid_data, s3):
+    partitions.write_partitions(covid_data, BUCKET_NAME, PREFIX, [], s3, serialize)
+    manifest = partitions.write_partitions(covid_data.iloc[:10], BUCKET_NAME, PREFIX, [], s3, serialize)
+
+    keys = [item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET_NAME)["Contents"]]
+
+    assert list(manifest["partitions"]) == ["year=2020/month=01", "year=2020/month=02"]
+    assert PREFIX + "/year=2020/month=03/part.parquet" not in keys
+
+
+def test_read_partitions(covid_data, s3):
+    assert partitions.read_partitions(BUCKET_NAME, PREFIX, s3, pd.read_parquet) is None
+
+    partitions.write_partitions(covid_data, BUCKET_NAME, PREFIX, [], s3, serialize)
+    data = partitions.read_partitions(BUCKET_NAME, PREFIX, s3, pd.read_parquet, workers=2)
+
+    assert len(data) == 40
+    assert list(data["date"].iloc[[0, -1]]) == ["2020-01-30", "2020-03-09"]
+    assert "fingerprint" in data.columns
+
+
+def test_read_manifest_error_is_raised(covid_data, s3):
+    partitions.write_partitions(covid_data, BUCKET_NAME, PREFIX, [], s3, serialize)
+    failing = FailingManifestS3(s3, "AccessDenied")
+
+    with pytest.raises(ClientError):
+        partitions.read_manifest(BUCKET_NAME, PREFIX, failing)
+
+    with pytest.raises(ClientError):
+        partitions.write_partitions(covid_data.iloc[:10], BUCKET_NAME, PREFIX, [], failing, serialize)
+
+    assert failing.put_keys == []
+    assert partitions.read_manifest(BUCKET_NAME, PREFIX, FailingManifestS3(s3, "NoSuchKey")) is None
+
+
+def test_load_data_partitions_keep_snapshot(covid_data, s3):
+    load_data.load_data("production", BUCKET_NAME, "acg-covid-data.csv", "CHANGE_LOG.csv", covid_data, [], [], s3,
+                        partition_prefix="data")
+
+    keys = [item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET_NAME)["Contents"]]
+
+    assert "production/acg-covid-data.parquet" in keys
+    assert PREFIX + "/manifest.json" in keys
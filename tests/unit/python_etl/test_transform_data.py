@@ -1,8 +1,36 @@
 import datetime
+import io
 import json
+import math
+import numpy as np
 import pandas as pd
 import pytest
-from python_etl import transform_data
+from python_etl import load_data, transform_data
+
+
+@pytest.fixture(params=["pandas", "arrow"])
+def engine_name(request):
+    if request.param == "arrow":
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+@pytest.fixture()
+def engine(engine_name):
+    return transform_data.get_engine(engine_name)
+
+
+def engine_data(engine, data):
+    return data if engine is transform_data else engine.as_table(data)
+
+
+def to_frame(data):
+    return data if isinstance(data, pd.DataFrame) else data.to_pandas()
+
+
+def test_get_engine_invalid():
+    with pytest.raises(ValueError):
+        transform_data.get_engine("spark")
 
 
 @pytest.fixture()
@@ -21,13 +49,13 @@ def base_jh_data():
     return pd.DataFrame(data=base_jh_data_dict)
 
 
-def test_filter_jh_data_column_names(base_jh_data):
-    filtered_data = transform_data.filter_jh_data(base_jh_data)
+def test_filter_jh_data_column_names(base_jh_data, engine):
+    filtered_data = to_frame(engine.filter_jh_data(engine_data(engine, base_jh_data)))
     assert list(filtered_data.columns) == ["Date", "Recovered"]
 
 
-def test_filter_jh_data_row_count(base_jh_data):
-    filtered_data = transform_data.filter_jh_data(base_jh_data)
+def test_filter_jh_data_row_count(base_jh_data, engine):
+    filtered_data = to_frame(engine.filter_jh_data(engine_data(engine, base_jh_data)))
     assert len(filtered_data) == 3
 
 
@@ -70,9 +98,9 @@ test_cases = [
 
 
 @pytest.mark.parametrize("body", test_cases)
-def test_filter_jh_data_negative(body, neg_jh_data):
+def test_filter_jh_data_negative(body, neg_jh_data, engine):
     with pytest.raises(Exception):
-        filtered_data = transform_data.filter_jh_data(neg_jh_data[body])
+        filtered_data = engine.filter_jh_data(engine_data(engine, neg_jh_data[body]))
 
 
 @pytest.fixture()
@@ -96,19 +124,38 @@ def filtered_jh_data():
     return pd.DataFrame(data=filtered_base_jh_data)
 
 
-def test_merge_data_column_names(base_nyt_data, filtered_jh_data):
-    merged_data = transform_data.merge_data(base_nyt_data, filtered_jh_data)
+def test_merge_data_column_names(base_nyt_data, filtered_jh_data, engine):
+    merged_data = to_frame(engine.merge_data(
+        engine_data(engine, base_nyt_data), engine_data(engine, filtered_jh_data)))
 
     assert list(merged_data.columns) == [
         "date", "cases", "deaths", "recoveries"]
 
 
-def test_merge_data_row_count(base_nyt_data, filtered_jh_data):
-    merged_data = transform_data.merge_data(base_nyt_data, filtered_jh_data)
+def test_merge_data_row_count(base_nyt_data, filtered_jh_data, engine):
+    merged_data = to_frame(engine.merge_data(
+        engine_data(engine, base_nyt_data), engine_data(engine, filtered_jh_data)))
 
     assert len(merged_data) == 2
 
 
+def test_merge_data_reports_missing_dates(base_nyt_data, filtered_jh_data, engine, caplog):
+    engine.merge_data(engine_data(engine, base_nyt_data), engine_data(engine, filtered_jh_data))
+
+    records = [record for record in caplog.records if record.getMessage().startswith("Dates missing")]
+    assert records[0].data == {"Johns Hopkins": {"count": 1, "ranges": [["2020-01-22", "2020-01-22"]]}}
+
+
+def test_merge_data_unsorted_source(base_nyt_data, filtered_jh_data, engine):
+    base_nyt_data = base_nyt_data.iloc[::-1].reset_index(drop=True)
+
+    merged_data = to_frame(engine.merge_data(
+        engine_data(engine, base_nyt_data), engine_data(engine, filtered_jh_data)))
+
+    assert list(merged_data["date"]) == ["2020-01-23", "2020-01-24"]
+    assert list(merged_data["cases"]) == [0, 1]
+
+
 @pytest.fixture()
 def neg_filtered_jh_data():
     negative_filtered_base_jh_data = {
@@ -119,10 +166,10 @@ def neg_filtered_jh_data():
     return pd.DataFrame(data=negative_filtered_base_jh_data)
 
 
-def test_merge_data_negative(base_nyt_data, neg_filtered_jh_data):
+def test_merge_data_negative(base_nyt_data, neg_filtered_jh_data, engine):
     with pytest.raises(Exception):
-        merged_data = transform_data.merge_data(
-            base_nyt_data, neg_filtered_jh_data)
+        merged_data = engine.merge_data(
+            engine_data(engine, base_nyt_data), engine_data(engine, neg_filtered_jh_data))
 
 
 @pytest.fixture()
@@ -137,8 +184,8 @@ def base_merged_data():
     return pd.DataFrame(data=base_merged_data_dict)
 
 
-def test_data_validity(base_merged_data):
-    processed_data = transform_data.check_count_validity(base_merged_data)
+def test_data_validity(base_merged_data, engine):
+    processed_data = to_frame(engine.check_count_validity(engine_data(engine, base_merged_data)))
 
     assert processed_data.loc[1, "recoveries"] == 1
 
@@ -173,10 +220,27 @@ test_cases = [
 
 
 @pytest.mark.parametrize("body", test_cases)
-def test_data_validity_negative(body, neg_merged_data):
+def test_data_validity_negative(body, neg_merged_data, engine):
     with pytest.raises(Exception):
-        processed_data = transform_data.check_count_validity(
-            neg_merged_data[body])
+        processed_data = engine.check_count_validity(
+            engine_data(engine, neg_merged_data[body]))
+
+
+def test_validate_counts_report(neg_merged_data):
+    counts, report = transform_data.validate_counts(neg_merged_data["negative_merged_data_2"])
+
+    assert report == {
+        "deaths": {
+            "non_numeric": [],
+            "negative": [{"row": 1, "date": "2020-01-24", "value": "-1"}]
+        }
+    }
+
+
+def test_validate_counts_no_report(base_merged_data):
+    counts, report = transform_data.validate_counts(base_merged_data)
+
+    assert report == {}
 
 
 @pytest.fixture()
@@ -200,11 +264,11 @@ def prev_data():
 
 
 @pytest.fixture
-def transform_output(base_nyt_data, base_jh_data, prev_data):
+def transform_output(base_nyt_data, base_jh_data, prev_data, engine_name):
     output = {}
 
     covid_data, new_records, updated_records = transform_data.transform_data(
-        base_nyt_data, base_jh_data, None)
+        base_nyt_data, base_jh_data, None, engine=engine_name)
 
     output["no_prev_data"] = {
         "covid_data": covid_data,
@@ -213,7 +277,7 @@ def transform_output(base_nyt_data, base_jh_data, prev_data):
     }
 
     covid_data, new_records, updated_records = transform_data.transform_data(
-        base_nyt_data, base_jh_data, prev_data)
+        base_nyt_data, base_jh_data, prev_data, engine=engine_name)
 
     output["with_prev_data"] = {
         "covid_data": covid_data,
@@ -260,3 +324,230 @@ def test_transform_data_new_record_count_prev_data(transform_output):
 
 def test_transform_data_updated_record_count_prev_data(transform_output):
     assert len(transform_output["with_prev_data"]["updated_records"]) == 1
+
+
+def test_get_changed_records_reports_removed_dates(engine, caplog):
+    covid_data = pd.DataFrame({
+        "date": ["2020-01-23", "2020-01-24"],
+        "cases": [0, 1],
+        "deaths": [0, 0],
+        "recoveries": [0, 1]
+    })
+    prev_data = pd.DataFrame({
+        "date": ["2020-01-22", "2020-01-23"],
+        "cases": [0, 0],
+        "deaths": [0, 0],
+        "recoveries": [0, 0]
+    })
+
+    new_records, updated_records = engine.get_changed_records(
+        engine_data(engine, covid_data), engine_data(engine, prev_data))
+
+    assert new_records == ["2020-01-24"]
+    assert updated_records == []
+    records = [record for record in caplog.records if record.getMessage().startswith("Dates of the previous data")]
+    assert records[0].data == {"Previous data": {"count": 1, "ranges": [["2020-01-22", "2020-01-22"]]}}
+
+
+def test_add_new_fields_derived_values(engine):
+    covid_data = pd.DataFrame({
+        "date": [datetime.date(2020, 1, 31), datetime.date(2020, 2, 1), datetime.date(2020, 2, 3)],
+        "cases": [0, 1, 4],
+        "deaths": [0, 0, 0],
+        "recoveries": [1, 1, 2]
+    })
+
+    covid_data = to_frame(engine.add_new_fields(engine_data(engine, covid_data)))
+
+    assert list(covid_data["date-diff"]) == [0, 1, 2]
+    assert list(covid_data["month"]) == ["January", "February", "February"]
+    assert list(covid_data["day_of_week"]) == ["Friday", "Saturday", "Monday"]
+    assert list(covid_data["cases-diff"]) == [0, 1, 3]
+    assert covid_data.loc[2, "cases-log"] == math.log(4)
+    assert covid_data["deaths-log"].dtype == "int64"
+    assert covid_data.to_csv(index=False).splitlines()[1] == "2020-01-31,0,0,1,0,January,Friday,0,0.0,0,0,0,0.0"
+
+
+def per_row_add_new_fields(covid_data):
+    """Per-row implementation of add_new_fields that the vectorized version replaced"""
+
+    day_of_week_dict = {0: "Monday", 1: "Tuesday", 2: "Wednesday", 3: "Thursday", 4: "Friday", 5: "Saturday", 6: "Sunday"}
+    month_dict = {1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 6: "June", 7: "July",
+                  8: "August", 9: "September", 10: "October", 11: "November", 12: "December"}
+
+    covid_data["date-diff"] = covid_data["date"].diff()
+    covid_data.loc[0, "date-diff"] = pd.Timedelta(value=0, unit="days")
+    covid_data["date-diff"] = covid_data["date-diff"].apply(lambda x: x.days)
+
+    covid_data["month"] = covid_data["date"].apply(lambda x: month_dict[x.month])
+    covid_data["day_of_week"] = covid_data["date"].apply(lambda x: day_of_week_dict[x.weekday()])
+
+    for col in ["cases", "deaths", "recoveries"]:
+        covid_data[f"{col}-diff"] = covid_data[col].diff()
+        covid_data.loc[0, f"{col}-diff"] = 0
+        covid_data[f"{col}-diff"] = covid_data[f"{col}-diff"].apply(int)
+        covid_data[f"{col}-log"] = covid_data[col].apply(lambda x: math.log(x) if x > 0 else 0)
+
+    return covid_data
+
+
+def test_add_new_fields_matches_per_row_csv():
+    rng = np.random.default_rng(0)
+    # np.log and math.log only disagree on a few values in tens of thousands, e.g. cases in row 28257 of this data
+    days = 50000
+
+    covid_data = pd.DataFrame({
+        "date": [datetime.date(2020, 1, 21) + datetime.timedelta(days=i % 3650) for i in range(days)],
+        "cases": np.cumsum(rng.integers(0, 100000, days)),
+        "deaths": np.cumsum(rng.integers(0, 3000, days)),
+        "recoveries": np.concatenate([np.zeros(40, dtype="int64"), np.cumsum(rng.integers(0, 50000, days - 40))]),
+    })
+
+    expected = per_row_add_new_fields(covid_data.copy()).to_csv(index=False)
+
+    assert transform_data.add_new_fields(covid_data.copy()).to_csv(index=False) == expected
+
+
+def snapshot_round_trip(data):
+    return pd.read_parquet(io.BytesIO(load_data.snapshot_to_parquet(data, ["cases", "deaths", "recoveries"])))
+
+
+@pytest.fixture()
+def incremental_inputs():
+    nyt_data = pd.DataFrame({
+        "date": ["2020-01-22", "2020-01-23", "2020-01-24", "2020-01-25"],
+        "cases": [1, 2, 5, 9],
+        "deaths": [0, 0, 1, 1]
+    })
+
+    jh_data = pd.DataFrame({
+        "Date": ["2020-01-22", "2020-01-23", "2020-01-24", "2020-01-25"],
+        "Country/Region": ["US", "US", "US", "US"],
+        "Recovered": [0, 0, 1, 2]
+    })
+
+    prev_data = snapshot_round_trip(transform_data.transform_data(nyt_data.iloc[:3], jh_data.iloc[:3], None)[0])
+
+    # 2020-01-24 is revised and 2020-01-25 is new
+    nyt_data.loc[2, "cases"] = 6
+
+    return nyt_data, jh_data, prev_data
+
+
+def test_transform_data_incremental_matches_full(incremental_inputs):
+    nyt_data, jh_data, prev_data = incremental_inputs
+
+    full = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), prev_data.copy(), mode="full")
+    incremental = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), prev_data.copy(), mode="incremental")
+
+    assert incremental[0].to_csv(index=False) == full[0].to_csv(index=False)
+    assert incremental[1:] == full[1:]
+
+
+def test_transform_data_incremental_csv_prev_data():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2020-01-22", periods=3000).strftime("%Y-%m-%d")
+    counts = rng.integers(0, 1000, size=(3000, 3)).cumsum(axis=0)
+
+    nyt_data = pd.DataFrame({"date": dates, "cases": counts[:, 0], "deaths": counts[:, 1]})
+    jh_data = pd.DataFrame({"Date": dates, "Country/Region": "US", "Recovered": counts[:, 2]})
+
+    prev_output = transform_data.transform_data(nyt_data.iloc[:-1].copy(), jh_data.iloc[:-1].copy(), None)[0]
+    csv_prev_data = pd.read_csv(io.StringIO(prev_output.to_csv(index=False)))
+
+    full = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), csv_prev_data.copy(), mode="full")
+    incremental = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), csv_prev_data.copy(), mode="incremental")
+
+    assert incremental[0].to_csv(index=False) == full[0].to_csv(index=False)
+
+
+def test_transform_data_verify_mode(incremental_inputs, caplog):
+    nyt_data, jh_data, prev_data = incremental_inputs
+
+    transform_data.transform_data(nyt_data, jh_data, prev_data, mode="verify")
+
+    assert "Incremental derived fields match full computation" in caplog.text
+
+
+def test_transform_data_engines_match(incremental_inputs):
+    pytest.importorskip("pyarrow")
+    nyt_data, jh_data, prev_data = incremental_inputs
+
+    pandas_output = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), prev_data.copy(), engine="pandas")
+    arrow_output = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), prev_data.copy(), engine="arrow")
+
+    pd.testing.assert_frame_equal(arrow_output[0], pandas_output[0])
+    assert arrow_output[1:] == pandas_output[1:]
+
+
+def test_transform_data_engines_match_csv():
+    pytest.importorskip("pyarrow")
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2020-01-22", periods=3000).strftime("%Y-%m-%d")
+    counts = rng.integers(0, 1000, size=(3000, 3)).cumsum(axis=0)
+
+    nyt_data = pd.DataFrame({"date": dates, "cases": counts[:, 0], "deaths": counts[:, 1]})
+    jh_data = pd.DataFrame({"Date": dates, "Country/Region": "US", "Recovered": counts[:, 2]})
+
+    pandas_output = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), None, engine="pandas")
+    arrow_output = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), None, engine="arrow")
+
+    assert arrow_output[0].to_csv(index=False) == pandas_output[0].to_csv(index=False)
+
+
+def test_get_changed_records_engines_use_stored_fingerprints(incremental_inputs):
+    pytest.importorskip("pyarrow")
+    nyt_data, jh_data, prev_data = incremental_inputs
+
+    # A stored fingerprint that no longer matches the stored counts marks the record as updated in both engines
+    prev_data.loc[0, "fingerprint"] += 1
+
+    pandas_output = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), prev_data.copy(), engine="pandas")
+    arrow_output = transform_data.transform_data(nyt_data.copy(), jh_data.copy(), prev_data.copy(), engine="arrow")
+
+    assert arrow_output[1:] == pandas_output[1:]
+    assert "2020-01-22" in pandas_output[2]
+
+
+def test_transform_data_compact_schema(base_nyt_data, base_jh_data):
+    covid_data = transform_data.transform_data(base_nyt_data, base_jh_data, None, compact=True)[0]
+
+    assert pd.api.types.is_datetime64_dtype(covid_data["date"])
+    assert str(covid_data["month"].dtype) == "category"
+    assert covid_data["cases"].dtype == "int8"
+    assert covid_data["cases-log"].dtype == "float32"
+    assert list(covid_data.columns) == transform_data.OUTPUT_COLUMNS
+
+
+@pytest.fixture()
+def states_data():
+    return pd.DataFrame({
+        "date": ["2020-03-01", "2020-03-01", "2020-03-02", "2020-03-02", "2020-03-03"],
+        "state": ["Washington", "New York", "Washington", "New York", "Washington"],
+        "fips": ["53", "36", "53", "36", "53"],
+        "cases": [10, 1, 15, 3, 22],
+        "deaths": [1, 0, 2, 0, 2]
+    })
+
+
+def test_transform_state_data_diffs_per_state(states_data):
+    transformed_data, new_records, updated_records = transform_data.transform_state_data(states_data, None)
+
+    washington = transformed_data[transformed_data["state"] == "Washington"]
+    new_york = transformed_data[transformed_data["state"] == "New York"]
+
+    assert list(washington["cases-diff"]) == [0, 5, 7]
+    assert list(new_york["cases-diff"]) == [0, 2]
+    assert len(new_records) == 5 and len(updated_records) == 0
+
+
+def test_transform_state_data_changed_records(states_data):
+    prev_data = transform_data.transform_state_data(states_data.iloc[:4].copy(), None)[0]
+    prev_data["date"] = prev_data["date"].astype(str)
+
+    states_data.loc[3, "cases"] = 4
+
+    transformed_data, new_records, updated_records = transform_data.transform_state_data(states_data, prev_data)
+
+    assert new_records == [("Washington", "2020-03-03")]
+    assert updated_records == [("New York", "2020-03-02")]
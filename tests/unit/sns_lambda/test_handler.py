@@ -65,6 +65,19 @@ def test_create_message_failure(params, mock_aws_environment):
     assert err_msg == ""
 
 
+def test_create_message_no_change(mock_aws_environment):
+
+    params = {
+        "Status": "No Change",
+        "New Records": "0",
+        "Updated Records": "0"
+    }
+
+    message, subject = mock_aws_environment.create_message(params, "Success", "production")
+
+    assert subject == "COVID-19 ETL Process Successful, No Data Changes"
+
+
 @pytest.fixture
 def sns_lambda_event():
     return {